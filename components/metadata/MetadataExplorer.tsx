@@ -4,13 +4,16 @@ import { DataLibrarian } from "@/lib/head_librarian";
 import { DataLibrarian as Types } from "@/types/library";
 import { useEffect, useState, useRef } from "react";
 import { useSearchParams } from "next/navigation";
-import MetadataPanel from "./MetadataPanel";
+import MetadataPanel, { MetadataRecord } from "./MetadataPanel";
 
 const SUPPORTED_EXTS = new Set([
     'epub', 'mobi', 'azw3', 'pdf', 'djvu', 'cbz', 'cbr',
     'doc', 'docx', 'odt', 'rtf', 'txt',
 ]);
 
+// Files per /api/metadata/get_many request (the server's METADATA_BATCH_MAX)
+const METADATA_PAGE = 50;
+
 function isSupportedFile(name: string): boolean {
     const ext = name.split('.').pop()?.toLowerCase() ?? '';
     return SUPPORTED_EXTS.has(ext);
@@ -47,13 +50,21 @@ export default function MetadataExplorer() {
     const [selectedFile, setSelectedFile] = useState<Types.CatalogCard | null>(null);
     const [search, setSearch] = useState("");
     const [showDirsInList, setShowDirsInList] = useState(false);
+    const [records, setRecords] = useState<Record<string, MetadataRecord>>({});
     const didDeepLink = useRef(false);
+    const metadataRequest = useRef<AbortController | null>(null);
 
     // Load directory listing
     useEffect(() => {
         loadDirectory(currentPath);
     }, [currentPath]);
 
+    // Read metadata for the listing, a page of files per request
+    useEffect(() => {
+        loadMetadata(allItems.filter(item => item.type === 'file' && isSupportedFile(item.name)));
+        return () => metadataRequest.current?.abort();
+    }, [allItems]);
+
     // Deep-link: if ?file=path was passed (from Library "Edit Metadata"), select that file
     useEffect(() => {
         if (initialFile && !didDeepLink.current && allItems.length > 0) {
@@ -88,6 +99,47 @@ export default function MetadataExplorer() {
         }
     };
 
+    // Records arrive as newline-delimited JSON, one per file, in listing order.
+    // Pages go one at a time, so leaving the directory stops after the current page.
+    const loadMetadata = async (files: Types.CatalogCard[]) => {
+        metadataRequest.current?.abort();
+        setRecords({});
+        if (files.length === 0) return;
+        const controller = new AbortController();
+        metadataRequest.current = controller;
+        try {
+            for (let start = 0; start < files.length && !controller.signal.aborted; start += METADATA_PAGE) {
+                const page = files.slice(start, start + METADATA_PAGE);
+                const res = await fetch("http://localhost:2226/api/metadata/get_many", {
+                    method: "POST",
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({ paths: page.map(f => f.path) }),
+                    signal: controller.signal,
+                });
+                if (!res.body) return;
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffered = "";
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffered += decoder.decode(value, { stream: true });
+                    const lines = buffered.split("\n");
+                    buffered = lines.pop() ?? "";
+                    const arrived: Record<string, MetadataRecord> = {};
+                    for (const line of lines) {
+                        if (!line.trim()) continue;
+                        const record = JSON.parse(line);
+                        if (record.xmp) arrived[record.path] = record;
+                    }
+                    setRecords(prev => ({ ...prev, ...arrived }));
+                }
+            }
+        } catch {
+            // Aborted or backend unavailable: the panel falls back to per-file reads
+        }
+    };
+
     const handleNavigate = (path: string) => {
         setCurrentPath(path);
         setSelectedFile(null);
@@ -214,6 +266,12 @@ export default function MetadataExplorer() {
                             <i className={`${fileIcon(item.name)} mt-0.5 text-sm shrink-0`}></i>
                             <div className="min-w-0">
                                 <p className="text-xs font-mono text-[var(--text-main)] truncate">{item.name}</p>
+                                {records[item.path]?.xmp.title && (
+                                    <p className="text-[10px] font-mono text-[var(--text-muted)] truncate mt-0.5">
+                                        {records[item.path].xmp.title}
+                                        {records[item.path].xmp.creator && ` · ${records[item.path].xmp.creator}`}
+                                    </p>
+                                )}
                                 {item.size && (
                                     <p className="text-[10px] font-mono text-[var(--text-muted)] mt-0.5">{item.size}</p>
                                 )}
@@ -231,7 +289,11 @@ export default function MetadataExplorer() {
 
             {/* Right panel — metadata detail/editor */}
             <div className="flex-1 bg-[var(--bg-card)] overflow-hidden">
-                <MetadataPanel file={selectedFile} />
+                <MetadataPanel
+                    file={selectedFile}
+                    record={selectedFile ? records[selectedFile.path] : undefined}
+                    onSaved={saved => setRecords(prev => ({ ...prev, [saved.path]: saved }))}
+                />
             </div>
         </div>
     );
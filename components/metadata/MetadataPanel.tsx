@@ -15,7 +15,7 @@ interface XmpMetadata {
     series_number: string;
 }
 
-interface MetadataRecord {
+export interface MetadataRecord {
     path: string;
     filename: string;
     size: number;
@@ -25,6 +25,9 @@ interface MetadataRecord {
 
 interface MetadataPanelProps {
     file: Types.CatalogCard | null;
+    // Already fetched by the explorer's batch read; skips the single-file request
+    record?: MetadataRecord;
+    onSaved?: (record: MetadataRecord) => void;
 }
 
 const EMPTY_XMP: XmpMetadata = {
@@ -46,7 +49,7 @@ function formatBytes(n: number): string {
     return `${n} B`;
 }
 
-export default function MetadataPanel({ file }: MetadataPanelProps) {
+export default function MetadataPanel({ file, record, onSaved }: MetadataPanelProps) {
     const [meta, setMeta] = useState<MetadataRecord | null>(null);
     const [editing, setEditing] = useState(false);
     const [draft, setDraft] = useState<XmpMetadata>(EMPTY_XMP);
@@ -61,9 +64,14 @@ export default function MetadataPanel({ file }: MetadataPanelProps) {
             setEditing(false);
             return;
         }
-        setLoading(true);
         setEditing(false);
         setSaveStatus('idle');
+        if (record) {
+            setMeta(record);
+            setDraft(record.xmp ?? EMPTY_XMP);
+            return;
+        }
+        setLoading(true);
         fetch("http://localhost:2226/api/metadata/get", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
@@ -102,6 +110,7 @@ export default function MetadataPanel({ file }: MetadataPanelProps) {
             });
             const data = await res.json();
             if (data.success) {
+                if (meta) onSaved?.({ ...meta, xmp: { ...draft } });
                 setMeta(prev => prev ? { ...prev, xmp: { ...draft } } : null);
                 setEditing(false);
                 setSaveStatus('saved');
@@ -0,0 +1,92 @@
+"""
+bench_dedupe.py — End-to-end benchmark for deDupe's out-of-core mode.
+Builds a synthetic library of small files (every 10th a copy of the one
+before it, so about 10% belong to a duplicate group) and runs a dry-run
+run_dedupe over it in memory and out of core, each in a fresh subprocess
+with its own persistent index: once cold (every file hashed) and once warm
+(every file answered by the index). Reports wall time and peak RSS.
+
+The whole run is measured — walk, index preload, size buckets, hashing,
+grouping and the summary — so a mode whose memory grows with the file
+count shows up here, not just in the grouping stage.
+
+The default is 200,000 files rather than the 2,000,000 synthetic records
+the grouping benchmark used: these are real files, and building 2M of
+them takes tens of minutes and as many inodes before anything is
+measured. Pass 2000000 to run at that size.
+Run: python3 bench_dedupe.py [files]   (default 200,000)
+"""
+
+import sys
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+MODES = ('memory', 'out-of-core')
+PER_FOLDER = 1000
+
+
+def build_library(library, count):
+    """count small files, PER_FOLDER per folder; every 10th repeats the previous file."""
+    for i in range(count):
+        folder = os.path.join(library, f'Author {i // PER_FOLDER}')
+        if i % PER_FOLDER == 0:
+            os.makedirs(folder)
+        n = i - 1 if i % 10 == 9 else i
+        with open(os.path.join(folder, f'Book {i}.pdf'), 'w') as f:
+            f.write(f'book {n}\n' * (1 + n % 50))
+
+
+def run_mode(mode, library, state):
+    """One dry run over library with its index under state; returns (summary, seconds)."""
+    import config
+    import dedupe_checkpoint
+    import library_index as idx
+    from dedupe import run_dedupe
+
+    idx._INDEX_DIR = os.path.join(state, 'db')
+    idx._INDEX_FILE = os.path.join(idx._INDEX_DIR, 'library_index.db')
+    dedupe_checkpoint.CHECKPOINT_DIR = os.path.join(state, 'checkpoints')
+    config.LIBRARY_MOUNT_PATH = library
+    start = time.perf_counter()
+    summary = run_dedupe(scan_dir=library, out_of_core=(mode == 'out-of-core'))
+    return summary, time.perf_counter() - start
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        summary, seconds = run_mode(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(f"{summary['duplicates_found']} {summary['files_hashed']} "
+              f"{seconds:.2f} {peak_rss_mb():.0f}")
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as tmp:
+        library = os.path.join(tmp, 'library')
+        build_library(library, count)
+        print(f"Dry-run deDupe over {count:,} files ({count // 10:,} duplicates)\n")
+        print(f"{'mode':<12} {'index':<6} {'dupes':>8} {'hashed':>8} "
+              f"{'seconds':>9} {'peak RSS MB':>12}")
+        print('-' * 60)
+        for mode in MODES:
+            state = os.path.join(tmp, mode)
+            for run in ('cold', 'warm'):
+                out = subprocess.run([sys.executable, __file__, '--child', mode, library, state],
+                                     capture_output=True, text=True, check=True).stdout.split()
+                dupes, hashed, seconds, rss = out[-4:]
+                print(f"{mode:<12} {run:<6} {int(dupes):>8,} {int(hashed):>8,} "
+                      f"{seconds:>9} {rss:>12}")
+
+
+if __name__ == '__main__':
+    main()
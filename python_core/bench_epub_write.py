@@ -0,0 +1,112 @@
+"""
+bench_epub_write.py — Benchmark for rewriting an EPUB's OPF.
+Builds an image-heavy synthetic EPUB and replaces its OPF two ways, each in
+a fresh subprocess: the previous writer (every member read into memory,
+then recompressed with zipfile) and zip_rewrite's raw copy (members
+streamed still compressed, only the OPF written anew). Reports wall time
+and peak RSS.
+Run: python3 bench_epub_write.py [size_mb]   (default 200)
+"""
+
+import sys
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from zip_rewrite import replace_member
+
+MODES = ('reencode', 'raw')
+OPF_PATH = 'OEBPS/content.opf'
+CHAPTERS = 200
+
+OPF = ('<?xml version="1.0" encoding="utf-8"?>'
+       '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+       '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+       '<dc:title>{title}</dc:title><dc:creator>Ann Author</dc:creator>'
+       '</metadata></package>')
+
+
+def build_epub(path, size_mb):
+    """An EPUB of about size_mb: one 1 MB image per MB, plus CHAPTERS text files."""
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml',
+                   '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                   f'<rootfiles><rootfile full-path="{OPF_PATH}"/></rootfiles></container>',
+                   zipfile.ZIP_DEFLATED)
+        z.writestr(OPF_PATH, OPF.format(title='Old Title'), zipfile.ZIP_DEFLATED)
+        for i in range(CHAPTERS):
+            z.writestr(f'OEBPS/chapter{i}.xhtml',
+                       f'<p>Chapter {i}. Call me Ishmael.</p>\n' * 2000, zipfile.ZIP_DEFLATED)
+        for i in range(size_mb):
+            z.writestr(f'OEBPS/images/plate{i}.jpg', os.urandom(1024 * 1024),
+                       zipfile.ZIP_DEFLATED)
+
+
+def reencode(src, dst, new_opf):
+    """The writer before zip_rewrite: whole archive in memory, every member recompressed."""
+    with zipfile.ZipFile(src, 'r') as z:
+        other_entries = {
+            name: (z.read(name), z.getinfo(name))
+            for name in z.namelist() if name != OPF_PATH
+        }
+    with zipfile.ZipFile(dst, 'w') as zout:
+        if 'mimetype' in other_entries:
+            data, _ = other_entries.pop('mimetype')
+            zout.writestr(zipfile.ZipInfo('mimetype'), data, zipfile.ZIP_STORED)
+        for name, (data, _) in other_entries.items():
+            zout.writestr(name, data, zipfile.ZIP_DEFLATED)
+        zout.writestr(OPF_PATH, new_opf, zipfile.ZIP_DEFLATED)
+
+
+def raw(src, dst, new_opf):
+    replace_member(src, dst, OPF_PATH, new_opf, first='mimetype')
+
+
+def run_mode(mode, src):
+    """Rewrite src's OPF with one mode; returns (output MB, seconds)."""
+    dst = src + '.out'
+    new_opf = OPF.format(title='New Title').encode()
+    start = time.perf_counter()
+    (reencode if mode == 'reencode' else raw)(src, dst, new_opf)
+    seconds = time.perf_counter() - start
+    return os.path.getsize(dst) / (1024 * 1024), seconds
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        size, seconds = run_mode(sys.argv[2], sys.argv[3])
+        print(f"{size:.0f} {seconds:.2f} {peak_rss_mb():.0f}")
+        return
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'book.epub')
+        build_epub(base, size_mb)
+        print(f"Rewriting the OPF of a {os.path.getsize(base) / (1024 * 1024):.0f} MB EPUB "
+              f"({size_mb} images, {CHAPTERS} chapters)\n")
+        print(f"{'mode':<10} {'out MB':>8} {'seconds':>9} {'peak RSS MB':>12}")
+        print('-' * 42)
+        for mode in MODES:
+            src = os.path.join(tmp, f'{mode}.epub')
+            shutil.copyfile(base, src)
+            out = subprocess.run([sys.executable, __file__, '--child', mode, src],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            size, seconds, rss = out
+            print(f"{mode:<10} {size:>8} {seconds:>9} {rss:>12}")
+
+
+if __name__ == '__main__':
+    main()
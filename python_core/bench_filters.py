@@ -0,0 +1,119 @@
+"""
+bench_filters.py — Benchmark for the compiled include/exclude path filter.
+Part 1 checks every path of a synthetic deep tree against many glob rules,
+once with the old per-rule fnmatch loop and once with path_filter's
+compiled matcher. Part 2 walks a real generated tree with an excluded
+subtree, filtering afterwards (everything listed and stat-ed) versus
+pruning during traversal.
+Run: python3 bench_filters.py [rules] [depth]   (default 200 rules, depth 8)
+"""
+
+import sys
+import os
+import fnmatch
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from path_filter import compile_rules
+from walker import walk_files
+
+FANOUT = 3
+FILES_PER_DIR = 4
+
+
+def make_rules(count):
+    """Half literal names, half globs, none of which match the tree below."""
+    folders = [f'Archive {i}' for i in range(count // 4)] + \
+              [f'tmp_{i}_*' for i in range(count // 4)]
+    files = [f'Thumbs{i}.db' for i in range(count // 4)] + \
+            [f'*.part{i}' for i in range(count // 4)]
+    return {'excluded_folders': folders, 'excluded_files': files}
+
+
+def synthetic_paths(depth):
+    """(dir relpaths, file relpaths) of a FANOUT-ary tree `depth` levels deep."""
+    dirs, files, level = [], [], ['']
+    for _ in range(depth):
+        level = [f'{parent}/d{i}'.lstrip('/') for parent in level for i in range(FANOUT)]
+        dirs += level
+    for d in dirs:
+        files += [f'{d}/book {i}.pdf' for i in range(FILES_PER_DIR)]
+    return dirs, files
+
+
+def naive_check(rules, dirs, files):
+    """The per-rule loop: fnmatch every pattern against every name."""
+    kept = 0
+    for rel in dirs:
+        name = rel.rsplit('/', 1)[-1]
+        if not any(fnmatch.fnmatch(name, p) for p in rules['excluded_folders']):
+            kept += 1
+    for rel in files:
+        name = rel.rsplit('/', 1)[-1]
+        if not any(fnmatch.fnmatch(name, p) for p in rules['excluded_files']):
+            kept += 1
+    return kept
+
+
+def compiled_check(rules, dirs, files):
+    path_filter = compile_rules(rules)
+    kept = 0
+    for rel in dirs:
+        if path_filter.enter_folder(rel.rsplit('/', 1)[-1], rel, True):
+            kept += 1
+    for rel in files:
+        if path_filter.keep_file(rel.rsplit('/', 1)[-1], rel):
+            kept += 1
+    return kept
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def build_tree(tmp, count):
+    """count files in 100-file folders; half of them under skip/."""
+    for i in range(count):
+        top = 'skip' if i % 2 else 'keep'
+        folder = os.path.join(tmp, top, f'd{i // 100}')
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, f'{i}.pdf'), 'wb').close()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rules = make_rules(count)
+    dirs, files = synthetic_paths(depth)
+
+    print(f"Matching {len(dirs) + len(files):,} paths (depth {depth}) "
+          f"against {count} rules\n")
+    print(f"{'matcher':<10} {'kept':>10} {'seconds':>9}")
+    print('-' * 31)
+    for label, fn in (('fnmatch', naive_check), ('compiled', compiled_check)):
+        kept, seconds = timed(lambda: fn(rules, dirs, files))
+        print(f"{label:<10} {kept:>10,} {seconds:>9.2f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_tree(tmp, 20000)
+        print("\nWalking 20,000 files, half of them under an excluded folder\n")
+        print(f"{'mode':<10} {'files':>10} {'seconds':>9}")
+        print('-' * 31)
+        post = compile_rules(rules)
+        pruned = compile_rules(rules, excluded_folders=['skip'])
+        walks = (
+            ('post', lambda: sum(1 for e in walk_files(tmp, path_filter=post)
+                                 if not e.path.startswith(os.path.join(tmp, 'skip', '')))),
+            ('pruned', lambda: sum(1 for _ in walk_files(tmp, path_filter=pruned))),
+        )
+        for label, fn in walks:
+            found, seconds = timed(fn)
+            print(f"{label:<10} {found:>10,} {seconds:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
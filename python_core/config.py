@@ -38,7 +38,20 @@ DEFAULTS = {
     "PORT": 2226,
     "USER_EXCLUDED_FILES": [],
     "PDF_TARGET_CHUNK_MB": 100,
-    "PDF_PAGE_CHUNK_LIMIT": 1000
+    "PDF_PAGE_CHUNK_LIMIT": 1000,
+    "DEDUPE_HASH_WORKERS": 4,
+    "DEDUPE_HASH_ALGORITHM": "sha256",
+    "HASH_BLOCK_SIZE_KB": 1024,
+    "DEDUPE_INCREMENTAL_SCAN": False,
+    "DEDUPE_SPILL_THRESHOLD": 1000000,
+    "DEDUPE_ACTION": "move",
+    "DEDUPE_DIRECTORY_PASS": False,
+    "DEDUPE_VERIFY_ARCHIVE_MD5": True,
+    "DEDUPE_BLOCK_TREE_MIN_MB": 0,
+    "WALK_WORKERS": 8,
+    "IO_BUDGET_MB_PER_SEC": 0,
+    "EXIFTOOL_WORKERS": 2,
+    "METADATA_CACHE_ENTRIES": 5000
 }
 
 # Module-level variables to be exported
@@ -54,6 +67,11 @@ def load_config():
     global EXCLUDED_FOLDERS, DUPLICATE_HOLDING_DIR, LOG_NAME_PREFIX, MOVE_DUPLICATES, PORT
     global USER_EXCLUDED_FILES, EXCLUDED_FILES
     global PDF_TARGET_CHUNK_MB, PDF_PAGE_CHUNK_LIMIT
+    global DEDUPE_HASH_WORKERS, DEDUPE_HASH_ALGORITHM, HASH_BLOCK_SIZE_KB
+    global DEDUPE_INCREMENTAL_SCAN, DEDUPE_SPILL_THRESHOLD, DEDUPE_ACTION
+    global DEDUPE_DIRECTORY_PASS
+    global DEDUPE_VERIFY_ARCHIVE_MD5, DEDUPE_BLOCK_TREE_MIN_MB, WALK_WORKERS
+    global IO_BUDGET_MB_PER_SEC, EXIFTOOL_WORKERS, METADATA_CACHE_ENTRIES
 
     if os.path.exists(CONFIG_FILE):
         try:
@@ -70,6 +88,20 @@ def load_config():
             
             PDF_TARGET_CHUNK_MB = data.get("PDF_TARGET_CHUNK_MB", DEFAULTS["PDF_TARGET_CHUNK_MB"])
             PDF_PAGE_CHUNK_LIMIT = data.get("PDF_PAGE_CHUNK_LIMIT", DEFAULTS["PDF_PAGE_CHUNK_LIMIT"])
+
+            DEDUPE_HASH_WORKERS = data.get("DEDUPE_HASH_WORKERS", DEFAULTS["DEDUPE_HASH_WORKERS"])
+            DEDUPE_HASH_ALGORITHM = data.get("DEDUPE_HASH_ALGORITHM", DEFAULTS["DEDUPE_HASH_ALGORITHM"])
+            HASH_BLOCK_SIZE_KB = data.get("HASH_BLOCK_SIZE_KB", DEFAULTS["HASH_BLOCK_SIZE_KB"])
+            DEDUPE_INCREMENTAL_SCAN = data.get("DEDUPE_INCREMENTAL_SCAN", DEFAULTS["DEDUPE_INCREMENTAL_SCAN"])
+            DEDUPE_SPILL_THRESHOLD = data.get("DEDUPE_SPILL_THRESHOLD", DEFAULTS["DEDUPE_SPILL_THRESHOLD"])
+            DEDUPE_ACTION = data.get("DEDUPE_ACTION", DEFAULTS["DEDUPE_ACTION"])
+            DEDUPE_DIRECTORY_PASS = data.get("DEDUPE_DIRECTORY_PASS", DEFAULTS["DEDUPE_DIRECTORY_PASS"])
+            DEDUPE_VERIFY_ARCHIVE_MD5 = data.get("DEDUPE_VERIFY_ARCHIVE_MD5", DEFAULTS["DEDUPE_VERIFY_ARCHIVE_MD5"])
+            DEDUPE_BLOCK_TREE_MIN_MB = data.get("DEDUPE_BLOCK_TREE_MIN_MB", DEFAULTS["DEDUPE_BLOCK_TREE_MIN_MB"])
+            WALK_WORKERS = data.get("WALK_WORKERS", DEFAULTS["WALK_WORKERS"])
+            IO_BUDGET_MB_PER_SEC = data.get("IO_BUDGET_MB_PER_SEC", DEFAULTS["IO_BUDGET_MB_PER_SEC"])
+            EXIFTOOL_WORKERS = data.get("EXIFTOOL_WORKERS", DEFAULTS["EXIFTOOL_WORKERS"])
+            METADATA_CACHE_ENTRIES = data.get("METADATA_CACHE_ENTRIES", DEFAULTS["METADATA_CACHE_ENTRIES"])
             
             # Combine System and User excludes
             EXCLUDED_FILES = list(SYSTEM_EXCLUDED_FILES.union(set(USER_EXCLUDED_FILES)))
@@ -1,7 +1,7 @@
 """
 dedupe.py — Data Librarian
 ===========================
-SHA-256 duplicate detection with keeper scoring and persistent index support.
+Content-hash duplicate detection with keeper scoring and persistent index support.
 
 Index modes (handled by library_index.py):
   PERSISTENT — scan path is inside LIBRARY_MOUNT_PATH (the NAS).
@@ -10,26 +10,116 @@ Index modes (handled by library_index.py):
   EPHEMERAL  — all other paths (iCloud staging, etc.).
                Hashes are computed fresh each run, nothing is stored.
 
+Hashing stages (cheapest first; each stage only sees what the last one
+could not rule out):
+  1. Size      — a file whose byte size is unique can't have a duplicate.
+  2. Partial   — SHA-256 of the first/last _PARTIAL_EDGE_BYTES of same-size files.
+  3. Full      — hash_file() (SHA-256 or BLAKE2b) on files whose partial
+                 hashes still collide.
+Index cache hits skip stages 2 and 3 entirely.
+
+Archive MD5 check (DEDUPE_VERIFY_ARCHIVE_MD5): stage 3 also computes MD5
+in the same read and stores it in the index. A file whose name carries an
+Anna's Archive ID (32 hex chars) is checked against it — on a full hash, or
+from the stored MD5 on a cache hit — and a mismatch is logged as a corrupt
+or mislabeled download. Files never fully read (unique size) aren't checked.
+
+Block trees (DEDUPE_BLOCK_TREE_MIN_MB): files at least that large are
+hashed with utils.hash_file_tree() instead, and their block digests are
+kept in the index. When such a file only grew since (a metadata edit that
+exiftool appended), its next full hash reads the new tail and a few sample
+blocks instead of the whole file. That digest is provisional — an edit to
+an unsampled old block goes unseen — so it only rules files out: one that
+matches another file's digest is hashed again in full before it is
+grouped, and only full-read digests are stored. Tree digests are recorded
+under their own algorithm label; every file of one size is hashed the same
+way, so they still compare equal exactly when the content does.
+
+Grouping: the walk is streamed into a scratch SQLite store (_ScanStore),
+one row per file; the size buckets, hash candidates and duplicate groups
+are queries over it, and groups are resolved one at a time. Once the walk
+reaches DEDUPE_SPILL_THRESHOLD files the store moves to a temporary file
+on disk, the index stops holding rows in memory, and the summary's
+log_lines keeps only the last _LOG_TAIL lines (progress_callback still
+sees every line) — peak memory then no longer grows with the file count.
+
 Keeper scoring (higher = keep this copy):
   +1 per directory level below the scan root   (deeper = more organised)
   +3 if not a direct child of the scan root
   +5 if filename has no noise patterns          (clean name)
   +1 if extension is in DEDUPE_PREFERRED_EXTENSIONS
 
-Tie-break: shorter absolute path wins.
+Tie-break: shorter absolute path wins, then the lexicographically first.
 Library root always beats intake/secondary root regardless of score.
+Each duplicate group is resolved in one pass (_resolve_group): every
+member is scored once and the best one is kept, so the keeper doesn't
+depend on the order the copies were found in.
+
+Dedupe actions (live runs only, DEDUPE_ACTION):
+  move      — discarded copies go to _DuplicateHoldingBin (default), stored
+              by digest with a manifest (see holding_bin.py).
+  hardlink  — each discarded copy is replaced by a hard link to the keeper.
+  reflink   — each discarded copy is replaced by a copy-on-write clone of
+              the keeper (FICLONE on Linux, clonefile() on macOS).
+Link swaps are atomic: the link is made under a temporary name next to the
+discard, both files are re-hashed, and only then is it renamed over the
+discard. Every path stays valid and the space comes back immediately.
+
+Duplicate directories (DEDUPE_DIRECTORY_PASS): after hashing, every
+directory gets a Merkle digest built from its files' names and digests and
+its subdirectories' digests — no file is read again. Directories with equal
+digests (at least _MIN_DIR_FILES files) are reported as one entry, only the
+topmost of nested matches, and a live 'move' run bins each discarded
+directory in one operation. Their files are left out of the per-file pass.
+The digest only covers files the walk included, so each candidate's
+listing is re-read from disk first: anything below it that the run didn't
+hash (unique size, read error, excluded file or folder, symlink) rules it
+out, and its files are left to the per-file pass.
+
+Checkpoints (dedupe_checkpoint.py): the walk, computed hashes and resolved
+groups are saved alongside each index commit. A run that is cancelled or
+dies keeps its checkpoint; run_dedupe(..., resume=True) continues from it
+instead of starting over. A completed run deletes it.
+
+Intake check (run_dedupe(..., intake_check=True)): only secondary_dir is
+walked and hashed. Its digests are looked up in the persistent index with
+bulk queries, so the library is never listed or read. Library files that
+were never hashed (unique size at the last full scan) can only be matched
+by size; those are reported as unverified and never moved.
 
 Entry point: run_dedupe(scan_dir, secondary_dir, stop_event, progress_callback, ...)
 """
 
+import ctypes
+import errno
+import hashlib
+import itertools
 import os
 import re
 import shutil
+import sqlite3
+import sys
 import threading
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-from utils import calculate_sha256, sanitize_filename
+from file_cleaner import extract_filename_metadata
+from utils import (HASH_ALGORITHMS, calculate_partial_sha256, config_value,
+                   hash_file, hash_file_multi, hash_file_tree, path_key,
+                   tree_algorithm)
+import dedupe_checkpoint
+import holding_bin
+import io_budget
 import library_index as idx
+from path_filter import PathFilter, literal_names, module_filter
+from walker import walk_files
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
 
 # Noise patterns used to score filename cleanliness
 _NOISE_PATTERNS = [
@@ -43,6 +133,27 @@ _NOISE_PATTERNS = [
 # Commit the index to disk every N files hashed
 _COMMIT_EVERY = 200
 
+# Bytes read from each end of a same-size file in the partial-hash stage
+_PARTIAL_EDGE_BYTES = 256 * 1024
+
+# Hashes queued per worker ahead of the consumer (bounded read-ahead)
+_READ_AHEAD_PER_WORKER = 2
+
+# Rows buffered before each executemany() into the scan store
+_SPILL_BATCH = 10000
+
+# log_lines kept in the summary of an out-of-core run
+_LOG_TAIL = 1000
+
+# What a live run does with each discarded copy (see module docstring)
+DEDUPE_ACTIONS = ('move', 'hardlink', 'reflink')
+
+# Smallest directory (files in its whole subtree) reported as a duplicate directory
+_MIN_DIR_FILES = 2
+
+# Linux ioctl request number for FICLONE (fcntl.FICLONE on Python 3.12+)
+_FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
 
 def _is_noisy(filename: str) -> bool:
     """Return True if filename contains Anna's Archive / download noise."""
@@ -82,47 +193,549 @@ def score_file(filepath: str, root: str, preferred_extensions: list) -> int:
     return score
 
 
-def _pick_keeper(path_a: str, root_a: str, path_b: str, root_b: str,
-                 library_root: str, preferred_extensions: list) -> tuple:
+def _resolve_group(group: list, library_root: str,
+                   preferred_extensions: list) -> tuple:
     """
-    Given two copies of the same file, return (keeper_path, discard_path, reason).
-    library_root: the primary/library root — files here always win over intake.
+    Pick the keeper of a whole duplicate group in one pass.
+    group: [(path, root), ...]. Returns (keeper_path, [(discard_path, reason), ...]).
+
+    Each member's features (library membership, score, path length) are
+    computed once; the best member wins regardless of its position.
     """
-    # Library root always beats intake root
-    a_in_library = os.path.abspath(path_a).startswith(os.path.abspath(library_root))
-    b_in_library = os.path.abspath(path_b).startswith(os.path.abspath(library_root))
-
-    if a_in_library and not b_in_library:
-        return path_a, path_b, 'library root wins over intake'
-    if b_in_library and not a_in_library:
-        return path_b, path_a, 'library root wins over intake'
-
-    score_a = score_file(path_a, root_a, preferred_extensions)
-    score_b = score_file(path_b, root_b, preferred_extensions)
-
-    if score_a > score_b:
-        return path_a, path_b, f'score {score_a} vs {score_b}'
-    if score_b > score_a:
-        return path_b, path_a, f'score {score_b} vs {score_a}'
-
-    # Tie-break: shorter absolute path (proxy for "already organised")
-    if len(path_a) <= len(path_b):
-        return path_a, path_b, f'tie-break: shorter path (scores equal at {score_a})'
-    return path_b, path_a, f'tie-break: shorter path (scores equal at {score_b})'
-
-
-def _walk_folder(folder: str, excluded_folders: list,
-                 excluded_files: set) -> list:
-    """Return list of (filepath, root) tuples from folder, respecting exclusions."""
-    results = []
-    abs_folder = os.path.abspath(folder)
-    for root, dirs, files in os.walk(folder):
-        dirs[:] = [d for d in dirs if d not in excluded_folders]
-        for filename in files:
-            if filename in excluded_files:
-                continue
-            results.append((os.path.join(root, filename), abs_folder))
-    return results
+    library_prefix = os.path.join(path_key(library_root), '')
+    features = []
+    for path, root in group:
+        key = path_key(path)
+        in_library = key.startswith(library_prefix)
+        score = score_file(path, root, preferred_extensions)
+        # Sort key: library first, highest score, shortest path, then by name
+        features.append(((not in_library, -score, len(key), key), path))
+
+    keeper_key, keeper = min(features)
+    discards = []
+    for key, path in features:
+        if path == keeper:
+            continue
+        if keeper_key[0] != key[0]:
+            reason = 'library root wins over intake'
+        elif keeper_key[1] != key[1]:
+            reason = f'score {-keeper_key[1]} vs {-key[1]}'
+        elif keeper_key[2] != key[2]:
+            reason = f'tie-break: shorter path (scores equal at {-key[1]})'
+        else:
+            reason = f'tie-break: path order (scores equal at {-key[1]})'
+        discards.append((path, reason))
+    return keeper, discards
+
+
+def _walk_folder(folder: str, path_filter: PathFilter, db_conn=None,
+                 incremental: bool = False):
+    """
+    Yield (filepath, root, st) for every file in folder as the walk reaches
+    it, respecting path_filter. st carries st_size/st_mtime/st_dev/st_ino.
+
+    With a persistent db_conn every directory's listing is recorded in the
+    index. With incremental=True a directory whose mtime is unchanged since
+    its recorded listing isn't listed or stat-ed again; only its
+    subdirectories are checked (one stat each) for changes further down.
+    """
+    cached_listing = record_listing = None
+    if db_conn is not None:
+        def record_listing(dirpath, dir_mtime, files, subdirs):
+            idx.record_listing(db_conn, dirpath, dir_mtime, files, subdirs)
+        if incremental:
+            def cached_listing(dirpath, dir_mtime):
+                return idx.cached_listing(db_conn, dirpath, dir_mtime)
+    return walk_files(folder, path_filter=path_filter,
+                      cached_listing=cached_listing,
+                      record_listing=record_listing)
+
+
+def _filename_md5(path: str) -> str:
+    """Anna's Archive MD5 embedded in the file name (lowercase), or ''."""
+    name = os.path.basename(path)
+    # Cheap pre-check; the full parser runs many patterns
+    if not _NOISE_PATTERNS[0].search(name):
+        return ''
+    return extract_filename_metadata(name)['archive_hash'].lower()
+
+
+def _hash_in_pool(entries: list, hash_fn, workers: int,
+                  stop_event: Optional[threading.Event] = None):
+    """
+    Yield (entry, digest) for each entry, hashing entry['path'] with hash_fn
+    on up to `workers` threads (hashlib releases the GIL during reads and
+    digest updates, so threads overlap NAS latency).
+
+    Results are yielded in input order, so the caller stays the single
+    writer for the index and for progress logging. At most
+    workers * _READ_AHEAD_PER_WORKER hashes are in flight at once. Once
+    stop_event is set no new work is queued; closing the generator cancels
+    anything not yet started and waits for in-flight reads to finish.
+    """
+    if workers <= 1:
+        for entry in entries:
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield entry, hash_fn(entry['path'])
+        return
+
+    window = workers * _READ_AHEAD_PER_WORKER
+    pending = deque()
+    source = iter(entries)
+    executor = ThreadPoolExecutor(max_workers=workers,
+                                  thread_name_prefix='dedupe-hash')
+    try:
+        while True:
+            while len(pending) < window:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                entry = next(source, None)
+                if entry is None:
+                    break
+                pending.append((entry, executor.submit(hash_fn, entry['path'])))
+            if not pending:
+                return
+            entry, future = pending.popleft()
+            yield entry, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _io_order(entries: list) -> list:
+    """
+    entries sorted for read locality: by device, then directory, then
+    inode number. Filesystems allocate a directory's files near each other
+    and roughly in inode order, so the NAS seeks less than in bucket
+    order. Entries without a stat ('st') sort by directory alone.
+    """
+    def key(entry):
+        st = entry.get('st')
+        return (st.st_dev if st is not None else 0,
+                os.path.dirname(entry['path']),
+                st.st_ino if st is not None else 0)
+    return sorted(entries, key=key)
+
+
+class _ScanStore:
+    """
+    Scratch SQLite store of one run's files: a row per walked file with its
+    stat, partial hash and digest, in walk order. The stages after the walk
+    are queries over it, so run_dedupe holds no per-file lists.
+
+    The store starts in memory. spill() moves it to a private temporary
+    database on disk (SQLite deletes the file when the connection closes,
+    or if the process dies); from then on memory use is bounded by SQLite's
+    page cache and _SPILL_BATCH, not by the file count. Writes are buffered
+    and flushed with executemany(). Files come back as entry dicts: seq,
+    path, root, st (CachedStat), size, digest.
+    """
+
+    PARTIAL = 1     # stage: needs a head/tail hash
+    FULL = 2        # stage: needs a full hash
+
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:')
+        self._setup()
+        self.conn.execute("""CREATE TABLE files (
+            seq         INTEGER PRIMARY KEY,
+            path        TEXT    NOT NULL,
+            root        TEXT    NOT NULL,
+            size        INTEGER NOT NULL,
+            mtime       REAL    NOT NULL,
+            dev         INTEGER NOT NULL,
+            ino         INTEGER NOT NULL,
+            digest      TEXT,
+            partial     TEXT,
+            stage       INTEGER NOT NULL DEFAULT 0,
+            provisional INTEGER NOT NULL DEFAULT 0
+        )""")
+        self.conn.execute("""CREATE TABLE dirs (
+            digest  TEXT NOT NULL,
+            path    TEXT NOT NULL,
+            root    TEXT NOT NULL
+        )""")
+        self.buffer = []      # files rows to insert
+        self.buffered = {}    # (dev, ino) -> paths of the rows in buffer
+        self.partials = []    # (partial, seq) updates
+        self.digests = []     # (digest, provisional, seq) updates
+        self.dirs = []        # dirs rows to insert
+        self.spilled = False
+        self.indexes = set()
+
+    def _setup(self) -> None:
+        # Scratch data: no journal, no fsync
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.create_function('dirname', 1, os.path.dirname, deterministic=True)
+
+    def _index(self, name: str, columns: str) -> None:
+        """Create an index the first time a query needs it."""
+        if name not in self.indexes:
+            self.conn.execute(f"CREATE INDEX {name} ON files ({columns})")
+            self.indexes.add(name)
+
+    def spill(self) -> None:
+        """Move the store from memory to a temporary database on disk."""
+        self.flush()
+        disk = sqlite3.connect('')
+        self.conn.backup(disk)
+        self.conn.close()
+        self.conn = disk
+        self._setup()
+        self.spilled = True
+
+    def add(self, path: str, root: str, st, digest: Optional[str]) -> None:
+        self.buffer.append((path, root, st.st_size, st.st_mtime, st.st_dev, st.st_ino, digest))
+        self.buffered.setdefault((st.st_dev, st.st_ino), []).append(path)
+        if len(self.buffer) >= _SPILL_BATCH:
+            self.flush()
+
+    def set_partial(self, seq: int, partial: str) -> None:
+        self.partials.append((partial, seq))
+        if len(self.partials) >= _SPILL_BATCH:
+            self.flush()
+
+    def set_digest(self, seq: int, digest: Optional[str], provisional: bool = False) -> None:
+        self.digests.append((digest, int(provisional), seq))
+        if len(self.digests) >= _SPILL_BATCH:
+            self.flush()
+
+    def add_directory(self, digest: str, path: str, root: str) -> None:
+        self.dirs.append((digest, path, root))
+        if len(self.dirs) >= _SPILL_BATCH:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.conn.executemany(
+                "INSERT INTO files (path, root, size, mtime, dev, ino, digest) "
+                "VALUES (?,?,?,?,?,?,?)", self.buffer)
+            self.buffer = []
+            self.buffered = {}
+        if self.partials:
+            self.conn.executemany("UPDATE files SET partial = ? WHERE seq = ?", self.partials)
+            self.partials = []
+        if self.digests:
+            self.conn.executemany(
+                "UPDATE files SET digest = ?, provisional = ? WHERE seq = ?", self.digests)
+            self.digests = []
+        if self.dirs:
+            self.conn.executemany("INSERT INTO dirs (digest, path, root) VALUES (?,?,?)",
+                                  self.dirs)
+            self.dirs = []
+        self.conn.commit()
+
+    def has_file(self, key: str, dev: int, ino: int) -> bool:
+        """
+        True if this inode was already added under a path with this path_key().
+        Called for every file under a second root, so it doesn't flush:
+        buffered rows are checked in memory, written ones through an index.
+        """
+        if any(path_key(path) == key for path in self.buffered.get((dev, ino), ())):
+            return True
+        self._index('files_inode', 'dev, ino')
+        return any(path_key(path) == key for (path,) in self.conn.execute(
+            "SELECT path FROM files WHERE dev = ? AND ino = ?", (dev, ino)))
+
+    def plan(self, small: int) -> int:
+        """
+        Stage 2: mark every uncached file whose size isn't unique. FULL if a
+        cached file has the same size (it has no partial hash to compare
+        with) or the file is at most `small` bytes, otherwise PARTIAL.
+        Returns the number of uncached files left unmarked (unique size).
+        """
+        self.flush()
+        self._index('files_size', 'size')
+        self.conn.execute("""
+            UPDATE files SET stage = CASE
+                WHEN size <= ? OR size IN (SELECT size FROM files WHERE digest IS NOT NULL)
+                THEN ? ELSE ? END
+            WHERE digest IS NULL
+              AND size IN (SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1)
+        """, (small, self.FULL, self.PARTIAL))
+        self.conn.commit()
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE digest IS NULL AND stage = 0").fetchone()[0]
+
+    def promote_partial_matches(self) -> int:
+        """
+        Stage 3 → 4: files whose (size, partial hash) another file shares
+        need a full hash. Returns the number of files now waiting for one.
+        """
+        self.flush()
+        self.conn.execute("""
+            UPDATE files SET stage = ? WHERE stage = ? AND (size, partial) IN
+                (SELECT size, partial FROM files WHERE stage = ? AND partial IS NOT NULL
+                 GROUP BY size, partial HAVING COUNT(*) > 1)
+        """, (self.FULL, self.PARTIAL, self.PARTIAL))
+        self.conn.commit()
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE stage = ?", (self.FULL,)).fetchone()[0]
+
+    def _entries(self, where: str, params=()):
+        """
+        Entry dicts of the files matching where, in read order: by device,
+        then directory, then inode, as _io_order(). The ORDER BY sorts every
+        match before the first one is returned, so updates made while
+        iterating can't change what is returned.
+        """
+        self.flush()
+        for seq, path, root, size, mtime, dev, ino, digest in self.conn.execute(
+                "SELECT seq, path, root, size, mtime, dev, ino, digest FROM files "
+                f"WHERE {where} ORDER BY dev, dirname(path), ino", params):
+            yield {'seq': seq, 'path': path, 'root': root, 'size': size,
+                   'digest': digest, 'st': idx.CachedStat(size, mtime, dev, ino)}
+
+    def candidates(self, stage: int):
+        """Entries of the files marked with stage (PARTIAL / FULL), in read order."""
+        return self._entries("stage = ?", (stage,))
+
+    def provisional_matches(self):
+        """Entries with a provisional digest that another file shares, in read order."""
+        self._index('files_digest', 'size, digest, seq')
+        return self._entries("provisional = 1 AND (SELECT COUNT(*) FROM files g "
+                             "WHERE g.size = files.size AND g.digest = files.digest) > 1")
+
+    def provisional_count(self) -> int:
+        self.flush()
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE provisional = 1").fetchone()[0]
+
+    def tree_rows(self):
+        """(path, root, digest) of every file, grouped by root and sorted by path."""
+        self.flush()
+        return self.conn.execute("SELECT path, root, digest FROM files ORDER BY root, path")
+
+    def is_hashed(self, path: str) -> bool:
+        """True if path was added and has a digest."""
+        self.flush()
+        self._index('files_path', 'path')
+        return self.conn.execute("SELECT 1 FROM files WHERE path = ? AND digest IS NOT NULL",
+                                 (path,)).fetchone() is not None
+
+    def directory_groups(self):
+        """Yield (digest, [(dirpath, root), ...]) for every digest added more than once."""
+        self.flush()
+        rows = self.conn.execute("""
+            SELECT digest, path, root FROM dirs WHERE digest IN
+                (SELECT digest FROM dirs GROUP BY digest HAVING COUNT(*) > 1)
+            ORDER BY digest, path
+        """)
+        for digest, members in itertools.groupby(rows, key=lambda r: r[0]):
+            yield digest, [(path, root) for _digest, path, root in members]
+
+    def groups(self):
+        """
+        Yield each duplicate group as (size, digest, [(path, root), ...]),
+        smallest file size first, members in walk order. Memory use is
+        bounded by the largest single group, not by the file count.
+        """
+        self.flush()
+        self._index('files_digest', 'size, digest, seq')
+        rows = self.conn.execute("""
+            SELECT f.size, f.digest, f.path, f.root
+            FROM files f
+            JOIN (SELECT size, digest FROM files WHERE digest IS NOT NULL
+                  GROUP BY size, digest HAVING COUNT(*) > 1) d
+              ON f.size = d.size AND f.digest = d.digest
+            ORDER BY f.size, f.digest, f.seq
+        """)
+        for (size, digest), members in itertools.groupby(rows, key=lambda r: (r[0], r[1])):
+            yield size, digest, [(path, root) for _size, _digest, path, root in members]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _reflink(src_path: str, dst_path: str) -> None:
+    """
+    Create dst_path as a copy-on-write clone of src_path.
+    Raises OSError (EOPNOTSUPP, EXDEV, ...) where the filesystem can't clone.
+    """
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src_path), os.fsencode(dst_path), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dst_path)
+        return
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'reflinks are not supported on this platform')
+    with open(src_path, 'rb') as src, open(dst_path, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(dst_path)
+            raise
+
+
+def _link_duplicate(keeper: str, discard: str, action: str, digest: str,
+                    hash_fn, keeper_verified: bool = False) -> str:
+    """
+    Atomically replace discard with a hard link / reflink to keeper.
+    Both files are re-hashed with hash_fn right before the swap and must
+    still match digest (keeper_verified=True skips re-hashing the keeper
+    again for later copies in the same group).
+    Returns '' on success, otherwise why nothing changed.
+    """
+    try:
+        keeper_st = os.stat(keeper)
+        discard_st = os.stat(discard)
+    except OSError as e:
+        return f'cannot stat: {e}'
+    if keeper_st.st_dev != discard_st.st_dev:
+        return 'keeper is on a different filesystem'
+    if (keeper_st.st_dev, keeper_st.st_ino) == (discard_st.st_dev, discard_st.st_ino):
+        return 'already linked'
+
+    tmp_path = os.path.join(os.path.dirname(discard),
+                            f'.{os.path.basename(discard)}.dedupe-{os.getpid()}')
+    try:
+        if action == 'hardlink':
+            os.link(keeper, tmp_path)
+        else:
+            _reflink(keeper, tmp_path)
+    except OSError as e:
+        return f'{action} failed: {e}'
+
+    try:
+        # Either file may have been edited since it was hashed
+        if ((not keeper_verified and hash_fn(keeper) != digest)
+                or hash_fn(discard) != digest):
+            os.remove(tmp_path)
+            return 'content changed since it was hashed'
+        if action == 'reflink':
+            shutil.copystat(discard, tmp_path)
+        os.replace(tmp_path, discard)
+    except OSError as e:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return f'swap failed: {e}'
+    return ''
+
+
+def _inside(path: str, folder: str) -> bool:
+    """True if path is folder or lies below it."""
+    return path == folder or path.startswith(os.path.join(folder, ''))
+
+
+def _directory_hashes(rows):
+    """
+    Merkle digest of every directory holding scanned files.
+    rows: (path, root, digest) of every file, grouped by root and sorted by
+    path, so everything below a directory arrives in one run.
+    Yields (dirpath, digest | None, root, file_count), each directory after
+    its subdirectories; digest is None when any file below it has no
+    digest (unique size, read error). Only digests in rows are used —
+    nothing is read — and only the directories enclosing the current file
+    are held in memory.
+    """
+    stack = []      # open directories, outermost first: [dirpath, lines, count, complete]
+
+    def close(root):
+        dirpath, lines, count, complete = stack.pop()
+        digest = None
+        if complete:
+            digest = hashlib.sha256('\n'.join(sorted(lines)).encode('utf-8')).hexdigest()
+        if stack:
+            parent = stack[-1]
+            # Names hash in NFC form, so a copy made on macOS (NFD) still matches
+            name = unicodedata.normalize('NFC', os.path.basename(dirpath))
+            parent[1].append(f'D\0{name}\0{digest}')
+            parent[2] += count
+            parent[3] = parent[3] and complete
+        return dirpath, digest, root, count
+
+    current_root = None
+    for path, root, digest in rows:
+        if root != current_root:
+            while stack:
+                yield close(current_root)
+            current_root = root
+        dirpath, name = os.path.split(path)
+        while stack and not _inside(dirpath, stack[-1][0]):
+            yield close(root)
+        # Open every directory from the innermost open one (or the scan
+        # root) down to this file's
+        opened = []
+        while not stack or stack[-1][0] != dirpath:
+            opened.append(dirpath)
+            parent = os.path.dirname(dirpath)
+            if dirpath == root or parent == dirpath or (stack and parent == stack[-1][0]):
+                break
+            dirpath = parent
+        stack.extend([d, [], 0, True] for d in reversed(opened))
+        top = stack[-1]
+        top[1].append(f'F\0{unicodedata.normalize("NFC", name)}\0{digest}')
+        top[2] += 1
+        top[3] = top[3] and digest is not None
+    while stack:
+        yield close(current_root)
+
+
+def _listing_complete(dirpath: str, is_hashed, memo: dict) -> bool:
+    """
+    True if everything below dirpath on disk is a regular file for which
+    is_hashed(path) holds, or a directory for which the same holds. Excluded files,
+    pruned folders, unreadable or unhashed files, symlinks and special
+    files all make it False: the tree digest doesn't cover them, so the
+    directory can't be treated as a copy. memo holds answers per directory.
+    """
+    if dirpath in memo:
+        return memo[dirpath]
+    complete = True
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.is_symlink():
+                    complete = False
+                elif entry.is_dir(follow_symlinks=False):
+                    complete = _listing_complete(entry.path, is_hashed, memo)
+                else:
+                    complete = entry.is_file(follow_symlinks=False) and is_hashed(entry.path)
+                if not complete:
+                    break
+    except OSError:
+        complete = False
+    memo[dirpath] = complete
+    return complete
+
+
+def _duplicate_directories(store: _ScanStore) -> list:
+    """
+    Return [(tree digest, [(dirpath, root), ...])] for identical subtrees,
+    topmost matches only (a match inside a matching parent is implied).
+    Scan roots themselves are never reported, nor is a directory holding
+    anything the run didn't hash (see _listing_complete).
+    """
+    for dirpath, digest, root, count in _directory_hashes(store.tree_rows()):
+        if digest is not None and dirpath != root and count >= _MIN_DIR_FILES:
+            store.add_directory(digest, dirpath, root)
+
+    memo = {}
+    groups = {}
+    for digest, members in store.directory_groups():
+        members = [m for m in members if _listing_complete(m[0], store.is_hashed, memo)]
+        if len(members) > 1:
+            groups[digest] = members
+    duplicated = {d for members in groups.values() for d, _root in members}
+    return [(digest, members) for digest, members in groups.items()
+            if not any(os.path.dirname(d) in duplicated for d, _root in members)]
+
+
+def _under_any(path: str, folders: set) -> bool:
+    """True if path lies inside one of folders."""
+    parent = os.path.dirname(path)
+    while True:
+        if parent in folders:
+            return True
+        grandparent = os.path.dirname(parent)
+        if grandparent == parent:
+            return False
+        parent = grandparent
 
 
 def run_dedupe(
@@ -135,19 +748,59 @@ def run_dedupe(
     excluded_files: set = None,
     stop_event: Optional[threading.Event] = None,
     progress_callback=None,
+    hash_workers: Optional[int] = None,
+    hash_algorithm: Optional[str] = None,
+    incremental: Optional[bool] = None,
+    intake_check: bool = False,
+    out_of_core: Optional[bool] = None,
+    dedupe_action: Optional[str] = None,
+    resume: bool = False,
+    duplicate_dirs: Optional[bool] = None,
+    verify_md5: Optional[bool] = None,
+    block_tree_min_mb: Optional[int] = None,
 ) -> dict:
     """
-    Scan scan_dir (and optionally secondary_dir) for SHA-256 duplicates.
+    Scan scan_dir (and optionally secondary_dir) for content duplicates.
 
     Uses persistent index when scan_dir is inside LIBRARY_MOUNT_PATH,
     otherwise uses ephemeral (in-memory only) hashing.
 
     Returns summary dict:
         {files_processed, duplicates_found, files_moved, errors,
-         log_lines, cancelled, cache_hits, files_hashed}
+         log_lines, cancelled, cache_hits, files_hashed,
+         partial_hashed, size_unique, files_linked, duplicate_dirs,
+         md5_verified, md5_mismatches, tree_reused}
 
     progress_callback(str): called with each log line as work proceeds.
     stop_event: threading.Event — set it to cancel the scan gracefully.
+    hash_workers: hashing threads (default: DEDUPE_HASH_WORKERS from config).
+    hash_algorithm: 'sha256' | 'blake2b' (default: DEDUPE_HASH_ALGORITHM).
+        Index rows hashed with a different algorithm count as cache misses.
+    incremental: trust cached listings of directories whose mtime hasn't
+        changed (default: DEDUPE_INCREMENTAL_SCAN). Persistent mode only;
+        files edited in place inside an unchanged directory are not noticed.
+    intake_check: compare secondary_dir against the index of scan_dir
+        instead of walking scan_dir (see _run_intake_check). Duplicates are
+        moved to secondary_dir/_DuplicateHoldingBin; summary gains 'unverified'.
+    out_of_core: keep per-file state in a temporary on-disk store, stop
+        holding index rows in memory and keep only the log tail (default:
+        once the walk reaches DEDUPE_SPILL_THRESHOLD files; 0 disables).
+    dedupe_action: 'move' | 'hardlink' | 'reflink' — what a live run does
+        with discarded copies (default: DEDUPE_ACTION). Ignored by intake_check.
+    resume: continue from the checkpoint a cancelled or interrupted run with
+        the same roots and settings left behind (see dedupe_checkpoint.py).
+        Without one, or if the settings differ, the run starts over.
+        Ignored by intake_check.
+    duplicate_dirs: report identical subtrees as single entries and bin
+        them whole in live 'move' runs (default: DEDUPE_DIRECTORY_PASS).
+        Summary key 'duplicate_dirs' counts the discarded directories.
+    verify_md5: compute MD5 alongside each full hash and check it against
+        Anna's Archive IDs in file names (default: DEDUPE_VERIFY_ARCHIVE_MD5).
+        Summary keys 'md5_verified' / 'md5_mismatches'.
+    block_tree_min_mb: hash files of at least this many MB as block trees
+        (default: DEDUPE_BLOCK_TREE_MIN_MB; 0 disables). Summary key
+        'tree_reused' counts files ruled out by a digest built mostly
+        from a stored tree, without a full read.
     """
     if preferred_extensions is None:
         preferred_extensions = ['.pdf', '.epub']
@@ -155,6 +808,37 @@ def run_dedupe(
         excluded_folders = ['_DuplicateHoldingBin', 'Organized_Books']
     if excluded_files is None:
         excluded_files = set()
+    # The exact names above plus the weeding rules of the schema config.json
+    path_filter = module_filter('weeding',
+                                excluded_folders=literal_names(excluded_folders),
+                                excluded_files=literal_names(excluded_files))
+    if hash_workers is None:
+        hash_workers = config_value('DEDUPE_HASH_WORKERS', 4)
+    hash_workers = max(1, int(hash_workers))
+    if hash_algorithm is None:
+        hash_algorithm = config_value('DEDUPE_HASH_ALGORITHM', 'sha256')
+    if hash_algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f'Unsupported hash algorithm: {hash_algorithm!r}')
+    block_size = int(config_value('HASH_BLOCK_SIZE_KB', 1024)) * 1024
+    if incremental is None:
+        incremental = bool(config_value('DEDUPE_INCREMENTAL_SCAN', False))
+    if dedupe_action is None:
+        dedupe_action = config_value('DEDUPE_ACTION', 'move')
+    if dedupe_action not in DEDUPE_ACTIONS:
+        raise ValueError(f'Unsupported dedupe action: {dedupe_action!r}')
+    if duplicate_dirs is None:
+        duplicate_dirs = bool(config_value('DEDUPE_DIRECTORY_PASS', False))
+    if verify_md5 is None:
+        verify_md5 = bool(config_value('DEDUPE_VERIFY_ARCHIVE_MD5', True))
+    if block_tree_min_mb is None:
+        block_tree_min_mb = int(config_value('DEDUPE_BLOCK_TREE_MIN_MB', 0))
+    tree_min = max(0, int(block_tree_min_mb)) * 1024 * 1024
+
+    if intake_check:
+        return _run_intake_check(scan_dir, secondary_dir, move_duplicates,
+                                 path_filter, stop_event,
+                                 progress_callback, hash_workers,
+                                 hash_algorithm, block_size, verify_md5, tree_min)
 
     log_lines = []
 
@@ -171,143 +855,676 @@ def run_dedupe(
         log(msg)
         return {'files_processed': 0, 'duplicates_found': 0,
                 'files_moved': 0, 'errors': 1, 'log_lines': log_lines,
-                'cancelled': False, 'cache_hits': 0, 'files_hashed': 0}
+                'cancelled': False, 'cache_hits': 0, 'files_hashed': 0,
+                'partial_hashed': 0, 'size_unique': 0, 'files_linked': 0,
+                'duplicate_dirs': 0, 'md5_verified': 0, 'md5_mismatches': 0,
+                'tree_reused': 0}
 
     holding_dir = os.path.join(scan_dir, '_DuplicateHoldingBin')
     os.makedirs(holding_dir, exist_ok=True)
+    binning = move_duplicates and dedupe_action == 'move'
+    bin_conn = holding_bin.open_bin(holding_dir) if binning else None
 
     # Open index (persistent or ephemeral)
-    db_conn, is_persistent = idx.open_index(scan_dir)
+    db_conn, is_persistent = idx.open_index(scan_dir, preload_rows=not out_of_core)
     stats = idx.index_stats(db_conn)
 
     log(f'DEDUPE START')
     log(f'Primary root : {scan_dir}')
     if secondary_dir and os.path.exists(secondary_dir):
         log(f'Secondary    : {secondary_dir}')
-    log(f'Mode         : {"LIVE – moving duplicates" if move_duplicates else "DRY RUN"}')
+    if not move_duplicates:
+        log(f'Mode         : DRY RUN')
+    elif dedupe_action == 'move':
+        log(f'Mode         : LIVE – moving duplicates')
+    else:
+        log(f'Mode         : LIVE – replacing duplicates with {dedupe_action}s to the keeper')
     log(f'Keeper logic : {"Scoring" if use_keeper_scoring else "First-seen (legacy)"}')
     log(f'Index mode   : {"Persistent (NAS)" if is_persistent else "Ephemeral"}')
+    incremental = incremental and is_persistent
+    if incremental:
+        log(f'Scan mode    : Incremental (unchanged directories not re-listed)')
+    log(f'Hash workers : {hash_workers} ({hash_algorithm})')
+    if tree_min:
+        log(f'Block trees  : files from {block_tree_min_mb:,} MB up')
+    if io_budget.budget() is not None:
+        log(f'I/O budget   : {io_budget.budget().rate / 1048576:,.0f} MB/s '
+            f'(shared by hashing and moves)')
     if is_persistent:
         log(f'Index entries: {stats["entries"]:,} files already indexed')
+
+    has_secondary = bool(secondary_dir) and os.path.exists(secondary_dir)
+    checkpoint = dedupe_checkpoint.Checkpoint(
+        scan_dir, secondary_dir if has_secondary else '',
+        {'hash_algorithm': hash_algorithm, 'move_duplicates': move_duplicates,
+         'dedupe_action': dedupe_action, 'use_keeper_scoring': use_keeper_scoring,
+         'preferred_extensions': sorted(preferred_extensions),
+         'path_filter': path_filter.rules,
+         'duplicate_dirs': duplicate_dirs, 'block_tree_min_mb': block_tree_min_mb},
+        resume)
+    if checkpoint.resumed:
+        log(f'Resume       : continuing from checkpoint {checkpoint.path}')
+    elif checkpoint.mismatch:
+        log(f'Resume       : checkpoint was made with other settings — starting over')
     log('-' * 70)
 
-    # Build unified file list
-    all_files = _walk_folder(scan_dir, excluded_folders, excluded_files)
-    if secondary_dir and os.path.exists(secondary_dir):
-        all_files += _walk_folder(secondary_dir, excluded_folders, excluded_files)
+    if has_secondary:
+        idx.preload(db_conn, secondary_dir)
+
+    # Per-file state goes to the scan store, which moves to disk once the
+    # walk reaches DEDUPE_SPILL_THRESHOLD files (or at once with out_of_core)
+    store = _ScanStore()
+    threshold = 0
+    if out_of_core is None:
+        threshold = max(0, int(config_value('DEDUPE_SPILL_THRESHOLD', 1000000)))
 
-    log(f'Total files to scan: {len(all_files):,}')
+    def go_out_of_core():
+        nonlocal log_lines
+        store.spill()
+        idx.unload(db_conn)
+        log(f'Scan store   : Out-of-core (temporary on-disk store; '
+            f'summary keeps the last {_LOG_TAIL:,} log lines)')
+        log_lines = deque(log_lines, maxlen=_LOG_TAIL)
 
-    # Hash pass
-    hash_map = {}   # sha256 -> (filepath, root)
+    if out_of_core:
+        go_out_of_core()
+
+    # Counters shared by every stage
     files_processed = 0
     duplicates_found = 0
     files_moved = 0
     errors = 0
     cache_hits = 0
     files_hashed = 0
+    partial_hashed = 0
+    size_unique = 0
+    files_linked = 0
+    dirs_found = 0
+    md5_verified = 0
+    md5_mismatches = 0
+    same_file = 0
+    tree_reused = 0
+    tree_bytes_read = 0
+    tree_bytes_total = 0
     hashed_since_commit = 0
 
-    for filepath, file_root in all_files:
+    def summary(was_cancelled: bool) -> dict:
+        return {
+            'files_processed': files_processed,
+            'duplicates_found': duplicates_found,
+            'files_moved': files_moved,
+            'errors': errors,
+            'log_lines': list(log_lines),
+            'cancelled': was_cancelled,
+            'cache_hits': cache_hits,
+            'files_hashed': files_hashed,
+            'partial_hashed': partial_hashed,
+            'size_unique': size_unique,
+            'files_linked': files_linked,
+            'duplicate_dirs': dirs_found,
+            'md5_verified': md5_verified,
+            'md5_mismatches': md5_mismatches,
+            'tree_reused': tree_reused,
+        }
+
+    def check_md5(path: str, md5: Optional[str]):
+        nonlocal md5_verified, md5_mismatches
+        expected = _filename_md5(path) if md5 else ''
+        if not expected:
+            return
+        if expected == md5:
+            md5_verified += 1
+            return
+        md5_mismatches += 1
+        log(f'\nARCHIVE MD5 MISMATCH (corrupt or mislabeled download):')
+        log(f'  File       : {path}')
+        log(f'  Name says  : {expected}')
+        log(f'  Content MD5: {md5}')
+
+    def cancel() -> dict:
+        log(f'\n⚠ CANCELLED by user after processing {files_processed:,} files.')
+        idx.batch_commit(db_conn)
+        # Rows not reached yet aren't stale — skip the generation prune
+        idx.close_index(db_conn, scan_dir, prune=False)
+        holding_bin.close_bin(bin_conn)
+        checkpoint.close()
+        store.close()
+        log(f'Progress saved — run again with resume to continue.')
+        return summary(True)
+
+    def save_progress():
+        idx.batch_commit(db_conn)
+        checkpoint.commit()
+
+    tree_alg = tree_algorithm(hash_algorithm)
+
+    def algorithm_for(size: int) -> str:
+        """Index algorithm label of a file this size (all same-size files match)."""
+        return tree_alg if tree_min and size >= tree_min else hash_algorithm
+
+    # Stage 1 — walk, size + cache lookup. Cache hits skip every later stage.
+    # A resumed run replays the recorded walk instead of walking again.
+    walk = checkpoint.walk() if checkpoint.resumed else None
+    recording = walk is None
+    if recording:
+        walk = _walk_folder(scan_dir, path_filter, db_conn, incremental)
+        if has_secondary:
+            walk = itertools.chain(
+                walk, _walk_folder(secondary_dir, path_filter, db_conn, incremental))
+    primary_root = os.path.abspath(scan_dir)
+    for filepath, file_root, st in walk:
         if cancelled():
-            log(f'\n⚠ CANCELLED by user after processing {files_processed:,} files.')
-            idx.batch_commit(db_conn)
-            idx.close_index(db_conn, scan_dir)
-            return {
-                'files_processed': files_processed,
-                'duplicates_found': duplicates_found,
-                'files_moved': files_moved,
-                'errors': errors,
-                'log_lines': log_lines,
-                'cancelled': True,
-                'cache_hits': cache_hits,
-                'files_hashed': files_hashed,
-            }
-
-        # Try cache first
-        file_hash = idx.get_cached_hash(filepath, db_conn)
+            return cancel()
+        if recording:
+            checkpoint.record_walk(filepath, file_root, st)
+        # The same file reached twice (overlapping roots spelled in NFC and
+        # NFD) must not become its own duplicate
+        if file_root != primary_root and store.has_file(path_key(filepath),
+                                                        st.st_dev, st.st_ino):
+            same_file += 1
+            continue
+
+        file_algorithm = algorithm_for(st.st_size)
+        file_hash = idx.get_cached_hash(filepath, db_conn, file_algorithm, st)
+        if file_hash is None:
+            file_hash = checkpoint.recorded(filepath)[1]
+            if file_hash is not None:
+                idx.update_hash(filepath, file_hash, db_conn, file_algorithm, st)
         if file_hash is not None:
             cache_hits += 1
-        else:
-            file_hash = calculate_sha256(filepath)
-            if file_hash is None:
+            if verify_md5:
+                check_md5(filepath, idx.cached_md5(db_conn, filepath))
+        store.add(filepath, file_root, st, file_hash)
+        files_processed += 1
+        if files_processed % _SPILL_BATCH == 0:
+            save_progress()
+        if threshold and files_processed == threshold and not store.spilled:
+            go_out_of_core()
+    if recording:
+        checkpoint.walk_done()
+    log(f'Total files to scan: {files_processed + same_file:,}')
+
+    # Stage 2 — bucket by size. A file with a unique size can't be a duplicate.
+    # Cached copies have no partial hash to compare against, and small files
+    # would be read in full by the partial stage anyway: both go straight to
+    # a full hash.
+    size_unique = store.plan(2 * _PARTIAL_EDGE_BYTES)
+
+    if same_file:
+        log(f'Same file listed twice (Unicode spelling): {same_file:,} skipped')
+    log(f'Unique sizes skipped: {size_unique:,}')
+
+    # Stage 3 — head/tail hash on same-size files; only collisions go forward
+    def partial_hash(path: str) -> Optional[str]:
+        return calculate_partial_sha256(path, _PARTIAL_EDGE_BYTES)
+
+    def partial_candidates():
+        """Files still needing a partial hash (an earlier attempt may have one)."""
+        for entry in store.candidates(store.PARTIAL):
+            partial = checkpoint.recorded(entry['path'])[0]
+            if partial is None:
+                yield entry
+            else:
+                store.set_partial(entry['seq'], partial)
+
+    for entry, partial in _hash_in_pool(partial_candidates(), partial_hash,
+                                        hash_workers, stop_event):
+        if partial is None:
+            errors += 1
+            continue
+        partial_hashed += 1
+        store.set_partial(entry['seq'], partial)
+        checkpoint.record_partial(entry['path'], partial)
+    checkpoint.commit()
+    if cancelled():
+        return cancel()
+
+    log(f'Files to fully hash: {store.promote_partial_matches():,}')
+
+    # Stage 4 — full hash on whatever still collides (plus MD5, same read)
+    def full_hash(path: str) -> Optional[str]:
+        """Fresh digest of path, never from a stored tree (used to verify links)."""
+        try:
+            tree = algorithm_for(os.path.getsize(path)) == tree_alg
+        except OSError:
+            return None
+        if tree:
+            result = hash_file_tree(path, hash_algorithm)
+            return result['digest'] if result else None
+        return hash_file(path, hash_algorithm, block_size)
+
+    extra_names = ('md5',) if verify_md5 else ()
+    digest_names = (hash_algorithm,) + extra_names
+    # Stored trees of the files queued for a tree hash (None: no tree yet),
+    # looked up as they are queued and dropped once hashed
+    tree_entries = {}
+
+    def full_candidates():
+        for entry in store.candidates(store.FULL):
+            if algorithm_for(entry['size']) == tree_alg:
+                tree_entries[entry['path']] = idx.cached_block_tree(db_conn, entry['path'])
+            yield entry
+
+    def full_hashes(path: str) -> Optional[dict]:
+        if path in tree_entries:
+            return hash_file_tree(path, hash_algorithm, tree_entries[path], extra_names)
+        digests = hash_file_multi(path, digest_names, block_size)
+        if digests is not None:
+            digests['digest'] = digests[hash_algorithm]
+        return digests
+
+    def fresh_hashes(path: str) -> Optional[dict]:
+        return hash_file_tree(path, hash_algorithm, None, extra_names)
+
+    def record(entry: dict, digests: dict):
+        nonlocal files_hashed, hashed_since_commit
+        tree = None
+        if 'blocks' in digests:
+            tree = (digests['block_size'], digests['blocks'])
+        idx.update_hash(entry['path'], entry['digest'], db_conn, algorithm_for(entry['size']),
+                        entry['st'], md5=digests.get('md5'), tree=tree)
+        if verify_md5:
+            check_md5(entry['path'], digests.get('md5'))
+        checkpoint.record_digest(entry['path'], entry['digest'])
+        files_hashed += 1
+        hashed_since_commit += 1
+
+        # Periodic commit to avoid large transactions (and checkpoint)
+        if hashed_since_commit >= _COMMIT_EVERY:
+            save_progress()
+            hashed_since_commit = 0
+
+    for entry, digests in _hash_in_pool(full_candidates(), full_hashes,
+                                        hash_workers, stop_event):
+        tree_entries.pop(entry['path'], None)
+        if digests is None:
+            errors += 1
+            continue
+        entry['digest'] = digests['digest']
+        if 'blocks' in digests:
+            tree_bytes_read += digests['bytes_read']
+            tree_bytes_total += entry['size']
+        # Digests built on a stored tree: only spot-checked, so never stored
+        provisional = bool(digests.get('reused'))
+        store.set_digest(entry['seq'], entry['digest'], provisional)
+        if not provisional:
+            record(entry, digests)
+    if cancelled():
+        return cancel()
+
+    # A provisional digest that matches another file's is confirmed by a full
+    # read before anything acts on the match. The confirmed digest can match
+    # another provisional one in turn, hence the loop. Provisional digests
+    # that match nothing rule their file out as they are; they stay out of
+    # the index, so the next run checks those files again.
+    confirmed = 0
+    while True:
+        colliding = 0
+        for entry, digests in _hash_in_pool(store.provisional_matches(), fresh_hashes,
+                                            hash_workers, stop_event):
+            colliding += 1
+            if digests is None:
+                store.set_digest(entry['seq'], None)
                 errors += 1
                 continue
-            idx.update_hash(filepath, file_hash, db_conn)
-            files_hashed += 1
-            hashed_since_commit += 1
+            entry['digest'] = digests['digest']
+            store.set_digest(entry['seq'], entry['digest'])
+            tree_bytes_read += digests['bytes_read']
+            confirmed += 1
+            record(entry, digests)
+        if cancelled():
+            return cancel()
+        if not colliding:
+            break
+    tree_reused = store.provisional_count()
+    if tree_reused:
+        log(f'Block trees reused: {tree_reused:,} files — read '
+            f'{tree_bytes_read / 1048576:,.1f} MB of {tree_bytes_total / 1048576:,.1f} MB')
+    if confirmed:
+        log(f'Reused tree digests confirmed by a full read: {confirmed:,} files')
 
-            # Periodic commit to avoid large transactions
-            if hashed_since_commit >= _COMMIT_EVERY:
-                idx.batch_commit(db_conn)
-                hashed_since_commit = 0
+    done_groups = checkpoint.done_groups()
+    if done_groups:
+        log(f'Groups already resolved before resume: {len(done_groups):,}')
 
-        files_processed += 1
+    # Directory pass — identical subtrees from the digests gathered so far
+    discarded_dirs = set()
+    if duplicate_dirs:
+        for tree_digest, members in _duplicate_directories(store):
+            if cancelled():
+                return cancel()
+            keeper_dir, discards = _resolve_group(members, scan_dir, preferred_extensions)
+            # Files below these are settled here, even if already resolved before
+            discarded_dirs.update(d for d, _reason in discards)
+            if 'dir:' + tree_digest in done_groups:
+                continue
 
-        if file_hash not in hash_map:
-            hash_map[file_hash] = (filepath, file_root)
-            continue
+            outcome = []
+            for discard, reason in discards:
+                dirs_found += 1
+                log(f'\nDUPLICATE DIRECTORY FOUND:')
+                log(f'  Keep   : {keeper_dir}')
+                log(f'  Discard: {discard}')
+                log(f'  Reason : {reason}')
+                if move_duplicates and binning:
+                    try:
+                        dest_path = holding_bin.bin_directory(
+                            bin_conn, holding_dir, discard, tree_digest,
+                            hash_algorithm, keeper_dir, reason)
+                        log(f'  Moved to: {dest_path}')
+                        outcome.append([discard, dest_path])
+                    except (OSError, IOError) as e:
+                        log(f'  ERROR moving {os.path.basename(discard)!r}: {e}')
+                        errors += 1
+                elif move_duplicates:
+                    log(f'  [{dedupe_action} — handled file by file below]')
+                else:
+                    log(f'  [DRY RUN — not moved]')
+            if move_duplicates and not binning:
+                # Link actions work per file, so let the file pass see them
+                discarded_dirs.difference_update(d for d, _reason in discards)
+            checkpoint.record_group('dir:' + tree_digest, outcome)
+            checkpoint.commit()
+        log(f'Duplicate directories: {dirs_found:,}')
 
-        # Duplicate found
-        duplicates_found += 1
-        existing_path, existing_root = hash_map[file_hash]
-
-        if use_keeper_scoring:
-            keeper, discard, reason = _pick_keeper(
-                existing_path, existing_root,
-                filepath, file_root,
-                scan_dir, preferred_extensions
-            )
-        else:
-            keeper, discard, reason = existing_path, filepath, 'first-seen (legacy)'
+    # Stage 5 — group by (size, digest), then resolve each group in one pass
+    save_progress()
+    groups_since_commit = 0
 
-        # Always update map to point at the keeper
-        hash_map[file_hash] = (keeper,
-                               existing_root if keeper == existing_path else file_root)
+    try:
+        for group_size, group_digest, group in store.groups():
+            if cancelled():
+                return cancel()
+            if group_digest in done_groups:
+                continue
+            if discarded_dirs:
+                group = [m for m in group if not _under_any(m[0], discarded_dirs)]
+                if len(group) < 2:
+                    continue
 
-        discard_name = os.path.basename(discard)
-        sanitized    = sanitize_filename(discard_name)
-        dest_path    = os.path.join(holding_dir, sanitized)
+            if use_keeper_scoring:
+                keeper, discards = _resolve_group(group, scan_dir,
+                                                  preferred_extensions)
+            else:
+                keeper = group[0][0]
+                discards = [(path, 'first-seen (legacy)') for path, _root in group[1:]]
 
-        log(f'\nDUPLICATE FOUND:')
-        log(f'  Keep   : {keeper}')
-        log(f'  Discard: {discard}')
-        log(f'  Reason : {reason}')
+            group_algorithm = algorithm_for(group_size)
+            keeper_verified = False
+            outcome = []    # [discard, what happened] for the checkpoint
+            for discard, reason in discards:
+                duplicates_found += 1
+                discard_name = os.path.basename(discard)
 
-        if move_duplicates:
-            try:
-                if os.path.exists(discard):
-                    shutil.move(discard, dest_path)
-                    log(f'  Moved to: {dest_path}')
-                    files_moved += 1
+                log(f'\nDUPLICATE FOUND:')
+                log(f'  Keep   : {keeper}')
+                log(f'  Discard: {discard}')
+                log(f'  Reason : {reason}')
+
+                if move_duplicates and dedupe_action != 'move':
+                    problem = _link_duplicate(keeper, discard, dedupe_action,
+                                              group_digest, full_hash, keeper_verified)
+                    if not problem:
+                        log(f'  Replaced with {dedupe_action} to keeper')
+                        files_linked += 1
+                        keeper_verified = True
+                        outcome.append([discard, dedupe_action])
+                        # The path now has the keeper's inode and mtime
+                        idx.update_hash(discard, group_digest, db_conn, group_algorithm)
+                    elif problem == 'already linked':
+                        log(f'  Already a link to the keeper')
+                    else:
+                        log(f'  ERROR replacing {discard_name!r}: {problem} — left in place')
+                        errors += 1
+                elif move_duplicates:
+                    try:
+                        if os.path.exists(discard):
+                            dest_path = holding_bin.bin_file(
+                                bin_conn, holding_dir, discard, group_digest,
+                                group_algorithm, keeper, reason)
+                            log(f'  Moved to: {dest_path}')
+                            files_moved += 1
+                            outcome.append([discard, dest_path])
+                        else:
+                            log(f'  WARNING: discard file already gone: {discard}')
+                    except (OSError, IOError) as e:
+                        log(f'  ERROR moving {discard_name!r}: {e}')
+                        errors += 1
                 else:
-                    log(f'  WARNING: discard file already gone: {discard}')
-            except (OSError, IOError) as e:
-                log(f'  ERROR moving {discard_name!r}: {e}')
-                errors += 1
-        else:
-            log(f'  [DRY RUN — not moved]')
+                    log(f'  [DRY RUN — not moved]')
+
+            checkpoint.record_group(group_digest, outcome)
+            groups_since_commit += 1
+            # Files were just moved or linked — don't risk redoing that work
+            if outcome or groups_since_commit >= _COMMIT_EVERY:
+                checkpoint.commit()
+                groups_since_commit = 0
+    finally:
+        store.close()
 
     # Final commit and index cleanup
     idx.batch_commit(db_conn)
+    if has_secondary:
+        idx.prune_unseen(db_conn, secondary_dir)
     idx.close_index(db_conn, scan_dir)
+    holding_bin.close_bin(bin_conn)
+    checkpoint.finish()
 
     log('\n' + '-' * 70)
     log(f'Files scanned   : {files_processed:,}')
+    log(f'  Unique size   : {size_unique:,}  (never read)')
+    log(f'  Partial hashed: {partial_hashed:,}')
     if is_persistent:
         log(f'  Cache hits    : {cache_hits:,}  (skipped re-hashing)')
         log(f'  Newly hashed  : {files_hashed:,}')
+    if verify_md5:
+        log(f'Archive MD5 ok  : {md5_verified:,}')
+        log(f'MD5 mismatches  : {md5_mismatches:,}')
+    log(f'Duplicates found: {duplicates_found:,}')
+    if duplicate_dirs:
+        log(f'Duplicate dirs  : {dirs_found:,}')
+    log(f'Files moved     : {files_moved:,}')
+    if dedupe_action != 'move':
+        log(f'Files linked    : {files_linked:,}')
+    log(f'Errors          : {errors:,}')
+
+    return summary(False)
+
+
+def _run_intake_check(library_dir: str, intake_dir: str, move_duplicates: bool,
+                      path_filter: PathFilter,
+                      stop_event: Optional[threading.Event], progress_callback,
+                      hash_workers: int, hash_algorithm: str,
+                      block_size: int, verify_md5: bool = True,
+                      tree_min: int = 0) -> dict:
+    """
+    Hash only intake_dir and resolve its files against the persistent index
+    of library_dir. No library file is listed or read; the only library
+    access is one stat of each matched copy before an intake file is moved.
+    Library copies always win. Duplicates within intake_dir are not checked.
+    """
+    log_lines = []
+
+    def log(msg: str):
+        log_lines.append(msg)
+        if progress_callback:
+            progress_callback(msg)
+
+    def cancelled() -> bool:
+        return stop_event is not None and stop_event.is_set()
+
+    files_processed = 0
+    duplicates_found = 0
+    files_moved = 0
+    errors = 0
+    files_hashed = 0
+    unverified = 0
+    md5_verified = 0
+    md5_mismatches = 0
+
+    def summary(was_cancelled: bool) -> dict:
+        return {
+            'files_processed': files_processed,
+            'duplicates_found': duplicates_found,
+            'files_moved': files_moved,
+            'errors': errors,
+            'log_lines': log_lines,
+            'cancelled': was_cancelled,
+            'cache_hits': 0,
+            'files_hashed': files_hashed,
+            'partial_hashed': 0,
+            'size_unique': 0,
+            'files_linked': 0,
+            'duplicate_dirs': 0,
+            'md5_verified': md5_verified,
+            'md5_mismatches': md5_mismatches,
+            'tree_reused': 0,
+            'unverified': unverified,
+        }
+
+    for label, folder in (('Library', library_dir), ('Intake', intake_dir)):
+        if not folder or not os.path.exists(folder):
+            errors += 1
+            log(f'ERROR: {label} folder not found: {folder!r}')
+            return summary(False)
+
+    db_conn, is_persistent = idx.open_index(library_dir, preload_rows=False)
+    if not is_persistent:
+        errors += 1
+        log(f'ERROR: Intake check needs the persistent index; '
+            f'{library_dir!r} is not inside LIBRARY_MOUNT_PATH.')
+        return summary(False)
+
+    holding_dir = os.path.join(intake_dir, '_DuplicateHoldingBin')
+    bin_conn = holding_bin.open_bin(holding_dir) if move_duplicates else None
+
+    def finish(was_cancelled: bool) -> dict:
+        # The library wasn't walked, so nothing under it may be pruned
+        idx.close_index(db_conn, library_dir, prune=False)
+        holding_bin.close_bin(bin_conn)
+        if was_cancelled:
+            log(f'\n⚠ CANCELLED by user after processing {files_processed:,} files.')
+        return summary(was_cancelled)
+
+    log(f'INTAKE CHECK START')
+    log(f'Library root : {library_dir}  (index only — not walked)')
+    log(f'Intake       : {intake_dir}')
+    log(f'Mode         : {"LIVE – moving duplicates" if move_duplicates else "DRY RUN"}')
+    log(f'Hash workers : {hash_workers} ({hash_algorithm})')
+    log(f'Index entries: {idx.index_stats(db_conn)["entries"]:,} files already indexed')
+    log('-' * 70)
+
+    intake_files = list(_walk_folder(intake_dir, path_filter))
+    log(f'Intake files to hash: {len(intake_files):,}')
+
+    extra_names = ('md5',) if verify_md5 else ()
+    digest_names = (hash_algorithm,) + extra_names
+    tree_alg = tree_algorithm(hash_algorithm)
+    # Same rule as the full run, so tree-hashed library rows can match
+    tree_paths = {p for p, _root, st in intake_files
+                  if tree_min and st.st_size >= tree_min}
+
+    def full_hashes(path: str) -> Optional[dict]:
+        if path in tree_paths:
+            digests = hash_file_tree(path, hash_algorithm, extra=extra_names)
+            if digests is not None:
+                digests[tree_alg] = digests['digest']
+            return digests
+        return hash_file_multi(path, digest_names, block_size)
+
+    entries = [{'path': p, 'size': st.st_size, 'st': st,
+                'algorithm': tree_alg if p in tree_paths else hash_algorithm}
+               for p, _root, st in intake_files]
+    hashed = []
+    for entry, digests in _hash_in_pool(_io_order(entries), full_hashes,
+                                        hash_workers, stop_event):
+        files_processed += 1
+        if digests is None:
+            errors += 1
+            continue
+        entry['digest'] = digests[entry['algorithm']]
+        hashed.append(entry)
+        files_hashed += 1
+        expected = _filename_md5(entry['path']) if verify_md5 else ''
+        if expected and expected == digests['md5']:
+            md5_verified += 1
+        elif expected:
+            md5_mismatches += 1
+            log(f'\nARCHIVE MD5 MISMATCH (corrupt or mislabeled download):')
+            log(f'  File       : {entry["path"]}')
+            log(f'  Name says  : {expected}')
+            log(f'  Content MD5: {digests["md5"]}')
+    if cancelled():
+        return finish(True)
+
+    matches = {}
+    size_only = {}
+    for algorithm in {e['algorithm'] for e in hashed}:
+        subset = [e for e in hashed if e['algorithm'] == algorithm]
+        found = idx.find_by_digests(db_conn, library_dir,
+                                    {e['digest'] for e in subset}, algorithm)
+        matches.update(found)
+        size_only.update(idx.find_unhashed_by_size(
+            db_conn, library_dir,
+            {e['size'] for e in subset if e['digest'] not in found}, algorithm))
+
+    for entry in hashed:
+        if cancelled():
+            return finish(True)
+
+        intake_path = entry['path']
+        library_copies = matches.get(entry['digest'])
+        if not library_copies:
+            if entry['size'] in size_only:
+                unverified += 1
+                log(f'\nPOSSIBLE DUPLICATE (size only — library copy never hashed):')
+                log(f'  Intake : {intake_path}')
+                for candidate in size_only[entry['size']]:
+                    log(f'  Library: {candidate}')
+                log(f'  [Not moved — run a full deDupe to verify]')
+            continue
+
+        # The index can lag behind the NAS; only trust a copy that's still there
+        keeper = next((p for p in library_copies
+                       if _same_size(p, entry['size'])), None)
+        if keeper is None:
+            log(f'\nSTALE INDEX MATCH (library copy gone or changed): {intake_path}')
+            continue
+
+        duplicates_found += 1
+        log(f'\nDUPLICATE FOUND:')
+        log(f'  Keep   : {keeper}')
+        log(f'  Discard: {intake_path}')
+        log(f'  Reason : already in library (index match)')
+
+        if move_duplicates:
+            try:
+                dest_path = holding_bin.bin_file(
+                    bin_conn, holding_dir, intake_path, entry['digest'],
+                    entry['algorithm'], keeper, 'already in library (index match)')
+                log(f'  Moved to: {dest_path}')
+                files_moved += 1
+            except (OSError, IOError) as e:
+                log(f'  ERROR moving {os.path.basename(intake_path)!r}: {e}')
+                errors += 1
+        else:
+            log(f'  [DRY RUN — not moved]')
+
+    log('\n' + '-' * 70)
+    log(f'Intake files    : {files_processed:,}')
     log(f'Duplicates found: {duplicates_found:,}')
+    log(f'Unverified      : {unverified:,}  (size match only)')
+    if verify_md5:
+        log(f'MD5 mismatches  : {md5_mismatches:,}')
     log(f'Files moved     : {files_moved:,}')
     log(f'Errors          : {errors:,}')
 
-    return {
-        'files_processed': files_processed,
-        'duplicates_found': duplicates_found,
-        'files_moved': files_moved,
-        'errors': errors,
-        'log_lines': log_lines,
-        'cancelled': False,
-        'cache_hits': cache_hits,
-        'files_hashed': files_hashed,
-    }
+    return finish(False)
+
+
+def _same_size(path: str, size: int) -> bool:
+    """True if path exists and is still `size` bytes (one stat, no read)."""
+    try:
+        return os.stat(path).st_size == size
+    except OSError:
+        return False
@@ -0,0 +1,205 @@
+"""
+dedupe_checkpoint.py — Data Librarian
+======================================
+On-disk checkpoints that let an interrupted deDupe run pick up where it
+stopped (Stop button, crash, server restart).
+
+One SQLite file per (scan root, secondary root) pair, stored under
+~/.librarian/checkpoints. It holds:
+  walk    — every file found by the walk, with its stat
+  hashes  — partial and full digests computed so far
+  groups  — duplicate groups already resolved, with what happened to each
+  meta    — the run settings the checkpoint belongs to
+
+Writes are buffered and committed by commit(), which run_dedupe calls on
+the same schedule as its index commits; reads stream from disk, so a
+checkpoint of millions of files is never loaded whole. A finished run
+deletes its checkpoint; a cancelled or crashed one leaves it for
+run_dedupe(resume=True).
+
+Resuming trusts the checkpoint: a completed walk isn't repeated (one cut
+short is walked again) and recorded digests aren't recomputed, so a file
+edited while the run was stopped is only noticed by the next full run.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from library_index import CachedStat
+from utils import path_key
+
+CHECKPOINT_DIR = os.path.expanduser("~/.librarian/checkpoints")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS walk (
+    seq     INTEGER PRIMARY KEY,
+    path    TEXT    NOT NULL,
+    root    TEXT    NOT NULL,
+    size    INTEGER NOT NULL,
+    mtime   REAL    NOT NULL,
+    st_dev  INTEGER NOT NULL,
+    st_ino  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    path    TEXT PRIMARY KEY,
+    partial TEXT,
+    digest  TEXT
+);
+CREATE TABLE IF NOT EXISTS groups (
+    digest  TEXT PRIMARY KEY,
+    outcome TEXT NOT NULL
+);
+"""
+
+
+def checkpoint_path(scan_dir: str, secondary_dir: str = '') -> str:
+    """Checkpoint file used for this pair of scan roots."""
+    key = path_key(scan_dir) + '\0' + (path_key(secondary_dir) if secondary_dir else '')
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CHECKPOINT_DIR, f"dedupe-{name}.db")
+
+
+class Checkpoint:
+    """
+    Checkpoint of one run_dedupe() call. With resume=True an existing
+    checkpoint for the same roots and settings is reused (self.resumed);
+    otherwise any old one is discarded and a fresh one started.
+    """
+
+    def __init__(self, scan_dir: str, secondary_dir: str, settings: dict,
+                 resume: bool = False):
+        self.path = checkpoint_path(scan_dir, secondary_dir)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        settings_json = json.dumps(settings, sort_keys=True)
+        self.resumed = False
+        self.mismatch = False
+
+        if resume and os.path.exists(self.path):
+            self.conn = sqlite3.connect(self.path)
+            self.conn.executescript(_SCHEMA)
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'settings'").fetchone()
+            if row is not None and row[0] == settings_json:
+                self.resumed = True
+                if not self._walked():
+                    # Stopped mid-walk: the walk is repeated from the start
+                    self.conn.execute("DELETE FROM walk")
+            else:
+                # Different settings would make the old digests/groups wrong
+                self.mismatch = True
+                self.conn.close()
+        if not self.resumed:
+            self._remove_file()
+            self.conn = sqlite3.connect(self.path)
+            self.conn.executescript(_SCHEMA)
+            self.conn.execute("INSERT INTO meta VALUES ('settings', ?)", (settings_json,))
+            self.conn.commit()
+
+        self._walk = []      # buffered walk rows
+        self._hashes = []    # buffered (path, partial, digest) upserts
+        self._groups = []    # buffered (digest, outcome) inserts
+
+    # ── walk ────────────────────────────────────────────────────────────────
+    def _walked(self) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'walked'").fetchone() is not None
+
+    def walk(self):
+        """
+        The recorded walk as an iterator of (path, root, CachedStat), read
+        from disk as it is consumed, or None if no complete walk was recorded.
+        """
+        if not self._walked():
+            return None
+        return ((path, root, CachedStat(size, mtime, dev, ino))
+                for path, root, size, mtime, dev, ino in self.conn.execute(
+                    "SELECT path, root, size, mtime, st_dev, st_ino FROM walk ORDER BY seq"))
+
+    def record_walk(self, path: str, root: str, st) -> None:
+        """Add one walked file; written with the next commit()."""
+        self._walk.append((path, root, st.st_size, st.st_mtime, st.st_dev, st.st_ino))
+
+    def walk_done(self) -> None:
+        """Mark the recorded walk complete and commit."""
+        self._flush()
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('walked', '1')")
+        self.conn.commit()
+
+    # ── hashes ──────────────────────────────────────────────────────────────
+    def recorded(self, path: str) -> tuple:
+        """
+        (partial, digest) an earlier attempt recorded for path; either may
+        be None. Always (None, None) unless the checkpoint was resumed.
+        """
+        if not self.resumed:
+            return None, None
+        row = self.conn.execute(
+            "SELECT partial, digest FROM hashes WHERE path = ?", (path,)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def record_partial(self, path: str, partial: str) -> None:
+        self._hashes.append((path, partial, None))
+
+    def record_digest(self, path: str, digest: str) -> None:
+        self._hashes.append((path, None, digest))
+
+    # ── groups ──────────────────────────────────────────────────────────────
+    def done_groups(self) -> set:
+        """Digests of duplicate groups already resolved."""
+        self._flush()
+        return {digest for (digest,) in self.conn.execute("SELECT digest FROM groups")}
+
+    def record_group(self, digest: str, outcome: list) -> None:
+        """Mark a group resolved; outcome lists [discard, result] per copy."""
+        self._groups.append((digest, json.dumps(outcome)))
+
+    # ── persistence ─────────────────────────────────────────────────────────
+    def _flush(self) -> None:
+        if self._walk:
+            self.conn.executemany(
+                "INSERT INTO walk (path, root, size, mtime, st_dev, st_ino) "
+                "VALUES (?,?,?,?,?,?)", self._walk)
+            self._walk = []
+        if self._hashes:
+            self.conn.executemany("""
+                INSERT INTO hashes (path, partial, digest) VALUES (?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    partial = COALESCE(excluded.partial, partial),
+                    digest  = COALESCE(excluded.digest, digest)
+            """, self._hashes)
+            self._hashes = []
+        if self._groups:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO groups (digest, outcome) VALUES (?, ?)",
+                self._groups)
+            self._groups = []
+
+    def commit(self) -> None:
+        """Write buffered progress to disk."""
+        try:
+            self._flush()
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"[dedupe_checkpoint] WARNING: could not save checkpoint: {e}")
+
+    def close(self) -> None:
+        """Commit and close, keeping the checkpoint for a later resume."""
+        self.commit()
+        self.conn.close()
+
+    def finish(self) -> None:
+        """Close and delete the checkpoint (the run completed)."""
+        self.conn.close()
+        self._remove_file()
+
+    def _remove_file(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,229 @@
+"""
+exiftool_pool.py — Data Librarian
+==================================
+Long-lived exiftool processes, so a metadata read costs a round trip
+instead of a Perl interpreter start (150–300 ms each).
+
+Each worker runs `exiftool -stay_open True -@ -` and takes commands on
+stdin, one argument per line, closed by -execute<N>. exiftool answers on
+stdout up to a {ready<N>} line; -echo4 puts a matching marker with the
+command's exit status on stderr, so both streams are framed per command.
+
+  run(args, timeout) -> (stdout, stderr, returncode)   same as subprocess
+
+A command that times out gets its worker killed; a worker found dead
+(crash, killed, EOF mid-answer) is restarted and the command retried once.
+Arguments that can't travel as argfile lines (embedded newlines, leading
+or trailing whitespace) run in a one-shot process instead.
+
+The shared pool holds EXIFTOOL_WORKERS processes (default 2), started on
+first use and stopped at interpreter exit.
+"""
+
+import atexit
+import itertools
+import os
+import queue
+import re
+import selectors
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from utils import config_value
+
+# Output of one command larger than this is a runaway; the worker is reset
+_MAX_OUTPUT = 256 * 1024 * 1024
+
+_STATUS_RE = re.compile(rb'=(\S*)=post(\d+)\n$')
+
+
+class ExiftoolError(Exception):
+    """The worker failed mid-command (died, timed out, broke the framing)."""
+
+
+def _one_shot(command: str, args: list, timeout: float) -> tuple:
+    """The classic one process per call, for arguments -@ can't carry."""
+    try:
+        r = subprocess.run([command] + args, capture_output=True, text=True,
+                           timeout=timeout)
+        return r.stdout, r.stderr, r.returncode
+    except FileNotFoundError:
+        return '', 'exiftool not found in PATH', 1
+    except subprocess.TimeoutExpired:
+        return '', 'exiftool timed out', 1
+
+
+class _Worker:
+    """One `exiftool -stay_open True -@ -` process."""
+
+    def __init__(self, command: str):
+        self.proc = subprocess.Popen(
+            [command, '-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._seq = itertools.count(1)
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def execute(self, args: list, timeout: float) -> tuple:
+        """Run one command; returns (stdout, stderr, returncode) or raises ExiftoolError."""
+        seq = next(self._seq)
+        lines = list(args) + ['-echo4', f'=${{status}}=post{seq}', f'-execute{seq}']
+        try:
+            self.proc.stdin.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise ExiftoolError(f'exiftool worker died: {e}')
+
+        out_marker = f'{{ready{seq}}}\n'.encode()
+        out, err = bytearray(), bytearray()
+        out_done = err_done = False
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as sel:
+            sel.register(self.proc.stdout, selectors.EVENT_READ, 'out')
+            sel.register(self.proc.stderr, selectors.EVENT_READ, 'err')
+            while not (out_done and err_done):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise ExiftoolError('exiftool timed out')
+                for key, _ in sel.select(left):
+                    chunk = os.read(key.fileobj.fileno(), 65536)
+                    if not chunk:
+                        raise ExiftoolError('exiftool worker died mid-command')
+                    if key.data == 'out':
+                        out += chunk
+                        out_done = out.endswith(out_marker)
+                    else:
+                        err += chunk
+                        err_done = _STATUS_RE.search(err) is not None
+                    if len(out) + len(err) > _MAX_OUTPUT:
+                        raise ExiftoolError('exiftool output too large')
+
+        match = _STATUS_RE.search(err)
+        if int(match.group(2)) != seq:
+            raise ExiftoolError('exiftool answered out of order')
+        stderr = err[:match.start()].decode('utf-8', 'replace')
+        status = match.group(1)
+        if status.isdigit():
+            rc = int(status)
+        else:
+            # exiftool older than 12.x prints ${status} literally
+            rc = 1 if 'Error' in stderr else 0
+        stdout = out[:-len(out_marker)].decode('utf-8', 'replace')
+        return stdout, stderr, rc
+
+    def stop(self, kill: bool = False) -> None:
+        """Ask exiftool to exit (or kill it outright); kill it if it doesn't exit."""
+        if kill and self.alive():
+            self.proc.kill()
+            self.proc.wait()
+        elif self.alive():
+            try:
+                self.proc.stdin.write(b'-stay_open\nFalse\n')
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout, self.proc.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class ExiftoolPool:
+    """
+    Up to `size` exiftool workers shared by every thread. A call borrows an
+    idle worker (starting one if fewer than size exist) or waits for one.
+    """
+
+    def __init__(self, size: int = 2, command: str = 'exiftool'):
+        self.size = max(1, int(size))
+        self.command = command
+        self._idle = queue.LifoQueue()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.restarts = 0
+
+    def _acquire(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        while True:
+            with self._lock:
+                if self._count < self.size:
+                    self._count += 1
+                    try:
+                        return _Worker(self.command)
+                    except OSError:
+                        self._count -= 1
+                        raise
+            # All workers busy; recheck now and then in case one was discarded
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.stop(kill=True)
+        with self._lock:
+            self._count -= 1
+            self.restarts += 1
+
+    def run(self, args: list, timeout: float = 30) -> tuple:
+        """Run exiftool with args; returns (stdout, stderr, returncode). Never raises."""
+        if self._closed or any('\n' in a or '\r' in a or a != a.strip() for a in args):
+            return _one_shot(self.command, args, timeout)
+        for attempt in (1, 2):
+            try:
+                worker = self._acquire()
+            except FileNotFoundError:
+                return '', 'exiftool not found in PATH', 1
+            except OSError as e:
+                return '', f'could not start exiftool: {e}', 1
+            if not worker.alive():
+                self._discard(worker)
+                continue
+            try:
+                result = worker.execute(args, timeout)
+            except ExiftoolError as e:
+                self._discard(worker)
+                if str(e) == 'exiftool timed out':
+                    return '', str(e), 1   # The file is the problem; don't retry
+                if attempt == 2:
+                    return '', str(e), 1
+                continue
+            self._idle.put(worker)
+            return result
+        return '', 'exiftool worker died', 1
+
+    def close(self) -> None:
+        """Stop every idle worker; later calls fall back to one-shot processes."""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+            with self._lock:
+                self._count -= 1
+
+
+_shared: Optional[ExiftoolPool] = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool(command: str = 'exiftool') -> ExiftoolPool:
+    """The process-wide pool (EXIFTOOL_WORKERS workers), created on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ExiftoolPool(config_value('EXIFTOOL_WORKERS', 2), command)
+            atexit.register(_shared.close)
+        return _shared
@@ -12,6 +12,9 @@ import re
 import json
 from datetime import datetime
 
+from path_filter import literal_names, module_filter
+from walker import walk_files
+
 # --- Title Enhanced Case Configuration ---
 LOWERCASE_WORDS = {
     'a', 'an', 'and', 'as', 'at', 'but', 'by', 'en', 'for',
@@ -310,18 +313,17 @@ def preview_renames(target_folder, extract_metadata=None):
     excluded_dirs       = cfg['excluded_dirs']
     do_extract          = extract_metadata if extract_metadata is not None else cfg['extract_metadata']
 
+    path_filter = module_filter('cleaning',
+                                excluded_folders=literal_names(excluded_dirs),
+                                excluded_extensions=excluded_extensions)
     results = []
-    for root, dirs, files in os.walk(target_folder):
-        dirs[:] = [d for d in dirs if d not in excluded_dirs]
-        for filename in files:
-            _, ext = os.path.splitext(filename)
-            if ext.lower() in excluded_extensions:
-                continue
-            extracted = extract_filename_metadata(filename) if do_extract else {}
-            cleaned   = clean_filename(filename)
-            if cleaned != filename or (do_extract and any(extracted.values())):
-                original_path = os.path.join(root, filename)
-                results.append((original_path, cleaned, extracted))
+    for original_path, _root, _st in walk_files(target_folder, with_stat=False,
+                                                path_filter=path_filter):
+        filename = os.path.basename(original_path)
+        extracted = extract_filename_metadata(filename) if do_extract else {}
+        cleaned   = clean_filename(filename)
+        if cleaned != filename or (do_extract and any(extracted.values())):
+            results.append((original_path, cleaned, extracted))
 
     return results
 
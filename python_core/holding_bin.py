@@ -0,0 +1,361 @@
+"""
+holding_bin.py — Data Librarian
+================================
+Content-addressed duplicate holding bin with an append-only manifest.
+
+Layout inside a holding bin folder (normally <scan root>/_DuplicateHoldingBin):
+  objects/<first 2 hex chars>/<digest>   — one stored file per distinct digest
+  trees/<first 2 hex chars>/<digest>     — one stored directory per distinct
+                                           tree (Merkle) digest
+  manifest.db                            — SQLite event log
+
+Every binned copy appends a 'binned' event (digest, algorithm, original
+path, keeper path, reason, time). restore() and purge() append 'restored' /
+'purged' events for the entries they act on; nothing is ever updated or
+deleted in the manifest. An entry is "in the bin" while its latest event
+is 'binned'.
+
+Several copies with the same digest share one stored object, so binning
+never collides on file names and never overwrites a different file. The
+object is deleted once no entry in the bin refers to it any more. Whole
+directories (deDupe's duplicate-directory pass) are binned the same way
+as entries of kind 'tree'. A directory whose tree is already stored is
+compared with it byte for byte, and is deleted file by file only if it
+matches; otherwise it stays where it is.
+
+Public API
+----------
+  open_bin(holding_dir)                           -> conn
+  bin_file(conn, holding_dir, path, digest, algorithm, keeper, reason) -> object path
+  bin_directory(conn, holding_dir, path, digest, algorithm, keeper, reason) -> object path
+  binned_entries(conn, path_prefix, keeper_prefix, before, ids) -> [dict]
+  restore(holding_dir, path_prefix, keeper_prefix, before, ids, overwrite) -> counts
+  purge(holding_dir, path_prefix, keeper_prefix, before, ids) -> counts
+  close_bin(conn)
+"""
+
+import filecmp
+import os
+import shutil
+import sqlite3
+import time
+import unicodedata
+from typing import Optional
+
+import io_budget
+
+MANIFEST_NAME = "manifest.db"
+OBJECTS_DIR   = "objects"
+TREES_DIR     = "trees"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY,
+    entry_id    INTEGER,
+    action      TEXT    NOT NULL,
+    digest      TEXT    NOT NULL,
+    algorithm   TEXT    NOT NULL,
+    original    TEXT    NOT NULL,
+    keeper      TEXT    NOT NULL,
+    reason      TEXT    NOT NULL,
+    at          REAL    NOT NULL,
+    kind        TEXT    NOT NULL DEFAULT 'file'
+);
+CREATE INDEX IF NOT EXISTS idx_events_entry    ON events (entry_id, id);
+CREATE INDEX IF NOT EXISTS idx_events_original ON events (original);
+CREATE INDEX IF NOT EXISTS idx_events_digest   ON events (digest);
+"""
+
+# Entries whose latest event is 'binned'. entry_id is the id of the
+# 'binned' event; later events for that copy carry the same entry_id.
+_BINNED = """
+SELECT b.id, b.digest, b.algorithm, b.original, b.keeper, b.reason, b.at, b.kind
+FROM events b
+WHERE b.action = 'binned'
+  AND NOT EXISTS (SELECT 1 FROM events l WHERE l.entry_id = b.id AND l.id > b.id)
+"""
+
+
+def _object_path(holding_dir: str, digest: str, kind: str = 'file') -> str:
+    folder = TREES_DIR if kind == 'tree' else OBJECTS_DIR
+    return os.path.join(holding_dir, folder, digest[:2], digest)
+
+
+def open_bin(holding_dir: str) -> sqlite3.Connection:
+    """Open (creating if needed) the manifest of the holding bin at holding_dir."""
+    os.makedirs(holding_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(holding_dir, MANIFEST_NAME))
+    conn.executescript(_SCHEMA)
+    # Manifests created before directory binning lack the kind column
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+    if 'kind' not in columns:
+        conn.execute("ALTER TABLE events ADD COLUMN kind TEXT NOT NULL DEFAULT 'file'")
+    conn.commit()
+    return conn
+
+
+def close_bin(conn: Optional[sqlite3.Connection]) -> None:
+    if conn is None:
+        return
+    try:
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"[holding_bin] WARNING: error closing manifest: {e}")
+
+
+def bin_file(conn: sqlite3.Connection, holding_dir: str, path: str,
+             digest: str, algorithm: str, keeper: str, reason: str) -> str:
+    """
+    Move path into the bin under its digest and record a 'binned' event.
+    If an object with that digest is already stored (same size), path is
+    removed instead — its content is already in the bin.
+    Returns the object path. Raises OSError if the file can't be moved.
+    """
+    original = os.path.abspath(path)
+    obj = _object_path(holding_dir, digest)
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    if os.path.exists(obj) and os.path.getsize(obj) == os.path.getsize(original):
+        os.remove(original)
+    else:
+        shutil.move(original, obj, copy_function=io_budget.copy_file)
+    _record_binned(conn, 'file', digest, algorithm, original, keeper, reason)
+    return obj
+
+
+def bin_directory(conn: sqlite3.Connection, holding_dir: str, path: str,
+                  digest: str, algorithm: str, keeper: str, reason: str) -> str:
+    """
+    Move the directory at path into the bin in one operation, under its
+    tree digest, and record a 'binned' event of kind 'tree'. If the same
+    tree is already stored, path's files are deleted instead, but only
+    after every one of them has matched the stored tree byte for byte.
+    Returns the object path. Raises OSError if the directory can't be
+    moved or doesn't match the stored tree (it is then left untouched).
+    """
+    original = os.path.abspath(path)
+    obj = _object_path(holding_dir, digest, 'tree')
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    if os.path.isdir(obj):
+        listing = _matching_tree(original, obj)
+        if listing is None:
+            raise OSError(f'{original} differs from the stored tree {obj} — left in place')
+        _record_binned(conn, 'tree', digest, algorithm, original, keeper, reason)
+        _remove_matched(original, listing)
+    else:
+        shutil.move(original, obj, copy_function=io_budget.copy_file)
+        _record_binned(conn, 'tree', digest, algorithm, original, keeper, reason)
+    return obj
+
+
+def _tree_listing(path: str) -> Optional[dict]:
+    """
+    {NFC relative path: (relative path, is_dir)} of everything below path,
+    or None if it can't be fully read or holds a symlink or special file.
+    """
+    def fail(error):
+        raise error
+
+    listing = {}
+    try:
+        for dirpath, dirnames, filenames in os.walk(path, onerror=fail):
+            for name in dirnames + filenames:
+                full = os.path.join(dirpath, name)
+                is_dir = name in dirnames
+                if os.path.islink(full) or not (is_dir or os.path.isfile(full)):
+                    return None
+                rel = os.path.relpath(full, path)
+                listing[unicodedata.normalize('NFC', rel)] = (rel, is_dir)
+    except OSError:
+        return None
+    return listing
+
+
+def _matching_tree(path: str, stored: str) -> Optional[dict]:
+    """
+    path's listing (see _tree_listing) if it holds exactly the names of the
+    stored tree, every file equal byte for byte; otherwise None.
+    """
+    mine, theirs = _tree_listing(path), _tree_listing(stored)
+    if mine is None or theirs is None or mine.keys() != theirs.keys():
+        return None
+    for key, (rel, is_dir) in mine.items():
+        stored_rel, stored_is_dir = theirs[key]
+        if is_dir != stored_is_dir:
+            return None
+        if is_dir:
+            continue
+        try:
+            if not filecmp.cmp(os.path.join(path, rel), os.path.join(stored, stored_rel),
+                               shallow=False):
+                return None
+        except OSError:
+            return None
+    return mine
+
+
+def _remove_matched(path: str, listing: dict) -> None:
+    """
+    Delete the files in listing, then its directories deepest first.
+    Anything that appeared since listing was taken is left, and so is the
+    directory holding it.
+    """
+    for rel, is_dir in listing.values():
+        if not is_dir:
+            os.remove(os.path.join(path, rel))
+    dirs = [rel for rel, is_dir in listing.values() if is_dir]
+    for rel in sorted(dirs, key=lambda d: d.count(os.sep), reverse=True) + ['']:
+        try:
+            os.rmdir(os.path.join(path, rel))
+        except OSError:
+            pass
+
+
+def _record_binned(conn: sqlite3.Connection, kind: str, digest: str, algorithm: str,
+                   original: str, keeper: str, reason: str) -> None:
+    cur = conn.execute(
+        "INSERT INTO events (action, kind, digest, algorithm, original, keeper, reason, at) "
+        "VALUES ('binned', ?, ?, ?, ?, ?, ?, ?)",
+        (kind, digest, algorithm, original, os.path.abspath(keeper), reason, time.time())
+    )
+    conn.execute("UPDATE events SET entry_id = id WHERE id = ?", (cur.lastrowid,))
+    conn.commit()
+
+
+def binned_entries(conn: sqlite3.Connection, path_prefix: str = '',
+                   keeper_prefix: str = '', before: Optional[float] = None,
+                   ids=None) -> list:
+    """
+    Return the entries currently in the bin as dicts
+    {id, digest, algorithm, original, keeper, reason, at, kind}, oldest first.
+    Filters combine: original path under path_prefix, keeper under
+    keeper_prefix, binned before the `before` timestamp, entry id in ids.
+    """
+    sql = _BINNED
+    params = []
+    if path_prefix:
+        sql += " AND b.original >= ? AND b.original < ?"
+        params += _prefix_range(path_prefix)
+    if keeper_prefix:
+        sql += " AND b.keeper >= ? AND b.keeper < ?"
+        params += _prefix_range(keeper_prefix)
+    if before is not None:
+        sql += " AND b.at < ?"
+        params.append(before)
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return []
+        sql += f" AND b.id IN ({','.join('?' * len(ids))})"
+        params += ids
+    sql += " ORDER BY b.id"
+    keys = ('id', 'digest', 'algorithm', 'original', 'keeper', 'reason', 'at', 'kind')
+    return [dict(zip(keys, row)) for row in conn.execute(sql, params)]
+
+
+def _prefix_range(prefix: str) -> list:
+    """[low, high) bounds matching every path at or below prefix."""
+    low = os.path.join(os.path.abspath(prefix), '')
+    return [low, low[:-1] + chr(ord(low[-1]) + 1)]
+
+
+def _record(conn: sqlite3.Connection, action: str, entries: list) -> None:
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO events (entry_id, action, kind, digest, algorithm, original, keeper, reason, at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(e['id'], action, e['kind'], e['digest'], e['algorithm'], e['original'],
+          e['keeper'], e['reason'], now) for e in entries]
+    )
+    conn.commit()
+
+
+def _binned_counts(conn: sqlite3.Connection, entries) -> dict:
+    """{(digest, kind): number of entries still in the bin that refer to it}."""
+    counts = {}
+    for digest, kind in {(e['digest'], e['kind']) for e in entries}:
+        counts[digest, kind] = conn.execute(
+            f"SELECT COUNT(*) FROM ({_BINNED} AND b.digest = ? AND b.kind = ?)",
+            (digest, kind)
+        ).fetchone()[0]
+    return counts
+
+
+def _drop_orphan_objects(conn: sqlite3.Connection, holding_dir: str, entries) -> None:
+    """Delete stored objects that no entry still in the bin refers to."""
+    for (digest, kind), count in _binned_counts(conn, entries).items():
+        if count == 0:
+            obj = _object_path(holding_dir, digest, kind)
+            try:
+                if kind == 'tree':
+                    shutil.rmtree(obj)
+                else:
+                    os.remove(obj)
+            except OSError:
+                pass
+
+
+def restore(holding_dir: str, path_prefix: str = '', keeper_prefix: str = '',
+            before: Optional[float] = None, ids=None,
+            overwrite: bool = False) -> dict:
+    """
+    Put binned copies back at their original paths (see binned_entries for
+    the filters; no filter restores everything). A copy whose original path
+    is occupied is skipped unless overwrite=True (a directory is then merged
+    into the existing one).
+    Returns {restored, skipped, errors}.
+    """
+    conn = open_bin(holding_dir)
+    restored, skipped, errors = [], 0, 0
+    try:
+        entries = binned_entries(conn, path_prefix, keeper_prefix, before, ids)
+        users = _binned_counts(conn, entries)
+        for entry in entries:
+            key = (entry['digest'], entry['kind'])
+            obj = _object_path(holding_dir, *key)
+            original = entry['original']
+            occupied = os.path.exists(original)
+            if occupied and not overwrite:
+                skipped += 1
+                continue
+            try:
+                os.makedirs(os.path.dirname(original), exist_ok=True)
+                # The last entry using an object takes it; the others get copies
+                last = users[key] == 1
+                if entry['kind'] == 'tree':
+                    if last and not occupied:
+                        shutil.move(obj, original, copy_function=io_budget.copy_file)
+                    else:
+                        shutil.copytree(obj, original, dirs_exist_ok=True,
+                                        copy_function=io_budget.copy_file)
+                elif last:
+                    shutil.move(obj, original, copy_function=io_budget.copy_file)
+                else:
+                    io_budget.copy_file(obj, original)
+                users[key] -= 1
+                restored.append(entry)
+            except OSError as e:
+                print(f"[holding_bin] ERROR restoring {original!r}: {e}")
+                errors += 1
+        _record(conn, 'restored', restored)
+        _drop_orphan_objects(conn, holding_dir, restored)
+    finally:
+        close_bin(conn)
+    return {'restored': len(restored), 'skipped': skipped, 'errors': errors}
+
+
+def purge(holding_dir: str, path_prefix: str = '', keeper_prefix: str = '',
+          before: Optional[float] = None, ids=None) -> dict:
+    """
+    Permanently delete binned copies (see binned_entries for the filters;
+    no filter empties the bin). The manifest keeps their history.
+    Returns {purged}.
+    """
+    conn = open_bin(holding_dir)
+    try:
+        entries = binned_entries(conn, path_prefix, keeper_prefix, before, ids)
+        _record(conn, 'purged', entries)
+        _drop_orphan_objects(conn, holding_dir, entries)
+    finally:
+        close_bin(conn)
+    return {'purged': len(entries)}
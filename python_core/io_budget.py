@@ -0,0 +1,149 @@
+"""
+io_budget.py — Data Librarian
+==============================
+Keeps big background jobs from starving other users of the NAS.
+
+Bandwidth budget: with IO_BUDGET_MB_PER_SEC set (0 = unlimited), every
+byte hashed, copied by a move, or read and written by the PDF splitter
+draws from one token bucket shared by all threads of the process. A
+caller takes what it needs and, if the bucket is in debt, sleeps until
+the debt is paid back, so N hash workers together stay at the budget
+instead of each getting it. Bursts up to one second's worth pass freely.
+
+Readahead hints: advise_sequential() / advise_willneed() / advise_done()
+wrap posix_fadvise, telling the kernel (and NFS/SMB clients that honour
+it) to read ahead aggressively, to start fetching ranges we are about to
+read, and to drop pages of a file we are finished with, so a full scan
+doesn't push everyone else's working set out of the page cache. They are
+no-ops where posix_fadvise doesn't exist (macOS, Windows).
+
+Public API
+----------
+  TokenBucket(rate, burst)   — consume(n) blocks until n bytes are allowed
+  budget()                   -> TokenBucket | None (the shared one)
+  set_budget(mb_per_sec)     — replace the shared bucket (0 = unlimited)
+  throttle(nbytes)           — draw from the shared bucket, if any
+  copy_file(src, dst)        — shutil.copy2 under the budget
+  advise_sequential(fd) / advise_willneed(fd, offset, length) / advise_done(fd)
+"""
+
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+# Chunk size for budgeted copies
+_COPY_CHUNK = 1024 * 1024
+
+_UNSET = object()
+_shared = _UNSET
+_shared_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket in bytes. rate: bytes per second; burst:
+    bucket size in bytes (default one second of rate).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes: int) -> float:
+        """
+        Take nbytes, sleeping as long as the bucket is in debt afterwards.
+        Requests larger than the burst are allowed and simply wait longer.
+        Returns the seconds slept.
+        """
+        if nbytes <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= nbytes
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def set_budget(mb_per_sec: float) -> Optional[TokenBucket]:
+    """Replace the shared bucket; 0 or less turns the budget off."""
+    global _shared
+    with _shared_lock:
+        _shared = TokenBucket(mb_per_sec * 1024 * 1024) if mb_per_sec and mb_per_sec > 0 else None
+        return _shared
+
+
+def budget() -> Optional[TokenBucket]:
+    """The shared bucket, created from IO_BUDGET_MB_PER_SEC on first use."""
+    if _shared is _UNSET:
+        # utils imports this module, so it can't be imported at the top
+        from utils import config_value
+        set_budget(float(config_value('IO_BUDGET_MB_PER_SEC', 0) or 0))
+    return _shared
+
+
+def throttle(nbytes: int) -> None:
+    """Draw nbytes from the shared budget; returns at once when there is none."""
+    bucket = budget()
+    if bucket is not None:
+        bucket.consume(nbytes)
+
+
+def copy_file(src: str, dst: str) -> str:
+    """
+    shutil.copy2 that draws every chunk from the shared budget. Pass as
+    copy_function to shutil.move / copytree: only cross-device moves copy
+    data, so renames stay free. Without a budget this is shutil.copy2.
+    """
+    if budget() is None:
+        return shutil.copy2(src, dst)
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb') as fdst:
+        advise_sequential(fsrc.fileno())
+        buf = bytearray(_COPY_CHUNK)
+        view = memoryview(buf)
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            throttle(n)
+            fdst.write(view[:n])
+        advise_done(fsrc.fileno())
+    shutil.copystat(src, dst)
+    return dst
+
+
+def _fadvise(fd: int, offset: int, length: int, advice_name: str) -> None:
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass  # A hint only; some filesystems refuse it
+
+
+def advise_sequential(fd: int) -> None:
+    """Whole file will be read front to back: read ahead aggressively."""
+    _fadvise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+
+def advise_willneed(fd: int, offset: int, length: int) -> None:
+    """Start fetching this range now; the read comes shortly."""
+    _fadvise(fd, offset, length, 'POSIX_FADV_WILLNEED')
+
+
+def advise_done(fd: int) -> None:
+    """Finished with the file: let its pages go before anyone else's."""
+    _fadvise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
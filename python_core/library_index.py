@@ -17,17 +17,67 @@ against LIBRARY_MOUNT_PATH in config:
 
 Public API
 ----------
-  get_cached_hash(filepath, db_conn)  -> str | None
-  update_hash(filepath, sha256, db_conn)
-  open_index(scan_dir)                -> (conn | None, is_persistent)
-  close_index(conn, scan_dir)         — prunes stale rows then closes
+  get_cached_hash(filepath, db_conn, algorithm, st)  -> str | None
+  update_hash(filepath, digest, db_conn, algorithm, st)
+  open_index(scan_dir, preload_rows)  -> (conn | None, is_persistent)
+  preload(conn, scan_dir)             — bulk-load rows under another root
+  unload(conn)                        — stop holding rows in memory (huge scans)
+  batch_commit(conn)                  — flush buffered writes and commit
+  cached_listing(conn, dirpath, mtime) -> (files, subdirs) | None
+  find_by_digests(conn, scan_dir, digests, algorithm) -> {digest: [path]}
+  find_by_md5(conn, md5s, scan_dir)   -> {md5: [path]}
+  cached_md5(conn, filepath)          -> str | None
+  cached_block_tree(conn, filepath)   -> (block_size, file_size, blocks) | None
+  find_unhashed_by_size(conn, scan_dir, sizes, algorithm) -> {size: [path]}
+  record_listing(conn, dirpath, mtime, files, subdirs)
+  prune_unseen(conn, scan_dir)        — drop rows this run never saw
+  close_index(conn, scan_dir, prune)  — flushes, prunes unseen rows, closes
+
+Each open_index() starts a new scan generation. Rows the run looks up or
+writes are stamped with it, and pruning deletes unstamped rows under the
+scanned root in one statement instead of stat-ing every row.
+
+Rows also record (st_dev, st_ino). A file that isn't indexed under its
+current path but whose inode, size and mtime match an existing row was
+renamed or moved (organizer, file cleaner); its digest is reused and
+recorded under the new path instead of re-hashing.
+
+Rows written after a full hash also carry the file's MD5 (computed in the
+same read), so Anna's Archive IDs can be verified and looked up later
+without reading the file again.
+
+Files hashed as a block tree (utils.hash_file_tree) also store their block
+digests in block_tree, so after an append-only edit the next hash reuses
+them and reads only the new tail plus a few sample blocks.
+
+Directory listings (names, sizes, mtimes) are cached per directory along
+with the directory's mtime and file count. Incremental scans reuse the
+listing of any directory whose mtime hasn't changed instead of listing and
+stat-ing its files again.
+
+Lookups are served from an in-memory map loaded with one range query per
+scanned root, and writes are buffered and flushed with executemany(), so a
+fully cached rescan never touches SQLite per file. A scan over more files
+than that map should hold calls unload() instead: lookups then query
+SQLite, and every batch_commit() drops what the run has added to memory.
+
+Rows are keyed by utils.path_key() (absolute path, Unicode NFC), so a file
+reached under an NFD name (macOS, iCloud) and under its NFC name (the NAS
+from Linux) is one row. The on-disk spelling last seen is kept in disk_path
+(NULL when it equals the key), and every path this module returns is the
+on-disk one. Rows from older releases are re-keyed once by _migrate().
 """
 
+import json
 import os
 import sqlite3
 import time
+import unicodedata
+from collections import namedtuple
 from typing import Optional, Tuple
 
+from utils import path_key
+
 # Index database location
 _INDEX_DIR  = os.path.expanduser("~/.librarian")
 _INDEX_FILE = os.path.join(_INDEX_DIR, "library_index.db")
@@ -38,15 +88,209 @@ CREATE TABLE IF NOT EXISTS file_index (
     sha256      TEXT NOT NULL,
     file_size   INTEGER NOT NULL,
     mtime       REAL NOT NULL,
-    last_seen   REAL NOT NULL
+    last_seen   REAL NOT NULL,
+    algorithm   TEXT NOT NULL DEFAULT 'sha256',
+    scan_gen    INTEGER NOT NULL DEFAULT 0,
+    st_dev      INTEGER,
+    st_ino      INTEGER,
+    md5         TEXT,
+    disk_path   TEXT
+);
+"""
+
+# Small key/value table; holds the scan generation counter
+_CREATE_META = """
+CREATE TABLE IF NOT EXISTS index_meta (
+    key         TEXT PRIMARY KEY,
+    value       INTEGER NOT NULL
+);
+"""
+
+# Cached directory listings for incremental scans. listing is JSON:
+# {"files": [[name, size, mtime, dev, ino], ...], "dirs": [name, ...]}
+_CREATE_DIR_TABLE = """
+CREATE TABLE IF NOT EXISTS dir_index (
+    path        TEXT PRIMARY KEY,
+    mtime       REAL NOT NULL,
+    file_count  INTEGER NOT NULL,
+    listing     TEXT NOT NULL,
+    listed_at   REAL NOT NULL,
+    scan_gen    INTEGER NOT NULL DEFAULT 0,
+    disk_path   TEXT
+);
+"""
+
+# Per-block digests of files hashed with utils.hash_file_tree(); blocks is
+# the concatenated raw digests. Rows without a file_index row are pruned.
+_CREATE_TREE_TABLE = """
+CREATE TABLE IF NOT EXISTS block_tree (
+    path        TEXT PRIMARY KEY,
+    block_size  INTEGER NOT NULL,
+    file_size   INTEGER NOT NULL,
+    blocks      BLOB NOT NULL
 );
 """
 
 _CREATE_IDX = "CREATE INDEX IF NOT EXISTS idx_sha256 ON file_index (sha256);"
+_CREATE_INODE_IDX = "CREATE INDEX IF NOT EXISTS idx_inode ON file_index (st_dev, st_ino);"
+_CREATE_MD5_IDX = "CREATE INDEX IF NOT EXISTS idx_md5 ON file_index (md5);"
+
+# Stat fields recovered from a cached directory listing; quacks like the
+# subset of os.stat_result the index uses.
+CachedStat = namedtuple('CachedStat', 'st_size st_mtime st_dev st_ino')
+
+# Buffered writes are flushed automatically once this many are pending
+_FLUSH_EVERY = 1000
+
+# Maximum bound parameters per "IN (...)" query (SQLite's old default limit is 999)
+_IN_CHUNK = 500
+
+_UPSERT = """
+INSERT INTO file_index (path, sha256, file_size, mtime, last_seen, algorithm,
+                        scan_gen, st_dev, st_ino, md5, disk_path)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    md5       = CASE WHEN excluded.md5 IS NOT NULL THEN excluded.md5
+                     WHEN excluded.sha256 = file_index.sha256 THEN file_index.md5
+                END,
+    sha256    = excluded.sha256,
+    file_size = excluded.file_size,
+    mtime     = excluded.mtime,
+    last_seen = excluded.last_seen,
+    algorithm = excluded.algorithm,
+    scan_gen  = excluded.scan_gen,
+    st_dev    = excluded.st_dev,
+    st_ino    = excluded.st_ino,
+    disk_path = excluded.disk_path
+"""
+
+_TREE_UPSERT = """
+INSERT OR REPLACE INTO block_tree (path, block_size, file_size, blocks)
+VALUES (?, ?, ?, ?)
+"""
+
+_STAMP = "UPDATE file_index SET scan_gen = ?, last_seen = ?, disk_path = ? WHERE path = ?"
+
+_DIR_UPSERT = """
+INSERT INTO dir_index (path, mtime, file_count, listing, listed_at, scan_gen,
+                       disk_path)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    mtime      = excluded.mtime,
+    file_count = excluded.file_count,
+    listing    = excluded.listing,
+    listed_at  = excluded.listed_at,
+    scan_gen   = excluded.scan_gen,
+    disk_path  = excluded.disk_path
+"""
+
+_DIR_STAMP = "UPDATE dir_index SET scan_gen = ? WHERE path = ?"
+
+# A listing recorded within this many seconds of the directory's mtime is
+# never trusted: a change in the same coarse mtime tick (SMB/FAT) would be
+# invisible. Same idea as git's "racy" index entries.
+_RACY_WINDOW = 2.0
+
+# Columns added after the first release: name -> ALTER TABLE column spec.
+# Older databases are upgraded in place by _migrate().
+_ADDED_COLUMNS = {
+    'algorithm': "TEXT NOT NULL DEFAULT 'sha256'",
+    'scan_gen':  "INTEGER NOT NULL DEFAULT 0",
+    'st_dev':    "INTEGER",
+    'st_ino':    "INTEGER",
+    'md5':       "TEXT",
+    'disk_path': "TEXT",
+}
+_ADDED_DIR_COLUMNS = {
+    'disk_path': "TEXT",
+}
+
+# index_meta key recording that every path key is in NFC form
+_KEY_FORM = 'nfc_keys'
 
 
 # ── Internal helpers ──────────────────────────────────────────────────────────
 
+class _IndexConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that also carries the run's in-memory index state,
+    so the public functions keep their (filepath, conn) signatures.
+
+    cache           : key -> (digest, size, mtime, algorithm, dev, ino, md5, disk path)
+    inodes          : (dev, ino) -> key, for every row in cache
+    preloaded_roots : path prefixes fully loaded into cache; a path under
+                      one of these that isn't in cache is not in the index
+    pending         : upsert rows waiting for the next flush
+    seen            : (key, disk_path) of existing rows to stamp with this run's generation
+    dirs            : key -> (mtime, listing JSON, listed_at) from dir_index
+    dir_pending     : dir_index upserts waiting for the next flush
+    tree_pending    : block_tree upserts waiting for the next flush
+    dirs_seen       : dir_index paths to stamp with this run's generation
+    generation      : this run's scan generation (see prune_unseen)
+    unloaded        : set by unload(); batch_commit() then empties the maps above
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = {}
+        self.inodes = {}
+        self.preloaded_roots = []
+        self.pending = []
+        self.seen = []
+        self.dirs = {}
+        self.dir_pending = []
+        self.tree_pending = []
+        self.dirs_seen = []
+        self.generation = 0
+        self.unloaded = False
+
+
+def _prefix(scan_dir: str) -> str:
+    """Path key of a directory with a trailing separator."""
+    return os.path.join(path_key(scan_dir), '')
+
+
+def _disk(key: str, path: str) -> Optional[str]:
+    """disk_path column value: the on-disk path, or None if it is the key."""
+    return None if path == key else path
+
+
+def _is_preloaded(conn: _IndexConnection, path: str) -> bool:
+    return any(path.startswith(root) for root in conn.preloaded_roots)
+
+
+def _flush(conn: _IndexConnection) -> None:
+    """Write all buffered upserts and generation stamps in one executemany() each."""
+    if conn.pending:
+        conn.executemany(_UPSERT, conn.pending)
+        conn.pending.clear()
+    if conn.seen:
+        now = time.time()
+        conn.executemany(_STAMP, [(conn.generation, now, _disk(key, path), key)
+                                  for key, path in conn.seen])
+        conn.seen.clear()
+    if conn.dir_pending:
+        conn.executemany(_DIR_UPSERT, conn.dir_pending)
+        conn.dir_pending.clear()
+    if conn.dirs_seen:
+        conn.executemany(_DIR_STAMP, [(conn.generation, p) for p in conn.dirs_seen])
+        conn.dirs_seen.clear()
+    if conn.tree_pending:
+        conn.executemany(_TREE_UPSERT, conn.tree_pending)
+        conn.tree_pending.clear()
+
+
+def _next_generation(conn: _IndexConnection) -> int:
+    """Increment and return the persistent scan generation counter."""
+    conn.execute(
+        "INSERT INTO index_meta (key, value) VALUES ('scan_gen', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+    return conn.execute(
+        "SELECT value FROM index_meta WHERE key = 'scan_gen'"
+    ).fetchone()[0]
+
+
 def _is_persistent_path(scan_dir: str) -> bool:
     """Return True if scan_dir is inside the configured NAS mount point."""
     try:
@@ -55,38 +299,119 @@ def _is_persistent_path(scan_dir: str) -> bool:
         mount = getattr(cfg, 'LIBRARY_MOUNT_PATH', '').strip()
         if not mount:
             return False
-        return os.path.abspath(scan_dir).startswith(os.path.abspath(mount))
+        return path_key(scan_dir).startswith(path_key(mount))
     except Exception:
         return False
 
 
+def _nfc(path: Optional[str]) -> Optional[str]:
+    return unicodedata.normalize('NFC', path) if path is not None else None
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """
+    Add any columns missing from an index created by an older release, and
+    re-key rows stored under raw (possibly NFD) paths once. Where two rows
+    collapse onto one key, the re-keyed row replaces the other.
+    """
+    for table, columns in (('file_index', _ADDED_COLUMNS),
+                           ('dir_index', _ADDED_DIR_COLUMNS)):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, spec in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {spec}")
+
+    if conn.execute("SELECT 1 FROM index_meta WHERE key = ?", (_KEY_FORM,)).fetchone():
+        return
+    conn.create_function('nfc', 1, _nfc, deterministic=True)
+    for table in ('file_index', 'dir_index'):
+        conn.execute(f"UPDATE OR REPLACE {table} SET disk_path = path, path = nfc(path) "
+                     f"WHERE path != nfc(path)")
+    conn.execute("UPDATE OR REPLACE block_tree SET path = nfc(path) WHERE path != nfc(path)")
+    conn.execute("INSERT INTO index_meta (key, value) VALUES (?, 1)", (_KEY_FORM,))
+
+
 def _open_db() -> sqlite3.Connection:
     """Open (creating if needed) the persistent index database."""
     os.makedirs(_INDEX_DIR, exist_ok=True)
-    conn = sqlite3.connect(_INDEX_FILE, timeout=30)
+    conn = sqlite3.connect(_INDEX_FILE, timeout=30, factory=_IndexConnection)
     conn.execute("PRAGMA journal_mode=WAL;")   # safe for concurrent reads
     conn.execute("PRAGMA synchronous=NORMAL;")  # faster than FULL, still safe
     conn.execute(_CREATE_TABLE)
+    conn.execute(_CREATE_META)
+    conn.execute(_CREATE_DIR_TABLE)
+    conn.execute(_CREATE_TREE_TABLE)
+    _migrate(conn)
     conn.execute(_CREATE_IDX)
+    conn.execute(_CREATE_INODE_IDX)
+    conn.execute(_CREATE_MD5_IDX)
+    conn.generation = _next_generation(conn)
     conn.commit()
     return conn
 
 
-def _stat(filepath: str) -> Optional[Tuple[int, float]]:
-    """Return (size_bytes, mtime) or None if file is inaccessible."""
-    try:
-        st = os.stat(filepath)
-        return st.st_size, st.st_mtime
-    except OSError:
+def _stat(filepath: str, st=None) -> Optional[Tuple[int, float, int, int]]:
+    """
+    Return (size_bytes, mtime, st_dev, st_ino) or None if file is inaccessible.
+    Pass st (an os.stat_result the caller already has) to skip the stat call.
+    """
+    if st is None:
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+    return st.st_size, st.st_mtime, st.st_dev, st.st_ino
+
+
+def _remember(conn: _IndexConnection, key: str, row: tuple) -> None:
+    """Put a row in the in-memory cache and its inode map."""
+    conn.cache[key] = row
+    dev, ino = row[4], row[5]
+    if ino:
+        conn.inodes[(dev, ino)] = key
+
+
+# file_index columns of an in-memory cache row, in order
+_ROW_COLUMNS = ("sha256, file_size, mtime, algorithm, st_dev, st_ino, md5, "
+                "COALESCE(disk_path, path)")
+
+
+def _find_moved(conn: _IndexConnection, key: str, size: int, mtime: float,
+                dev: int, ino: int) -> Optional[tuple]:
+    """
+    Return the cached row of the same inode recorded under a different path,
+    if its size and mtime still match (rename/move within one filesystem
+    keeps both), otherwise None.
+    """
+    if not ino:
+        return None  # Filesystem doesn't report inode numbers
+    old_key = conn.inodes.get((dev, ino))
+    if old_key is not None:
+        row = conn.cache.get(old_key)
+    else:
+        found = conn.execute(
+            f"SELECT path, {_ROW_COLUMNS} FROM file_index WHERE st_dev = ? AND st_ino = ?",
+            (dev, ino)
+        ).fetchone()
+        row = found[1:] if found else None
+        old_key = found[0] if found else None
+    if row is None or old_key == key:
         return None
+    if row[1] != size or abs(row[2] - mtime) >= 0.01:
+        return None  # Inode number reused by a different file
+    return row
 
 
 # ── Public API ────────────────────────────────────────────────────────────────
 
-def open_index(scan_dir: str) -> Tuple[Optional[sqlite3.Connection], bool]:
+def open_index(scan_dir: str,
+               preload_rows: bool = True) -> Tuple[Optional[sqlite3.Connection], bool]:
     """
     Open an index connection appropriate for scan_dir.
 
+    In persistent mode every row under scan_dir is preloaded into memory,
+    unless preload_rows is False (callers that only run a few bulk queries).
+
     Returns:
         (conn, is_persistent)
         conn is None when running in ephemeral mode.
@@ -94,6 +419,8 @@ def open_index(scan_dir: str) -> Tuple[Optional[sqlite3.Connection], bool]:
     if _is_persistent_path(scan_dir):
         try:
             conn = _open_db()
+            if preload_rows:
+                preload(conn, scan_dir)
             return conn, True
         except Exception as e:
             print(f"[library_index] WARNING: could not open persistent index: {e}")
@@ -102,22 +429,118 @@ def open_index(scan_dir: str) -> Tuple[Optional[sqlite3.Connection], bool]:
     return None, False
 
 
-def close_index(conn: Optional[sqlite3.Connection], scan_dir: str = '') -> None:
+def preload(conn: Optional[sqlite3.Connection], scan_dir: str) -> int:
+    """
+    Load every index row under scan_dir into the connection's in-memory map
+    with a single range query on the primary key. Later lookups for paths
+    under scan_dir are dictionary hits. Returns the number of rows loaded.
+    No-op in ephemeral mode (conn is None).
+    """
+    if conn is None or conn.unloaded:
+        return 0
+    prefix = _prefix(scan_dir)
+    if _is_preloaded(conn, prefix):
+        return 0
+    # Every path starting with prefix sorts in [prefix, prefix-with-next-char)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    try:
+        rows = conn.execute(
+            f"SELECT path, {_ROW_COLUMNS} FROM file_index WHERE path >= ? AND path < ?",
+            (prefix, upper)
+        )
+        loaded = 0
+        for key, *row in rows:
+            _remember(conn, key, tuple(row))
+            loaded += 1
+        # The root directory itself sorts just before prefix; fetch it too
+        dir_rows = conn.execute(
+            "SELECT path, mtime, listing, listed_at FROM dir_index "
+            "WHERE (path >= ? AND path < ?) OR path = ?",
+            (prefix, upper, prefix[:-1])
+        )
+        for path, mtime, listing, listed_at in dir_rows:
+            conn.dirs[path] = (mtime, listing, listed_at)
+        conn.preloaded_roots.append(prefix)
+        return loaded
+    except Exception as e:
+        print(f"[library_index] WARNING: could not preload index for {scan_dir!r}: {e}")
+        return 0
+
+
+def unload(conn: Optional[sqlite3.Connection]) -> None:
+    """
+    Flush and commit, then drop every row held in memory, preloaded or
+    remembered. From here on lookups query SQLite, preload() does nothing,
+    and each batch_commit() drops the rows added since the last one, so
+    memory use no longer grows with the number of files looked up.
+    No-op in ephemeral mode (conn is None).
     """
-    Prune rows for files that no longer exist on disk, then close the connection.
+    if conn is None:
+        return
+    batch_commit(conn)
+    conn.unloaded = True
+    _forget_rows(conn)
+
+
+def _forget_rows(conn: _IndexConnection) -> None:
+    """Empty the in-memory maps; everything in them is already in SQLite."""
+    conn.cache.clear()
+    conn.inodes.clear()
+    conn.dirs.clear()
+    conn.preloaded_roots.clear()
+
+
+def prune_unseen(conn: Optional[sqlite3.Connection], scan_dir: str) -> int:
+    """
+    Delete rows under scan_dir that this run never stamped — files that were
+    deleted, moved away or excluded since the last scan. One DELETE on the
+    primary-key range; no filesystem access. Call only after a complete scan
+    of scan_dir. Returns the number of rows removed.
+    No-op in ephemeral mode (conn is None).
+    """
+    if conn is None or not scan_dir:
+        return 0
+    prefix = _prefix(scan_dir)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    try:
+        _flush(conn)
+        pruned = conn.execute(
+            "DELETE FROM file_index WHERE path >= ? AND path < ? AND scan_gen < ?",
+            (prefix, upper, conn.generation)
+        ).rowcount
+        conn.execute(
+            "DELETE FROM dir_index WHERE path >= ? AND path < ? AND scan_gen < ?",
+            (prefix, upper, conn.generation)
+        )
+        conn.execute(
+            "DELETE FROM block_tree WHERE path >= ? AND path < ? AND path NOT IN "
+            "(SELECT path FROM file_index WHERE path >= ? AND path < ?)",
+            (prefix, upper, prefix, upper)
+        )
+        conn.commit()
+        if pruned:
+            print(f"[library_index] Pruned {pruned} stale entries from index.")
+        return pruned
+    except Exception as e:
+        print(f"[library_index] WARNING: error during index cleanup: {e}")
+        return 0
+
+
+def close_index(conn: Optional[sqlite3.Connection], scan_dir: str = '',
+                prune: bool = True) -> None:
+    """
+    Flush pending writes, prune rows under scan_dir that this run didn't see
+    (see prune_unseen), then close the connection. Pass prune=False when the
+    scan was cancelled — unseen rows may simply not have been reached yet.
     Only meaningful in persistent mode (conn is not None).
     """
     if conn is None:
         return
     try:
-        # Prune stale rows — files deleted since last run
-        cursor = conn.execute("SELECT path FROM file_index")
-        stale = [row[0] for row in cursor if not os.path.isfile(row[0])]
-        if stale:
-            conn.executemany("DELETE FROM file_index WHERE path = ?",
-                             [(p,) for p in stale])
-            conn.commit()
-            print(f"[library_index] Pruned {len(stale)} stale entries from index.")
+        _flush(conn)
+        conn.commit()
+        if prune:
+            prune_unseen(conn, scan_dir)
     except Exception as e:
         print(f"[library_index] WARNING: error during index cleanup: {e}")
     finally:
@@ -128,31 +551,65 @@ def close_index(conn: Optional[sqlite3.Connection], scan_dir: str = '') -> None:
 
 
 def get_cached_hash(filepath: str,
-                    conn: Optional[sqlite3.Connection]) -> Optional[str]:
+                    conn: Optional[sqlite3.Connection],
+                    algorithm: str = 'sha256',
+                    st=None) -> Optional[str]:
     """
-    Return the cached SHA-256 for filepath if the file is unchanged
-    (same size and mtime as stored), otherwise return None.
+    Return the cached digest for filepath if the file is unchanged
+    (same size and mtime as stored) and was hashed with `algorithm`,
+    otherwise return None.
 
+    st: optional os.stat_result for filepath, saving a stat call.
     Always returns None in ephemeral mode (conn is None).
     """
     if conn is None:
         return None
 
-    stat = _stat(filepath)
+    stat = _stat(filepath, st)
     if stat is None:
         return None
-    size, mtime = stat
+    size, mtime, dev, ino = stat
 
+    path = os.path.abspath(filepath)
+    key = path_key(path)
     try:
-        row = conn.execute(
-            "SELECT sha256, file_size, mtime FROM file_index WHERE path = ?",
-            (os.path.abspath(filepath),)
-        ).fetchone()
+        row = conn.cache.get(key)
+        if row is None and not _is_preloaded(conn, key):
+            found = conn.execute(
+                f"SELECT {_ROW_COLUMNS} FROM file_index WHERE path = ?",
+                (key,)
+            ).fetchone()
+            row = tuple(found) if found else None
+            if row is not None:
+                _remember(conn, key, row)   # for cached_md5() and update_hash()
+
+        if row is not None and row[7] != path and row[5] and ino and row[5] != ino:
+            # Another spelling of the name and another inode: two files whose
+            # names differ only in normalization. Treat this one as new.
+            return None
 
         if row is None:
-            return None  # Not in index yet
-
-        cached_hash, cached_size, cached_mtime = row
+            # Not indexed under this path — maybe it was renamed or moved
+            row = _find_moved(conn, key, size, mtime, dev, ino)
+            if row is None or row[3] != algorithm:
+                return None  # Not in index yet
+            # Record the known hash under the new path; the old row is
+            # dropped by this run's prune if nothing sees it any more
+            _remember(conn, key, row[:7] + (path,))
+            conn.pending.append((key, row[0], size, mtime, time.time(),
+                                 algorithm, conn.generation, dev, ino, row[6],
+                                 _disk(key, path)))
+            return row[0]
+
+        # The file exists and has a row — keep it through this run's prune
+        # (recording the spelling it was found under this time)
+        conn.seen.append((key, path))
+        if row[7] != path:
+            _remember(conn, key, row[:7] + (path,))
+
+        cached_hash, cached_size, cached_mtime, cached_algorithm = row[:4]
+        if cached_algorithm != algorithm:
+            return None  # Hashed with another algorithm — digests aren't comparable
 
         # Tolerate floating-point mtime imprecision (sub-millisecond)
         if cached_size == size and abs(cached_mtime - mtime) < 0.01:
@@ -166,45 +623,261 @@ def get_cached_hash(filepath: str,
 
 
 def update_hash(filepath: str, sha256: str,
-                conn: Optional[sqlite3.Connection]) -> None:
+                conn: Optional[sqlite3.Connection],
+                algorithm: str = 'sha256',
+                st=None, md5: Optional[str] = None,
+                tree: Optional[Tuple[int, bytes]] = None) -> None:
     """
     Insert or update the index entry for filepath.
+    sha256 is the digest produced by `algorithm` (the column predates
+    selectable algorithms and keeps its name for compatibility).
+    md5: the file's MD5 if it was computed in the same read; without it a
+    stored MD5 is kept only while the digest is unchanged.
+    tree: (block_size, blocks) from utils.hash_file_tree(), stored for
+    cached_block_tree().
+    The write is buffered until the next batch_commit() / close_index().
+    st: optional os.stat_result for filepath, saving a stat call.
     No-op in ephemeral mode (conn is None).
     """
     if conn is None:
         return
 
-    stat = _stat(filepath)
+    stat = _stat(filepath, st)
     if stat is None:
         return
-    size, mtime = stat
+    size, mtime, dev, ino = stat
+
+    path = os.path.abspath(filepath)
+    key = path_key(path)
+    if md5 is None:
+        old = conn.cache.get(key)
+        if old is not None:
+            old = old[0], old[6]
+        elif conn.unloaded:
+            # A row not in memory has already been written
+            old = conn.execute("SELECT sha256, md5 FROM file_index WHERE path = ?",
+                               (key,)).fetchone()
+        if old is not None and old[0] == sha256:
+            md5 = old[1]
+    _remember(conn, key, (sha256, size, mtime, algorithm, dev, ino, md5, path))
+    conn.pending.append((key, sha256, size, mtime, time.time(), algorithm,
+                         conn.generation, dev, ino, md5, _disk(key, path)))
+    if tree is not None:
+        conn.tree_pending.append((key, tree[0], size, tree[1]))
+    if len(conn.pending) + len(conn.seen) >= _FLUSH_EVERY:
+        try:
+            _flush(conn)
+        except Exception as e:
+            print(f"[library_index] WARNING: could not update index: {e}")
+
 
+def cached_block_tree(conn: Optional[sqlite3.Connection],
+                      filepath: str) -> Optional[Tuple[int, int, bytes]]:
+    """
+    Return (block_size, file_size, blocks) last stored for filepath by
+    update_hash(..., tree=), whether or not the file has changed since —
+    utils.hash_file_tree() decides what is still usable. None if there is
+    none or in ephemeral mode (conn is None).
+    """
+    if conn is None:
+        return None
     try:
-        conn.execute(
-            """
-            INSERT INTO file_index (path, sha256, file_size, mtime, last_seen)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(path) DO UPDATE SET
-                sha256    = excluded.sha256,
-                file_size = excluded.file_size,
-                mtime     = excluded.mtime,
-                last_seen = excluded.last_seen
-            """,
-            (os.path.abspath(filepath), sha256, size, mtime, time.time())
+        _flush(conn)
+        row = conn.execute(
+            "SELECT block_size, file_size, blocks FROM block_tree WHERE path = ?",
+            (path_key(filepath),)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"[library_index] WARNING: block tree lookup failed for {filepath!r}: {e}")
+        return None
+    return (row[0], row[1], bytes(row[2])) if row else None
+
+
+def cached_listing(conn: Optional[sqlite3.Connection], dirpath: str,
+                   dir_mtime: float) -> Optional[Tuple[list, list]]:
+    """
+    Return (files, subdirs) from the last recorded listing of dirpath if the
+    directory's mtime hasn't changed since, otherwise None.
+    files is a list of (name, CachedStat); subdirs a list of names.
+
+    A directory's mtime only changes when entries are added, removed or
+    renamed in it, so a trusted listing can miss files edited in place —
+    that is the trade-off incremental scans accept.
+    Always returns None in ephemeral mode (conn is None).
+    """
+    if conn is None:
+        return None
+    key = path_key(dirpath)
+    row = conn.dirs.get(key)
+    if row is None and not _is_preloaded(conn, key + os.sep):
+        found = conn.execute(
+            "SELECT mtime, listing, listed_at FROM dir_index WHERE path = ?",
+            (key,)
+        ).fetchone()
+        row = tuple(found) if found else None
+    if row is None:
+        return None
+    mtime, listing, listed_at = row
+    if mtime != dir_mtime or listed_at - mtime < _RACY_WINDOW:
+        return None
+    try:
+        data = json.loads(listing)
+    except ValueError:
+        return None
+    conn.dirs_seen.append(key)
+    files = [(name, CachedStat(size, f_mtime, dev, ino))
+             for name, size, f_mtime, dev, ino in data['files']]
+    return files, data['dirs']
+
+
+def record_listing(conn: Optional[sqlite3.Connection], dirpath: str,
+                   dir_mtime: float, files: list, subdirs: list) -> None:
+    """
+    Store a fresh listing of dirpath for later incremental scans.
+    files is a list of (name, stat) where stat has st_size/st_mtime/st_dev/
+    st_ino; subdirs a list of names. Buffered like update_hash().
+    No-op in ephemeral mode (conn is None).
+    """
+    if conn is None:
+        return
+    path = os.path.abspath(dirpath)
+    key = path_key(path)
+    listing = json.dumps({
+        'files': [[name, st.st_size, st.st_mtime, st.st_dev, st.st_ino]
+                  for name, st in files],
+        'dirs': subdirs,
+    })
+    now = time.time()
+    conn.dirs[key] = (dir_mtime, listing, now)
+    conn.dir_pending.append((key, dir_mtime, len(files), listing, now,
+                             conn.generation, _disk(key, path)))
+
+
+def find_by_digests(conn: Optional[sqlite3.Connection], scan_dir: str,
+                    digests, algorithm: str = 'sha256') -> dict:
+    """
+    Return {digest: [path, ...]} for indexed files under scan_dir whose
+    digest is in `digests`, using bulk "sha256 IN (...)" queries on
+    idx_sha256. Reads only the database, never the files.
+    Always returns {} in ephemeral mode (conn is None).
+    """
+    if conn is None:
+        return {}
+    _flush(conn)
+    prefix = _prefix(scan_dir)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    digests = list(digests)
+    found = {}
+    for i in range(0, len(digests), _IN_CHUNK):
+        chunk = digests[i:i + _IN_CHUNK]
+        marks = ','.join('?' * len(chunk))
+        rows = conn.execute(
+            f"SELECT sha256, COALESCE(disk_path, path) FROM file_index WHERE sha256 IN ({marks}) "
+            f"AND algorithm = ? AND path >= ? AND path < ?",
+            (*chunk, algorithm, prefix, upper)
         )
-        # Commit in batches — caller commits periodically via batch_commit()
-    except Exception as e:
-        print(f"[library_index] WARNING: could not update index for {filepath!r}: {e}")
+        for digest, path in rows:
+            found.setdefault(digest, []).append(path)
+    return found
+
+
+def cached_md5(conn: Optional[sqlite3.Connection], filepath: str) -> Optional[str]:
+    """
+    MD5 stored for filepath by an earlier full hash, or None. Only
+    meaningful right after get_cached_hash() returned a digest for it.
+    """
+    if conn is None:
+        return None
+    row = conn.cache.get(path_key(filepath))
+    return row[6] if row is not None else None
+
+
+def find_by_md5(conn: Optional[sqlite3.Connection], md5s,
+                scan_dir: str = '') -> dict:
+    """
+    Return {md5: [path, ...]} for indexed files whose MD5 is in `md5s`
+    (e.g. Anna's Archive IDs), optionally limited to files under scan_dir.
+    Reads only the database. Always returns {} in ephemeral mode.
+    """
+    if conn is None:
+        return {}
+    _flush(conn)
+    where, bounds = '', ()
+    if scan_dir:
+        prefix = _prefix(scan_dir)
+        where = " AND path >= ? AND path < ?"
+        bounds = (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    md5s = [m.lower() for m in md5s]
+    found = {}
+    for i in range(0, len(md5s), _IN_CHUNK):
+        chunk = md5s[i:i + _IN_CHUNK]
+        marks = ','.join('?' * len(chunk))
+        for md5, path in conn.execute(
+                f"SELECT md5, COALESCE(disk_path, path) FROM file_index "
+                f"WHERE md5 IN ({marks}){where}",
+                (*chunk, *bounds)):
+            found.setdefault(md5, []).append(path)
+    return found
+
+
+def find_unhashed_by_size(conn: Optional[sqlite3.Connection], scan_dir: str,
+                          sizes, algorithm: str = 'sha256') -> dict:
+    """
+    Return {size: [path, ...]} for files under scan_dir that appear in a
+    recorded directory listing with one of `sizes` but have no `algorithm`
+    digest in the index (e.g. skipped by deDupe's unique-size stage).
+    Reads only the database, never the files.
+    Always returns {} in ephemeral mode (conn is None).
+    """
+    if conn is None:
+        return {}
+    _flush(conn)
+    sizes = set(sizes)
+    prefix = _prefix(scan_dir)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    candidates = {}   # key -> (on-disk path, size)
+    rows = conn.execute(
+        "SELECT path, COALESCE(disk_path, path), listing FROM dir_index "
+        "WHERE (path >= ? AND path < ?) OR path = ?",
+        (prefix, upper, prefix[:-1])
+    )
+    for dir_key, dirpath, listing in rows:
+        try:
+            files = json.loads(listing)['files']
+        except (ValueError, KeyError):
+            continue
+        for name, size, *_ in files:
+            if size in sizes:
+                key = os.path.join(dir_key, unicodedata.normalize('NFC', name))
+                candidates[key] = (os.path.join(dirpath, name), size)
+
+    keys = list(candidates)
+    for i in range(0, len(keys), _IN_CHUNK):
+        chunk = keys[i:i + _IN_CHUNK]
+        marks = ','.join('?' * len(chunk))
+        for (key,) in conn.execute(
+                f"SELECT path FROM file_index WHERE path IN ({marks}) AND algorithm = ?",
+                (*chunk, algorithm)):
+            candidates.pop(key, None)
+
+    found = {}
+    for path, size in candidates.values():
+        found.setdefault(size, []).append(path)
+    return found
 
 
 def batch_commit(conn: Optional[sqlite3.Connection]) -> None:
-    """Commit pending writes. Call every N files to avoid large transactions."""
+    """Flush buffered writes and commit. Call every N files to avoid large transactions."""
     if conn is None:
         return
     try:
+        _flush(conn)
         conn.commit()
     except Exception as e:
         print(f"[library_index] WARNING: commit failed: {e}")
+        return
+    if conn.unloaded:
+        _forget_rows(conn)
 
 
 def index_stats(conn: Optional[sqlite3.Connection]) -> dict:
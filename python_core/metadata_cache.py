@@ -0,0 +1,233 @@
+"""
+metadata_cache.py — Data Librarian
+====================================
+Cache of parsed embedded metadata (metadata_handler's EMPTY_XMP-shaped
+records), so organize runs, the metadata panel and cleaner previews don't
+open files that haven't changed since they were last read.
+
+A record is keyed by utils.path_key() and stays valid while the file's
+size and mtime match the ones stored with it; a changed file is a miss and
+is read and stored again. metadata_handler.write_metadata() refreshes the
+record of every file it writes, and the organizer carries records along
+when it moves files.
+
+Two layers:
+  in-process  — LRU map of the last METADATA_CACHE_ENTRIES records
+                (default 5000), shared by every thread
+  persistent  — metadata_cache table in the library index database
+                (~/.librarian/library_index.db), for files inside
+                LIBRARY_MOUNT_PATH only, like the hash index
+
+As with the hash index, size + mtime is the whole test: an edit that keeps
+both (same length, same mtime tick) isn't noticed.
+
+Public API
+----------
+  fingerprint(path)     -> (size, mtime) | None
+  get(path, fp)         -> xmp | None
+  get_many(items)       -> {path: xmp}          items: [(path, fp)]
+  put(path, fp, xmp)
+  put_many(items)                               items: [(path, fp, xmp)]
+  move(src, dst)        — re-key a record after a rename or move
+  forget(path)
+  clear_memory()        — drop the in-process layer (tests, config reload)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import library_index
+from utils import config_value, path_key
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS metadata_cache (
+    path        TEXT PRIMARY KEY,
+    file_size   INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    xmp         TEXT NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT OR REPLACE INTO metadata_cache (path, file_size, mtime, xmp)
+VALUES (?, ?, ?, ?)
+"""
+
+# Maximum bound parameters per "IN (...)" query
+_IN_CHUNK = 500
+
+_lock = threading.Lock()
+_memory = OrderedDict()   # key -> (size, mtime, xmp JSON)
+_db = None                # sqlite3 connection, False once opening failed
+
+
+def _connection() -> Optional[sqlite3.Connection]:
+    """The process's connection to the index database, opened on first use. Call under _lock."""
+    global _db
+    if _db is None:
+        try:
+            os.makedirs(library_index._INDEX_DIR, exist_ok=True)
+            conn = sqlite3.connect(library_index._INDEX_FILE, timeout=30,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(_CREATE_TABLE)
+            conn.commit()
+            _db = conn
+        except Exception as e:
+            print(f"[metadata_cache] WARNING: persistent cache unavailable: {e}")
+            _db = False
+    return _db or None
+
+
+def _persistent(key: str) -> bool:
+    return library_index._is_persistent_path(key)
+
+
+def _fresh(row: tuple, fp: Tuple[int, float]) -> bool:
+    """True if a (size, mtime, xmp) row still describes the file."""
+    return row[0] == fp[0] and abs(row[1] - fp[1]) < 0.01
+
+
+def _remember(key: str, row: tuple) -> None:
+    """Put a row in the LRU map, evicting the least recently used. Call under _lock."""
+    _memory[key] = row
+    _memory.move_to_end(key)
+    limit = max(0, int(config_value('METADATA_CACHE_ENTRIES', 5000) or 0))
+    while len(_memory) > limit:
+        _memory.popitem(last=False)
+
+
+def fingerprint(path: str) -> Optional[Tuple[int, float]]:
+    """(size, mtime) of the file, or None if it can't be stat-ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime
+
+
+def get(path: str, fp: Optional[Tuple[int, float]]) -> Optional[dict]:
+    """The cached record for path if it matches fp (see fingerprint), else None."""
+    return get_many([(path, fp)]).get(path)
+
+
+def get_many(items) -> dict:
+    """
+    {path: xmp} for every (path, fp) in items with a fresh cached record.
+    Misses are looked up in the persistent layer with one query per
+    _IN_CHUNK paths. Each xmp is a new dict the caller may modify.
+    """
+    found = {}
+    wanted = {}   # key -> (path, fp) still to look up on disk
+    with _lock:
+        for path, fp in items:
+            if fp is None:
+                continue
+            key = path_key(path)
+            row = _memory.get(key)
+            if row is not None and _fresh(row, fp):
+                _memory.move_to_end(key)
+                found[path] = json.loads(row[2])
+            elif _persistent(key):
+                wanted[key] = (path, fp)
+
+        conn = _connection() if wanted else None
+        keys = list(wanted)
+        for i in range(0, len(keys) if conn else 0, _IN_CHUNK):
+            chunk = keys[i:i + _IN_CHUNK]
+            try:
+                rows = conn.execute(
+                    "SELECT path, file_size, mtime, xmp FROM metadata_cache "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"[metadata_cache] WARNING: lookup failed: {e}")
+                break
+            for key, *row in rows:
+                path, fp = wanted[key]
+                if _fresh(row, fp):
+                    _remember(key, tuple(row))
+                    found[path] = json.loads(row[2])
+    return found
+
+
+def put(path: str, fp: Optional[Tuple[int, float]], xmp: dict) -> None:
+    """Store xmp for path as read while the file matched fp."""
+    put_many([(path, fp, xmp)])
+
+
+def put_many(items) -> None:
+    """
+    Store each (path, fp, xmp); fp must be taken before the file was read,
+    so an edit made during the read leaves a stale fp and a later miss.
+    Persistent rows are written with one executemany() and one commit.
+    """
+    rows = []
+    with _lock:
+        for path, fp, xmp in items:
+            if fp is None:
+                continue
+            key = path_key(path)
+            row = (fp[0], fp[1], json.dumps(xmp))
+            _remember(key, row)
+            if _persistent(key):
+                rows.append((key,) + row)
+        conn = _connection() if rows else None
+        if conn is not None:
+            try:
+                conn.executemany(_UPSERT, rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"[metadata_cache] WARNING: could not store metadata: {e}")
+
+
+def move(src: str, dst: str) -> None:
+    """
+    Re-key src's record under dst after a rename or move (both keep size
+    and mtime, so the record stays valid there).
+    """
+    src_key, dst_key = path_key(src), path_key(dst)
+    with _lock:
+        row = _memory.pop(src_key, None)
+        conn = _connection() if _persistent(src_key) or _persistent(dst_key) else None
+        try:
+            if conn is not None and row is None and _persistent(src_key):
+                found = conn.execute(
+                    "SELECT file_size, mtime, xmp FROM metadata_cache WHERE path = ?",
+                    (src_key,)
+                ).fetchone()
+                row = tuple(found) if found else None
+            if conn is not None:
+                conn.execute("DELETE FROM metadata_cache WHERE path IN (?, ?)", (src_key, dst_key))
+                if row is not None and _persistent(dst_key):
+                    conn.execute(_UPSERT, (dst_key,) + row)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"[metadata_cache] WARNING: could not move cached metadata: {e}")
+        if row is not None:
+            _remember(dst_key, row)
+
+
+def forget(path: str) -> None:
+    """Drop any record for path from both layers."""
+    key = path_key(path)
+    with _lock:
+        _memory.pop(key, None)
+        conn = _connection() if _persistent(key) else None
+        if conn is not None:
+            try:
+                conn.execute("DELETE FROM metadata_cache WHERE path = ?", (key,))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"[metadata_cache] WARNING: could not drop cached metadata: {e}")
+
+
+def clear_memory() -> None:
+    """Empty the in-process layer; the persistent one is untouched."""
+    with _lock:
+        _memory.clear()
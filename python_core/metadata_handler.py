@@ -3,24 +3,47 @@ metadata_handler.py
 ====================
 Read and write embedded metadata for the Data Librarian.
 
-Read strategy  : EPUB → direct OPF parse (lxml), supplemented by exiftool
+Read strategy  : EPUB → direct OPF parse (lxml, one ZIP open); exiftool
+                 only if the OPF lacks title or creator
                  All others → exiftool -json -a -G1
-Write strategy : EPUB → surgical OPF patch inside ZIP (preserves file integrity)
+                 Many files → read_metadata_many(): one exiftool call per
+                 batch of paths, EPUB OPFs parsed alongside on threads
+Write strategy : EPUB → surgical OPF patch inside ZIP (preserves file integrity);
+                 other members are copied still compressed (zip_rewrite.py)
                  PDF / DOCX / MOBI / AZW3 / CBZ / others → exiftool -overwrite_original
 
+exiftool runs as a small pool of -stay_open processes (exiftool_pool.py),
+so a call doesn't pay the Perl startup each time.
+
+Reads go through metadata_cache.py: a file whose size and mtime haven't
+changed since it was last read isn't opened again. Only complete reads are
+cached — exiftool returned a record, or the EPUB's OPF had everything — so
+exiftool_covered() can tell from the cache alone. write_metadata()
+refreshes the cached record of the file it writes.
+
 Requires: exiftool >= 10, lxml, (zipfile + os in stdlib)
 """
 
-import subprocess
+import itertools
 import json
 import os
 import zipfile
 import shutil
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree
 
+import metadata_cache
+from exiftool_pool import shared_pool
+from zip_rewrite import replace_member
+
 EXIFTOOL = shutil.which('exiftool') or 'exiftool'
 
+# Paths per exiftool -json call in read_metadata_many()
+BATCH_SIZE = 100
+
 # XML namespaces
 DC  = 'http://purl.org/dc/elements/1.1/'
 OPF = 'http://www.idpf.org/2007/opf'
@@ -56,32 +79,64 @@ FIELD_ALIASES = {
 # ─────────────────────────── exiftool helpers ────────────────────────────────
 
 def _run_exiftool(args, timeout=30):
-    """Run exiftool; return (stdout, stderr, returncode). Never raises."""
-    try:
-        r = subprocess.run(
-            [EXIFTOOL] + args,
-            capture_output=True, text=True, timeout=timeout
-        )
-        return r.stdout, r.stderr, r.returncode
-    except FileNotFoundError:
-        return '', 'exiftool not found in PATH', 1
-    except subprocess.TimeoutExpired:
-        return '', 'exiftool timed out', 1
+    """Run exiftool on a pooled worker; return (stdout, stderr, returncode). Never raises."""
+    return shared_pool(EXIFTOOL).run(args, timeout)
 
 
 def _exiftool_read(full_path):
-    """Return a flat tag→value dict from exiftool -json -a -G1."""
+    """
+    Return a flat tag→value dict from exiftool -json -a -G1, {} if it
+    returned no record for the file, or None if it gave no answer at all
+    (not installed, timed out, crashed). Only a non-empty dict is cached.
+    """
     stdout, _, rc = _run_exiftool(['-json', '-a', '-G1', full_path])
-    if rc != 0 or not stdout.strip():
+    if not stdout.strip():
+        return None if rc != 0 else {}
+    if rc != 0:
         return {}
     try:
         records = json.loads(stdout)
     except json.JSONDecodeError:
-        return {}
+        return None
     if not records:
         return {}
-    raw = records[0]
-    # Build flat dict with BOTH "XMP-dc:Title" and short "Title" keys
+    return _flatten(records[0])
+
+
+def _exiftool_read_many(paths):
+    """
+    Return {path: flat tag→value dict} for a batch of paths from a single
+    exiftool -json call. As in _exiftool_read, files exiftool couldn't read
+    map to {} and files it never answered for to None. If the whole call
+    fails (timeout, crash), each path is read on its own so one bad file
+    doesn't blank the batch.
+    """
+    if not paths:
+        return {}
+    if len(paths) == 1:
+        return {paths[0]: _exiftool_read(paths[0])}
+    # exiftool's usual 30 s, plus a second per file in the batch
+    stdout, _, rc = _run_exiftool(['-json', '-a', '-G1'] + list(paths),
+                                  timeout=30 + len(paths))
+    try:
+        records = json.loads(stdout) if stdout.strip() else []
+    except json.JSONDecodeError:
+        records = None
+    if records is None or (not records and rc != 0):
+        return {p: _exiftool_read(p) for p in paths}
+
+    # SourceFile echoes the path as given (Windows turns \ into /)
+    wanted = {os.path.normpath(p): p for p in paths}
+    result = {p: None if rc != 0 else {} for p in paths}
+    for raw in records:
+        path = wanted.get(os.path.normpath(str(raw.get('SourceFile', ''))))
+        if path is not None and 'ExifTool:Error' not in raw:
+            result[path] = _flatten(raw)
+    return result
+
+
+def _flatten(raw):
+    """Flat dict with BOTH "XMP-dc:Title" and short "Title" keys for one record."""
     flat = {}
     for k, v in raw.items():
         flat[k] = v
@@ -121,11 +176,29 @@ def _to_str(val):
 
 # ─────────────────────────── EPUB helpers ────────────────────────────────────
 
-def _epub_opf_path(epub_path):
-    """Return the OPF full-path string from META-INF/container.xml."""
-    with zipfile.ZipFile(epub_path, 'r') as z:
-        container_xml = z.read('META-INF/container.xml')
-    tree = etree.fromstring(container_xml)
+# exiftool reads EPUB metadata from the same OPF, so once the OPF has been
+# parsed it can only help where our parser missed the markup. A title and a
+# creator mean it didn't; exiftool is asked only when one of them is blank.
+_EPUB_REQUIRED = ('title', 'creator')
+
+_parsers = threading.local()
+
+
+def _xml_parser():
+    """
+    This thread's lxml parser, reused for every container.xml and OPF it
+    reads. Entities aren't resolved and nothing is fetched from the network.
+    """
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        parser = etree.XMLParser(resolve_entities=False, no_network=True)
+        _parsers.parser = parser
+    return parser
+
+
+def _opf_path_in(z):
+    """Return the OPF full-path string from META-INF/container.xml of an open ZipFile."""
+    tree = etree.fromstring(z.read('META-INF/container.xml'), _xml_parser())
     rootfiles = tree.findall(f'.//{{{CONTAINER_NS}}}rootfile')
     if rootfiles:
         return rootfiles[0].get('full-path')
@@ -133,35 +206,47 @@ def _epub_opf_path(epub_path):
 
 
 def _epub_read_metadata(epub_path):
-    """Extract metadata from EPUB OPF. Returns a partial xmp dict."""
-    opf_path = _epub_opf_path(epub_path)
-    if not opf_path:
-        return {}
+    """
+    Extract metadata from EPUB OPF. Returns a partial xmp dict.
+    The archive is opened once for both container.xml and the OPF, and
+    only the OPF's <metadata> element is walked, once.
+    """
     with zipfile.ZipFile(epub_path, 'r') as z:
+        opf_path = _opf_path_in(z)
+        if not opf_path:
+            return {}
         opf_data = z.read(opf_path)
-    tree = etree.fromstring(opf_data)
+    tree = etree.fromstring(opf_data, _xml_parser())
 
-    def dc_vals(tag):
-        vals = []
-        for el in tree.iter(f'{{{DC}}}{tag}'):
+    meta_el = tree.find(f'{{{OPF}}}metadata')
+    if meta_el is None:
+        meta_el = tree.find('metadata')
+    if meta_el is None:
+        meta_el = tree   # no <metadata>: look everywhere, as before
+
+    dc_prefix = f'{{{DC}}}'
+    dc_vals = {}              # local name -> non-empty texts, document order
+    metas, bare_metas = {}, {}  # name -> content of the first <meta name=...>
+    for el in meta_el.iter():
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue  # comments, processing instructions
+        if tag.startswith(dc_prefix):
             if el.text and el.text.strip():
-                vals.append(el.text.strip())
-        return vals
+                dc_vals.setdefault(tag[len(dc_prefix):], []).append(el.text.strip())
+        elif tag in (f'{{{OPF}}}meta', 'meta'):
+            name = el.get('name')
+            found = metas if tag != 'meta' else bare_metas
+            if name and name not in found:
+                found[name] = (el.get('content') or '').strip()
 
     def meta_content(name):
-        for el in tree.iter(f'{{{OPF}}}meta'):
-            if el.get('name') == name:
-                return (el.get('content') or '').strip()
-        for el in tree.iter('meta'):
-            if el.get('name') == name:
-                return (el.get('content') or '').strip()
-        return ''
+        return metas.get(name, bare_metas.get(name, ''))
 
     result = {}
     for field in ('title', 'creator', 'publisher', 'date', 'language', 'description'):
-        vals = dc_vals(field)
-        result[field] = ', '.join(vals) if vals else ''
-    result['subject']       = dc_vals('subject')
+        result[field] = ', '.join(dc_vals.get(field, []))
+    result['subject']       = dc_vals.get('subject', [])
     result['series']        = meta_content('calibre:series')
     result['series_number'] = meta_content('calibre:series_index')
     return result
@@ -170,19 +255,15 @@ def _epub_read_metadata(epub_path):
 def _epub_write_metadata(epub_path, metadata):
     """
     Patch the OPF file inside the EPUB ZIP without touching other entries.
+    Only the OPF is read into memory; the rest is streamed, still
+    compressed, into the new archive.
     Returns (success: bool, message: str).
     """
-    opf_path = _epub_opf_path(epub_path)
-    if not opf_path:
-        return False, 'Could not locate OPF file inside EPUB'
-
-    # Read entire ZIP into memory
     with zipfile.ZipFile(epub_path, 'r') as z:
+        opf_path = _opf_path_in(z)
+        if not opf_path:
+            return False, 'Could not locate OPF file inside EPUB'
         opf_data = z.read(opf_path)
-        other_entries = {
-            name: (z.read(name), z.getinfo(name))
-            for name in z.namelist() if name != opf_path
-        }
 
     try:
         tree = etree.fromstring(opf_data)
@@ -253,14 +334,8 @@ def _epub_write_metadata(epub_path, metadata):
     tmp_fd, tmp_path = tempfile.mkstemp(suffix='.epub', dir=epub_dir)
     try:
         os.close(tmp_fd)
-        with zipfile.ZipFile(tmp_path, 'w') as zout:
-            # mimetype MUST be first and stored (uncompressed) per EPUB spec
-            if 'mimetype' in other_entries:
-                data, _ = other_entries.pop('mimetype')
-                zout.writestr(zipfile.ZipInfo('mimetype'), data, zipfile.ZIP_STORED)
-            for name, (data, _) in other_entries.items():
-                zout.writestr(name, data, zipfile.ZIP_DEFLATED)
-            zout.writestr(opf_path, new_opf, zipfile.ZIP_DEFLATED)
+        # mimetype MUST be first and stored (uncompressed) per EPUB spec
+        replace_member(epub_path, tmp_path, opf_path, new_opf, first='mimetype')
         shutil.move(tmp_path, epub_path)
         return True, 'Metadata saved to EPUB'
     except Exception as e:
@@ -333,40 +408,154 @@ def _build_exiftool_write_args(args, ext, metadata):
 
 # ─────────────────────────── Public API ──────────────────────────────────────
 
-def read_metadata(full_path: str) -> dict:
-    """
-    Read embedded metadata from any supported file.
-    Returns an xmp dict (keys match EMPTY_XMP; never raises).
-    """
+def _is_epub(full_path):
+    return os.path.splitext(full_path)[1].lower() == '.epub'
+
+
+def _epub_xmp(full_path):
+    """xmp dict from the EPUB's OPF; blank fields where the OPF is unreadable."""
     xmp = dict(EMPTY_XMP)
-    ext = os.path.splitext(full_path)[1].lower().lstrip('.')
+    try:
+        epub_meta = _epub_read_metadata(full_path)
+        for field in xmp:
+            if field == 'subject':
+                xmp[field] = _to_list(epub_meta.get(field))
+            else:
+                xmp[field] = _to_str(epub_meta.get(field))
+    except Exception:
+        return dict(EMPTY_XMP)  # let exiftool fill the blanks
+    return xmp
 
-    if ext == 'epub':
-        try:
-            epub_meta = _epub_read_metadata(full_path)
-            for field in xmp:
-                if field == 'subject':
-                    xmp[field] = _to_list(epub_meta.get(field))
-                else:
-                    xmp[field] = _to_str(epub_meta.get(field))
-        except Exception:
-            pass  # fall through and let exiftool fill remaining blanks
 
-    # Supplement / fallback: exiftool fills any still-empty fields
-    flat = _exiftool_read(full_path)
+def _opf_complete(xmp):
+    """True if an EPUB's OPF fields need no help from exiftool (see _EPUB_REQUIRED)."""
+    return all(xmp[field] for field in _EPUB_REQUIRED)
+
+
+def _fill_from_exiftool(xmp, flat):
+    """Fill xmp's still-empty fields from an exiftool flat dict; returns xmp."""
     for field in xmp:
-        if xmp[field] or (field == 'subject' and xmp[field]):
+        if xmp[field]:
             continue  # already populated by EPUB path
         v = _pick(flat, field)
         xmp[field] = _to_list(v) if field == 'subject' else _to_str(v)
+    return xmp
 
+
+def read_metadata(full_path: str) -> dict:
+    """
+    Read embedded metadata from any supported file, or from metadata_cache
+    if the file is unchanged since it was last read.
+    Returns an xmp dict (keys match EMPTY_XMP; never raises).
+    """
+    fp = metadata_cache.fingerprint(full_path)
+    xmp = metadata_cache.get(full_path, fp)
+    if xmp is not None:
+        return xmp
+    xmp = _epub_xmp(full_path) if _is_epub(full_path) else dict(EMPTY_XMP)
+    if _is_epub(full_path) and _opf_complete(xmp):
+        metadata_cache.put(full_path, fp, xmp)
+        return xmp
+    # Supplement / fallback: exiftool fills any still-empty fields
+    flat = _exiftool_read(full_path)
+    xmp = _fill_from_exiftool(xmp, flat or {})
+    if flat:
+        metadata_cache.put(full_path, fp, xmp)
     return xmp
 
 
+def exiftool_covered(full_path: str) -> bool:
+    """
+    True if the file, as it is now, was read with a record from exiftool
+    (or a complete OPF), so other readers of its Info dictionary or OPF
+    would find nothing more. Answered from metadata_cache; never runs
+    exiftool.
+    """
+    return metadata_cache.get(full_path, metadata_cache.fingerprint(full_path)) is not None
+
+
+def _exiftool_read_needed(paths, opfs):
+    """
+    _exiftool_read_many() for the paths that still need exiftool: all but
+    the EPUBs whose OPF (opfs: path -> future of _epub_xmp) is complete.
+    """
+    return _exiftool_read_many([p for p in paths
+                                if p not in opfs or not _opf_complete(opfs[p].result())])
+
+
+def read_metadata_many(paths, batch_size: int = BATCH_SIZE, workers: int = None):
+    """
+    Yield (path, xmp) for every path, in input order; each xmp is what
+    read_metadata(path) would return.
+
+    paths may be any iterable (a walk still in progress, say) and is
+    consumed a batch at a time. Files unchanged since they were cached are
+    served from metadata_cache; EPUB OPFs are parsed on the worker threads,
+    and the rest of the batch, less EPUBs whose OPF is complete, is one
+    exiftool -json call. Up to `workers` batches (default: the exiftool
+    pool's size) are read at once and one more is queued. Closing the generator early starts no new reads
+    and waits for those in flight. Never raises.
+    """
+    if workers is None:
+        workers = shared_pool(EXIFTOOL).size
+    workers = max(1, workers)
+    source = iter(paths)
+    pending = deque()
+    # One thread per exiftool worker, as many again for OPF parsing
+    executor = ThreadPoolExecutor(max_workers=workers * 2,
+                                  thread_name_prefix='metadata-read')
+    try:
+        while True:
+            while len(pending) < workers + 1:
+                batch = list(itertools.islice(source, max(1, batch_size)))
+                if not batch:
+                    break
+                fps = [metadata_cache.fingerprint(p) for p in batch]
+                cached = metadata_cache.get_many(zip(batch, fps))
+                misses = [p for p in batch if p not in cached]
+                # OPFs are queued first: the exiftool task waits on them
+                opfs = {p: executor.submit(_epub_xmp, p) for p in misses if _is_epub(p)}
+                flats = executor.submit(_exiftool_read_needed, misses, opfs)
+                pending.append((batch, fps, cached, flats, opfs))
+            if not pending:
+                return
+            batch, fps, cached, flats, opfs = pending.popleft()
+            flats = flats.result()
+            results, fresh = [], []
+            for path, fp in zip(batch, fps):
+                if path in cached:
+                    results.append(cached[path])
+                    continue
+                xmp = opfs[path].result() if path in opfs else dict(EMPTY_XMP)
+                if path in opfs and _opf_complete(xmp):
+                    fresh.append((path, fp, xmp))
+                    results.append(xmp)
+                    continue
+                flat = flats.get(path)
+                xmp = _fill_from_exiftool(xmp, flat or {})
+                if flat:
+                    fresh.append((path, fp, xmp))
+                results.append(xmp)
+            metadata_cache.put_many(fresh)
+            yield from zip(batch, results)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def write_metadata(full_path: str, metadata: dict) -> tuple:
     """
     Write metadata to a file. Returns (success: bool, message: str).
+    After a successful write the file is read back into metadata_cache.
     """
+    ok, message = _write_metadata(full_path, metadata)
+    if ok:
+        metadata_cache.forget(full_path)
+        read_metadata(full_path)
+    return ok, message
+
+
+def _write_metadata(full_path, metadata):
+    """write_metadata() without the cache refresh."""
     ext = os.path.splitext(full_path)[1].lower().lstrip('.')
 
     if ext == 'epub':
@@ -26,6 +26,11 @@ import threading
 import warnings
 from typing import Optional
 
+import io_budget
+import metadata_cache
+from path_filter import literal_names, module_filter
+from walker import walk_files
+
 # ---------------------------------------------------------------------------
 # Content-type classification
 # ---------------------------------------------------------------------------
@@ -364,11 +369,35 @@ def _extract_epub_meta(filepath: str) -> dict:
         return {}
 
 
-def get_file_metadata(filepath: str) -> dict:
+def _read_metadata_stream(paths):
+    """
+    Yield (path, xmp) for paths in order via metadata_handler's batched
+    read_metadata_many(), or (path, None) if metadata_handler is
+    unavailable, leaving get_file_metadata to its fallback readers.
+    """
+    try:
+        from metadata_handler import read_metadata_many
+    except Exception:
+        return ((path, None) for path in paths)
+    return read_metadata_many(paths)
+
+
+def _exiftool_covered(filepath: str) -> bool:
+    """metadata_handler.exiftool_covered(), or False if it is unavailable."""
+    try:
+        from metadata_handler import exiftool_covered
+    except Exception:
+        return False
+    return exiftool_covered(filepath)
+
+
+def get_file_metadata(filepath: str, xmp: Optional[dict] = None) -> dict:
     """
     Returns dict with keys: title, author, date, publisher, edition.
-    Prefers metadata_handler.read_metadata() (exiftool + EPUB OPF parser).
-    Falls back to internal pypdf reader if metadata_handler is unavailable.
+    Prefers metadata_handler.read_metadata() (exiftool + EPUB OPF parser);
+    pass xmp when it was already read, e.g. by read_metadata_many().
+    Falls back to internal pypdf / ebooklib readers if metadata_handler is
+    unavailable or exiftool returned no record for the file.
     Falls back to filename stem if all metadata is absent.
     """
     stem = os.path.splitext(os.path.basename(filepath))[0]
@@ -377,7 +406,8 @@ def get_file_metadata(filepath: str) -> dict:
     # ── Primary: full metadata_handler (exiftool + OPF) ──
     try:
         from metadata_handler import read_metadata
-        xmp = read_metadata(filepath)
+        if xmp is None:
+            xmp = read_metadata(filepath)
         title     = xmp.get('title',     '').strip()
         # metadata_handler uses 'creator' for author
         author    = xmp.get('creator',   '').strip()
@@ -403,11 +433,15 @@ def get_file_metadata(filepath: str) -> dict:
         pass
 
     # ── Fallback: internal pypdf / ebooklib readers ──
+    # Skipped when exiftool returned a record for this file: it reads the
+    # same PDF Info dictionary and OPF, and a cached read should leave the
+    # file unopened.
     meta = {}
-    if ext == '.pdf':
-        meta = _extract_pdf_meta(filepath)
-    elif ext == '.epub':
-        meta = _extract_epub_meta(filepath)
+    if ext in ('.pdf', '.epub') and not _exiftool_covered(filepath):
+        if ext == '.pdf':
+            meta = _extract_pdf_meta(filepath)
+        else:
+            meta = _extract_epub_meta(filepath)
 
     return {
         'title':     meta.get('title',     '').strip() or stem,
@@ -645,30 +679,33 @@ def organize_library(
     errors    = 0
     author_counts = {}   # author_field -> count of files
 
-    cancelled = False
-    for root, dirs, files in os.walk(source_folder):
-        if stop_event and stop_event.is_set():
-            cancelled = True
-            break
-        dirs[:] = [
-            d for d in dirs
-            if d not in SKIP_DIRS
-            and os.path.abspath(os.path.join(root, d)) != abs_dest
-        ]
-        for filename in files:
+    path_filter = module_filter('organizing',
+                                excluded_folders=literal_names(SKIP_DIRS),
+                                excluded_files=literal_names(IGNORE_FILES))
+
+    def candidates():
+        """Supported files under source_folder, as the walk finds them."""
+        nonlocal skipped
+        for src_path, _root, _st in walk_files(source_folder, excluded_paths=[abs_dest],
+                                               with_stat=False, path_filter=path_filter):
             if stop_event and stop_event.is_set():
-                cancelled = True
-                break
-            if filename in IGNORE_FILES:
-                continue
-            ext = os.path.splitext(filename)[1].lower()
+                return
+            ext = os.path.splitext(src_path)[1].lower()
             if ext not in ALL_SUPPORTED_EXTENSIONS:
                 skipped += 1
                 continue
+            yield src_path
+
+    # Metadata is read in batches (one exiftool call per batch) while the walk goes on
+    stream = _read_metadata_stream(candidates())
+    try:
+        for src_path, xmp in stream:
+            if stop_event and stop_event.is_set():
+                break
+            filename = os.path.basename(src_path)
 
-            src_path = os.path.join(root, filename)
             try:
-                meta         = get_file_metadata(src_path)
+                meta         = get_file_metadata(src_path, xmp)
                 new_name     = build_filename(src_path, meta)
                 ctype        = classify_file(src_path)
                 author_field = _build_author_field_for_file(meta)
@@ -687,8 +724,9 @@ def organize_library(
             except Exception as e:
                 log(f'  SCAN ERROR on {filename!r}: {e}')
                 errors += 1
-        if cancelled:
-            break
+    finally:
+        stream.close()
+    cancelled = bool(stop_event and stop_event.is_set())
 
     if cancelled:
         log('*** CANCELLED by user during Pass 1 — no files were moved.')
@@ -733,7 +771,8 @@ def organize_library(
 
             if not dry_run:
                 os.makedirs(dest_folder, exist_ok=True)
-                shutil.move(src_path, dest_path)
+                shutil.move(src_path, dest_path, copy_function=io_budget.copy_file)
+                metadata_cache.move(src_path, dest_path)
 
             moved += 1
 
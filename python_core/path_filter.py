@@ -0,0 +1,190 @@
+"""
+path_filter.py — Data Librarian
+================================
+Include/exclude rules for folder scans, compiled once per module.
+
+Rule keys (the per-module filter schema of the top-level config.json,
+e.g. data_librarian.weeding / data_librarian.segmenting):
+  included_folders / excluded_folders
+  included_files / excluded_files
+  included_extensions / excluded_extensions
+
+Folder and file rules are glob patterns (fnmatch syntax: *, ?, [...]).
+A pattern without '/' matches the entry's name anywhere in the tree; one
+with '/' matches its path relative to the scanned root. Extensions are
+matched case-insensitively as name suffixes ('.pdf', '.tar.gz'). Rules
+are compared in Unicode NFC form; walk_files() passes names the same way.
+
+Semantics:
+  - An excluded folder is pruned: nothing below it is listed.
+  - With included_folders set, only files below a matching folder are
+    kept. When every include is a literal relative path, folders that
+    can't lead to one are pruned as well.
+  - With included_files / included_extensions set, a file must match one.
+  - Exclusions always win over inclusions.
+
+compile_rules() turns a rules dict into a PathFilter: literal names and
+paths go into sets, all globs of one kind into a single regex, so each
+check is a set lookup plus at most one regex match however many rules
+there are. module_filter() caches one PathFilter per module and rule set.
+walker.walk_files() applies it during traversal.
+"""
+
+import fnmatch
+import glob
+import json
+import os
+import re
+import unicodedata
+from typing import Optional
+
+RULE_KEYS = ('included_folders', 'excluded_folders',
+             'included_files', 'excluded_files',
+             'included_extensions', 'excluded_extensions')
+
+# Schema file shared with the web app (types/config.ts)
+_SCHEMA_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'config.json')
+
+_GLOB_CHARS = re.compile(r'[*?\[]')
+
+# module + rules -> PathFilter, so each module compiles its rules once
+_compiled = {}
+
+
+class _Matcher:
+    """One rule list: literal names/paths in sets, globs in one regex each."""
+
+    def __init__(self, patterns):
+        self.names, self.paths = set(), set()
+        name_globs, path_globs = [], []
+        for pattern in patterns:
+            pattern = unicodedata.normalize('NFC', pattern.strip())
+            pattern = pattern.replace('\\', '/').strip('/')
+            if not pattern:
+                continue
+            is_path = '/' in pattern
+            if _GLOB_CHARS.search(pattern):
+                (path_globs if is_path else name_globs).append(fnmatch.translate(pattern))
+            else:
+                (self.paths if is_path else self.names).add(pattern)
+        self.name_re = re.compile('|'.join(name_globs)) if name_globs else None
+        self.path_re = re.compile('|'.join(path_globs)) if path_globs else None
+        self.empty = not (self.names or self.paths or name_globs or path_globs)
+
+    def match(self, name: str, relpath: str) -> bool:
+        return (name in self.names or relpath in self.paths
+                or (self.name_re is not None and self.name_re.match(name) is not None)
+                or (self.path_re is not None and self.path_re.match(relpath) is not None))
+
+
+def _extensions(values) -> tuple:
+    exts = []
+    for ext in values:
+        ext = unicodedata.normalize('NFC', ext.strip()).lower()
+        if ext:
+            exts.append(ext if ext.startswith('.') else '.' + ext)
+    return tuple(exts)
+
+
+class PathFilter:
+    """
+    Compiled rules. Paths passed in are relative to the scanned root with
+    '/' separators, in NFC form. Build with compile_rules().
+    """
+
+    def __init__(self, rules: dict):
+        self.rules = {key: sorted(set(rules.get(key) or ())) for key in RULE_KEYS}
+        self._dir_in = _Matcher(self.rules['included_folders'])
+        self._dir_out = _Matcher(self.rules['excluded_folders'])
+        self._file_in = _Matcher(self.rules['included_files'])
+        self._file_out = _Matcher(self.rules['excluded_files'])
+        self._ext_in = _extensions(self.rules['included_extensions'])
+        self._ext_out = _extensions(self.rules['excluded_extensions'])
+        # Literal include paths allow pruning everything off their way
+        self._include_roots = None
+        if (not self._dir_in.empty and not self._dir_in.names
+                and self._dir_in.name_re is None and self._dir_in.path_re is None):
+            self._include_roots = tuple(sorted(self._dir_in.paths))
+
+    @property
+    def needs_folder_match(self) -> bool:
+        """True if files only count below a folder matching included_folders."""
+        return not self._dir_in.empty
+
+    def folder_included(self, name: str, relpath: str) -> bool:
+        """True if this folder matches included_folders."""
+        return self._dir_in.match(name, relpath)
+
+    def enter_folder(self, name: str, relpath: str, inside_included: bool) -> bool:
+        """False if the folder (and so its whole subtree) should be skipped."""
+        if self._dir_out.match(name, relpath):
+            return False
+        if self._include_roots is None or inside_included:
+            return True
+        # On the way to a literal include path, or is one
+        return any(root == relpath or root.startswith(relpath + '/')
+                   for root in self._include_roots)
+
+    def keep_file(self, name: str, relpath: str, inside_included: bool = True) -> bool:
+        """True if the file passes every rule."""
+        if self.needs_folder_match and not inside_included:
+            return False
+        if self._file_out.match(name, relpath):
+            return False
+        if self._ext_out or self._ext_in:
+            lower = name.lower()
+            if self._ext_out and lower.endswith(self._ext_out):
+                return False
+            if self._ext_in and not lower.endswith(self._ext_in):
+                return False
+        if not self._file_in.empty and not self._file_in.match(name, relpath):
+            return False
+        return True
+
+
+def compile_rules(rules: Optional[dict] = None, **extra) -> PathFilter:
+    """
+    Compile a rules dict (keys from RULE_KEYS; missing keys = no rule).
+    Keyword lists are merged into the matching keys, e.g.
+    compile_rules(section, excluded_folders=['_DuplicateHoldingBin']).
+    """
+    merged = {key: list((rules or {}).get(key) or ()) for key in RULE_KEYS}
+    for key, values in extra.items():
+        if key not in merged:
+            raise ValueError(f"Unknown filter rule: {key!r}")
+        merged[key].extend(values or ())
+    return PathFilter(merged)
+
+
+def literal_names(names) -> list:
+    """Exact names as rules that never act as globs (e.g. 'Books [2020]')."""
+    return [glob.escape(name) for name in names or ()]
+
+
+def load_module_rules(module: str, config_path: str = _SCHEMA_CONFIG) -> dict:
+    """
+    Rule lists of one module section of the schema config.json
+    (data_librarian.<module>); {} if the file or section is missing.
+    """
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            section = json.load(f).get('data_librarian', {}).get(module, {})
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"[path_filter] WARNING: could not read {config_path!r}: {e}")
+        return {}
+    return {key: section[key] for key in RULE_KEYS if isinstance(section.get(key), list)}
+
+
+def module_filter(module: str, **extra) -> PathFilter:
+    """
+    The compiled filter for a module: its config.json rules merged with the
+    caller's own lists (see compile_rules). Compiled once per module and
+    rule set, then reused.
+    """
+    rules = load_module_rules(module)
+    key = (module, json.dumps([rules, sorted((k, sorted(v or ())) for k, v in extra.items())]))
+    if key not in _compiled:
+        _compiled[key] = compile_rules(rules, **extra)
+    return _compiled[key]
@@ -1,6 +1,6 @@
 """
 test_dedupe.py — Validation suite for Gap 2: keeper scoring logic.
-Tests score_file(), _pick_keeper(), and run_dedupe() against a temp library.
+Tests score_file(), _resolve_group(), and run_dedupe() against a temp library.
 Run: python3 test_dedupe.py
 """
 
@@ -12,7 +12,12 @@ import hashlib
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-from dedupe import score_file, _pick_keeper, _is_noisy, run_dedupe
+from dedupe import score_file, _resolve_group, _is_noisy, run_dedupe
+import dedupe_checkpoint
+
+# Keep run checkpoints out of ~/.librarian
+_checkpoints = tempfile.TemporaryDirectory()
+dedupe_checkpoint.CHECKPOINT_DIR = _checkpoints.name
 
 PASS = 0
 FAIL = 0
@@ -77,8 +82,8 @@ with tempfile.TemporaryDirectory() as tmp:
     # clean_sub: depth=2 → +2, not-root → +3, clean → +5, pdf → +1 = 11
     check("clean subfolder file score is 11", score_clean, 11)
 
-# ── _pick_keeper ─────────────────────────────────────────────────────────────
-print("\n=== Section 3: _pick_keeper ===")
+# ── _resolve_group ───────────────────────────────────────────────────────────
+print("\n=== Section 3: _resolve_group ===")
 
 with tempfile.TemporaryDirectory() as tmp:
     library = os.path.join(tmp, "library")
@@ -94,11 +99,11 @@ with tempfile.TemporaryDirectory() as tmp:
     open(lib_file, 'w').close()
     open(intake_file, 'w').close()
 
-    keeper, discard, reason = _pick_keeper(
-        lib_file, library,
-        intake_file, intake,
+    keeper, discards = _resolve_group(
+        [(intake_file, intake), (lib_file, library)],
         library, ['.pdf', '.epub']
     )
+    (discard, reason), = discards
     check("library file kept over intake file", keeper, lib_file)
     check("intake file discarded",              discard, intake_file)
     check_true("reason mentions library root",  'library root' in reason)
@@ -109,11 +114,11 @@ with tempfile.TemporaryDirectory() as tmp:
     open(noisy, 'w').close()
     open(clean, 'w').close()
 
-    keeper2, discard2, reason2 = _pick_keeper(
-        noisy, library,
-        clean, library,
+    keeper2, discards2 = _resolve_group(
+        [(noisy, library), (clean, library)],
         library, ['.pdf', '.epub']
     )
+    (discard2, reason2), = discards2
     check("clean subfolder file kept over noisy root file", keeper2, clean)
     check("noisy root file discarded",                      discard2, noisy)
 
@@ -187,6 +192,600 @@ with tempfile.TemporaryDirectory() as tmp:
     check_true("intake file identified as discard",
                os.path.basename(intake_file) in log_text)
 
+# ── run_dedupe staged hashing ────────────────────────────────────────────────
+print("\n=== Section 6: size / partial / full hashing stages ===")
+
+import dedupe
+
+with tempfile.TemporaryDirectory() as tmp:
+    edge = dedupe._PARTIAL_EDGE_BYTES
+    big  = b"A" * (edge * 3)
+    # Same size, same head and tail, different middle — only a full hash separates them
+    middle_diff = big[:edge + 10] + b"B" + big[edge + 11:]
+
+    with open(os.path.join(tmp, "unique.pdf"), 'wb') as f:
+        f.write(b"only file of this size")
+    with open(os.path.join(tmp, "big one.pdf"), 'wb') as f:
+        f.write(big)
+    with open(os.path.join(tmp, "big two.pdf"), 'wb') as f:
+        f.write(big)
+    with open(os.path.join(tmp, "big middle.pdf"), 'wb') as f:
+        f.write(middle_diff)
+    with open(os.path.join(tmp, "big tail.pdf"), 'wb') as f:
+        f.write(big[:-1] + b"C")
+
+    result = run_dedupe(scan_dir=tmp, move_duplicates=False)
+
+    check("all five files processed",            result['files_processed'], 5)
+    check("unique-size file never read",         result['size_unique'],     1)
+    check("four same-size files partial-hashed", result['partial_hashed'],  4)
+    check("tail-differing file dropped before full hash",
+          result['files_hashed'], 3)
+    check("only the true copy is a duplicate",   result['duplicates_found'], 1)
+
+# ── parallel hashing pool ────────────────────────────────────────────────────
+print("\n=== Section 7: hashing worker pool ===")
+
+import threading
+import time
+
+def _slow_len(path):
+    # Later items finish first; the pool must still yield in input order
+    time.sleep(0.01 * (5 - len(path)))
+    return len(path)
+
+items = [{'path': 'x' * n} for n in range(1, 6)]
+ordered = [d for _, d in dedupe._hash_in_pool(items, _slow_len, 4)]
+check("pool yields results in input order", ordered, [1, 2, 3, 4, 5])
+
+stop = threading.Event()
+stop.set()
+check("pool queues nothing once stop_event is set",
+      list(dedupe._hash_in_pool(items, _slow_len, 4, stop)), [])
+
+with tempfile.TemporaryDirectory() as tmp:
+    for i in range(6):
+        with open(os.path.join(tmp, f"copy {i}.pdf"), 'wb') as f:
+            f.write(b"same bytes in every copy")
+    with open(os.path.join(tmp, "other.pdf"), 'wb') as f:
+        f.write(b"different bytes, same len!")
+
+    serial   = run_dedupe(scan_dir=tmp, hash_workers=1)
+    parallel = run_dedupe(scan_dir=tmp, hash_workers=4)
+    check("4 workers find the same duplicates as 1",
+          parallel['duplicates_found'], serial['duplicates_found'])
+    check("5 duplicates among 6 identical copies", parallel['duplicates_found'], 5)
+
+    cancelled = run_dedupe(scan_dir=tmp, hash_workers=4, stop_event=stop)
+    check_true("stop_event cancels a pooled run", cancelled['cancelled'])
+
+# ── incremental scans with cached directory listings ─────────────────────────
+print("\n=== Section 8: incremental scan skips unchanged directories ===")
+
+import config
+import library_index as idx
+
+with tempfile.TemporaryDirectory() as tmp:
+    idx._INDEX_DIR  = os.path.join(tmp, "db")
+    idx._INDEX_FILE = os.path.join(idx._INDEX_DIR, "library_index.db")
+    library = os.path.join(tmp, "library")
+    static  = os.path.join(library, "Static Shelf")
+    busy    = os.path.join(library, "Busy Shelf")
+    os.makedirs(static)
+    os.makedirs(busy)
+    config.LIBRARY_MOUNT_PATH = library
+
+    for folder, name in ((static, "a.pdf"), (static, "b.pdf"), (busy, "c.pdf")):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b"same")
+
+    def age_dirs():
+        # Listings taken right after a change are "racy" and never trusted
+        past = time.time() - 60
+        for d in (static, busy, library):
+            os.utime(d, (past, past))
+
+    os.makedirs(os.path.join(library, "_DuplicateHoldingBin"))
+    age_dirs()
+    first = run_dedupe(scan_dir=library, incremental=True)
+    check("first incremental run lists everything", first['files_processed'], 3)
+
+    listed = []
+    real_scandir = os.scandir
+    def counting_scandir(path):
+        listed.append(os.path.basename(path))
+        return real_scandir(path)
+    dedupe.os.scandir = counting_scandir
+    try:
+        with open(os.path.join(busy, "d.pdf"), 'wb') as f:
+            f.write(b"same")
+        second = run_dedupe(scan_dir=library, incremental=True)
+    finally:
+        dedupe.os.scandir = real_scandir
+
+    check("only the changed directory is listed again", listed, ["Busy Shelf"])
+    check("new file in the changed directory is found", second['files_processed'], 4)
+    check("all four identical files still grouped", second['duplicates_found'], 3)
+    config.LIBRARY_MOUNT_PATH = ''
+
+print("\n=== Section 9: intake check resolves against the index only ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    idx._INDEX_DIR  = os.path.join(tmp, "db")
+    idx._INDEX_FILE = os.path.join(idx._INDEX_DIR, "library_index.db")
+    library = os.path.join(tmp, "library")
+    shelf   = os.path.join(library, "Shelf")
+    intake  = os.path.join(tmp, "intake")
+    os.makedirs(shelf)
+    os.makedirs(intake)
+    config.LIBRARY_MOUNT_PATH = library
+
+    def write(path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    write(os.path.join(shelf, "Known.pdf"), b"known content")
+    write(os.path.join(shelf, "Known copy.pdf"), b"known content")
+    write(os.path.join(shelf, "Lonely.pdf"), b"lonely")         # unique size, never hashed
+    run_dedupe(scan_dir=library)
+
+    write(os.path.join(intake, "known-download.pdf"), b"known content")
+    write(os.path.join(intake, "lookalike.pdf"), b"LONELY")     # same size as Lonely.pdf
+    write(os.path.join(intake, "brand new.pdf"), b"nothing like it")
+
+    listed = []
+    real_scandir = os.scandir
+    def counting_scandir(path):
+        listed.append(os.path.abspath(path))
+        return real_scandir(path)
+    dedupe.os.scandir = counting_scandir
+    try:
+        dry = run_dedupe(scan_dir=library, secondary_dir=intake, intake_check=True)
+    finally:
+        dedupe.os.scandir = real_scandir
+
+    check_true("library is never listed",
+               not any(p.startswith(os.path.abspath(library)) for p in listed))
+    check("only intake files are hashed", dry['files_hashed'], 3)
+    check("indexed library copy is matched", dry['duplicates_found'], 1)
+    check("size-only match is reported unverified", dry['unverified'], 1)
+
+    live = run_dedupe(scan_dir=library, secondary_dir=intake,
+                      move_duplicates=True, intake_check=True)
+    check("intake duplicate moved", live['files_moved'], 1)
+    import holding_bin
+    binned = holding_bin.open_bin(os.path.join(intake, "_DuplicateHoldingBin"))
+    check("moved into the intake holding bin",
+          [e['original'] for e in holding_bin.binned_entries(binned)],
+          [os.path.join(intake, "known-download.pdf")])
+    holding_bin.close_bin(binned)
+    check_true("unverified lookalike left in place",
+               os.path.exists(os.path.join(intake, "lookalike.pdf")))
+    check_true("library copies untouched",
+               os.path.exists(os.path.join(shelf, "Known.pdf")))
+    config.LIBRARY_MOUNT_PATH = ''
+
+print("\n=== Section 10: out-of-core grouping ===")
+
+from utils import path_key
+
+store = dedupe._ScanStore()
+saved_batch = dedupe._SPILL_BATCH
+dedupe._SPILL_BATCH = 2        # force several executemany() flushes
+try:
+    records = [("/a1", 10, 1, "aa"), ("/b1", 20, 2, "bb"), ("/a2", 10, 3, "aa"),
+               ("/c1", 30, 4, "aa"), ("/a3", 10, 5, "aa"), ("/b2", 20, 6, "bb"),
+               ("/d1", 40, 7, None), ("/d2", 40, 8, None), ("/e1", 50, 9, None)]
+    for i, (path, size, ino, digest) in enumerate(records):
+        if i == 4:
+            store.spill()      # half the rows written before, half after
+        store.add(path, "/", idx.CachedStat(size, 0.0, 1, ino), digest)
+    same_inode = store.has_file(path_key("/a3"), 1, 5)
+    other_inode = store.has_file(path_key("/a3"), 1, 6)
+    buffered_hit = store.has_file(path_key("/e1"), 1, 9)
+    still_buffered = len(store.buffer)
+    unique = store.plan(0)
+    partial = [e['path'] for e in store.candidates(store.PARTIAL)]
+    groups = list(store.groups())
+finally:
+    dedupe._SPILL_BATCH = saved_batch
+    store.close()
+check_true("store moved to disk", store.spilled)
+check_true("same inode under the same path is found", same_inode and not other_inode)
+check_true("unflushed row found without flushing", buffered_hit and still_buffered == 1)
+check("unique uncached size is counted, not queued", unique, 1)
+check("same-size uncached files queued for a partial hash", partial, ["/d1", "/d2"])
+check("groups stream smallest size first, members in walk order",
+      groups, [(10, "aa", [("/a1", "/"), ("/a2", "/"), ("/a3", "/")]),
+               (20, "bb", [("/b1", "/"), ("/b2", "/")])])
+
+with tempfile.TemporaryDirectory() as tmp:
+    for i in range(4):
+        shelf = os.path.join(tmp, f"Shelf {i}")
+        os.makedirs(shelf)
+        for name, data in (("one.pdf", b"first book"), ("two.pdf", b"second book!"),
+                           (f"solo {i}.pdf", b"x" * (i + 1))):
+            with open(os.path.join(shelf, name), 'wb') as f:
+                f.write(data)
+
+    in_memory = run_dedupe(scan_dir=tmp, out_of_core=False)
+    saved_tail = dedupe._LOG_TAIL
+    dedupe._LOG_TAIL = 5
+    try:
+        spilled = run_dedupe(scan_dir=tmp, out_of_core=True)
+    finally:
+        dedupe._LOG_TAIL = saved_tail
+
+    check("same duplicate count either way",
+          spilled['duplicates_found'], in_memory['duplicates_found'])
+    check("three extra copies of each of two books", spilled['duplicates_found'], 6)
+    keepers = lambda r: sorted(l for l in r['log_lines'] if l.startswith('  Keep'))
+    check_true("summary log keeps only the tail", len(spilled['log_lines']) == 5)
+    check("final summary line still present",
+          spilled['log_lines'][-1], "Errors          : 0")
+    check_true("in-memory log is complete", len(keepers(in_memory)) == 6)
+
+    # The walk crosses DEDUPE_SPILL_THRESHOLD: the store and index move out of memory
+    config.DEDUPE_SPILL_THRESHOLD = 3
+    try:
+        crossed = run_dedupe(scan_dir=tmp)
+    finally:
+        config.DEDUPE_SPILL_THRESHOLD = 1000000
+    check_true("threshold switches to out-of-core mid-walk",
+               any(l.startswith('Scan store   : Out-of-core') for l in crossed['log_lines']))
+    check("same duplicates after the switch", keepers(crossed), keepers(in_memory))
+
+print("\n=== Section 11: group-wise keeper resolution ===")
+
+import itertools
+
+lib = "/lib"
+copies = [
+    ("/lib/9780000000001 book.pdf", lib),                  # noisy, root level
+    ("/lib/Author/Book.pdf", lib),                          # clean, one level down
+    ("/lib/Author/Series/Book.epub", lib),                  # clean, deeper
+    ("/intake/Author/Series/Deeper/Book.pdf", "/intake"),  # best score, but intake
+]
+keepers = {_resolve_group(list(order), lib, ['.epub'])[0]
+           for order in itertools.permutations(copies)}
+check("keeper independent of arrival order", keepers, {"/lib/Author/Series/Book.epub"})
+
+keeper, discards = _resolve_group(copies, lib, ['.epub'])
+reasons = dict(discards)
+check("every other copy discarded", len(discards), 3)
+check("intake copy loses to library",
+      reasons["/intake/Author/Series/Deeper/Book.pdf"], 'library root wins over intake')
+check("lower score reported", reasons["/lib/Author/Book.pdf"], 'score 11 vs 9')
+
+keeper, discards = _resolve_group([("/lib/A/b.pdf", lib), ("/lib/A/a.pdf", lib)], lib, [])
+check("equal path lengths fall back to path order", keeper, "/lib/A/a.pdf")
+check("path-order reason", discards[0][1], 'tie-break: path order (scores equal at 9)')
+check_true("sibling root is not library",
+           _resolve_group([("/lib2/x/a.pdf", "/lib2"), ("/lib/a.pdf", lib)], lib, [])[0]
+           == "/lib/a.pdf")
+
+print("\n=== Section 12: hardlink / reflink dedupe actions ===")
+
+from dedupe import _link_duplicate
+
+with tempfile.TemporaryDirectory() as tmp:
+    shelf = os.path.join(tmp, "Author")
+    os.makedirs(shelf)
+    keeper = os.path.join(shelf, "Book.pdf")
+    copies = [os.path.join(tmp, "Book (1).pdf"), os.path.join(tmp, "Book (2).pdf")]
+    for path in [keeper] + copies:
+        with open(path, 'wb') as f:
+            f.write(b"linked book content")
+
+    result = run_dedupe(scan_dir=tmp, move_duplicates=True, dedupe_action='hardlink')
+    check("both copies replaced by links", result['files_linked'], 2)
+    check("nothing moved to the holding bin", result['files_moved'], 0)
+    check_true("every path still valid", all(os.path.exists(p) for p in copies))
+    check_true("copies share the keeper's inode",
+               all(os.path.samefile(keeper, p) for p in copies))
+    check_true("no temporary link left behind",
+               not any('.dedupe-' in name for name in os.listdir(tmp)))
+
+    again = run_dedupe(scan_dir=tmp, move_duplicates=True, dedupe_action='hardlink')
+    check("second run finds links, not new work", again['files_linked'], 0)
+    check("already-linked copies aren't errors", again['errors'], 0)
+
+with tempfile.TemporaryDirectory() as tmp:
+    keeper = os.path.join(tmp, "keep.pdf")
+    discard = os.path.join(tmp, "discard.pdf")
+    for path in (keeper, discard):
+        with open(path, 'wb') as f:
+            f.write(b"original")
+    digest = hashlib.sha256(b"original").hexdigest()
+    with open(discard, 'wb') as f:
+        f.write(b"edited!!")        # changed after it was hashed
+    problem = _link_duplicate(keeper, discard, 'hardlink', digest, dedupe.hash_file)
+    check("edited copy is not swapped", problem, 'content changed since it was hashed')
+    check_true("edited copy left intact", open(discard, 'rb').read() == b"edited!!")
+    check_true("temporary link cleaned up", sorted(os.listdir(tmp)) == ["discard.pdf", "keep.pdf"])
+
+    with open(discard, 'wb') as f:
+        f.write(b"original")
+    problem = _link_duplicate(keeper, discard, 'reflink', digest, dedupe.hash_file)
+    # ext4 and friends can't clone; the copy must then be left untouched
+    check_true("reflink either succeeds or leaves the file alone",
+               problem == '' or open(discard, 'rb').read() == b"original")
+    check_true("no temporary clone left behind",
+               sorted(os.listdir(tmp)) == ["discard.pdf", "keep.pdf"])
+
+try:
+    run_dedupe(scan_dir=tempfile.gettempdir(), dedupe_action='delete')
+    check_true("unknown action rejected", False)
+except ValueError:
+    check_true("unknown action rejected", True)
+
+print("\n=== Section 13: resumable runs ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    for book in ("alpha", "beta", "gamma"):
+        for shelf in ("Shelf A", "Shelf B"):
+            os.makedirs(os.path.join(tmp, shelf), exist_ok=True)
+            with open(os.path.join(tmp, shelf, f"{book}.pdf"), 'wb') as f:
+                f.write(f"content of {book}".encode())
+
+    stop = threading.Event()
+    def stop_after_first_move(line):
+        if line.startswith('  Moved to:'):
+            stop.set()
+    first = run_dedupe(scan_dir=tmp, move_duplicates=True, stop_event=stop,
+                       progress_callback=stop_after_first_move)
+    check_true("first run cancelled", first['cancelled'])
+    check("first run moved one copy", first['files_moved'], 1)
+    saved = dedupe_checkpoint.checkpoint_path(tmp)
+    check_true("checkpoint kept after cancel", os.path.exists(saved))
+
+    listed, hashed = [], []
+    real_scandir, real_hash_file = os.scandir, dedupe.hash_file
+    real_hash_file_multi = dedupe.hash_file_multi
+    def counting_scandir(path):
+        listed.append(path)
+        return real_scandir(path)
+    def counting_hash_file(path, *args):
+        hashed.append(path)
+        return real_hash_file(path, *args)
+    def counting_hash_file_multi(path, *args):
+        hashed.append(path)
+        return real_hash_file_multi(path, *args)
+    dedupe.os.scandir, dedupe.hash_file = counting_scandir, counting_hash_file
+    dedupe.hash_file_multi = counting_hash_file_multi
+    try:
+        resumed = run_dedupe(scan_dir=tmp, move_duplicates=True, resume=True)
+    finally:
+        dedupe.os.scandir, dedupe.hash_file = real_scandir, real_hash_file
+        dedupe.hash_file_multi = real_hash_file_multi
+
+    check_true("resume says so", any(l.startswith('Resume       : continuing')
+                                     for l in resumed['log_lines']))
+    check("walk not repeated", listed, [])
+    check("nothing re-hashed", hashed, [])
+    check("only the remaining groups resolved", resumed['duplicates_found'], 2)
+    check("remaining copies moved", resumed['files_moved'], 2)
+    check_true("checkpoint deleted after a completed run", not os.path.exists(saved))
+
+    stop = threading.Event()
+    stop.set()
+    run_dedupe(scan_dir=tmp, stop_event=stop)
+    other = run_dedupe(scan_dir=tmp, hash_algorithm='blake2b', resume=True)
+    check_true("checkpoint with other settings is not reused",
+               any('other settings' in l for l in other['log_lines']))
+
+print("\n=== Section 14: duplicate directories ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    def write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    for parent in ("Library", "Downloads"):
+        series = os.path.join(tmp, parent, "Series")
+        write(os.path.join(series, "Book 1.epub"), b"book one")
+        write(os.path.join(series, "Book 2.epub"), b"book two!")
+        write(os.path.join(series, "Extras", "Map.pdf"), b"the map")
+    write(os.path.join(tmp, "Library", "Loose.pdf"), b"loose copy")
+    write(os.path.join(tmp, "Downloads", "Loose.pdf"), b"loose copy")
+    # Same names, but one file has a size nothing else has — never hashed
+    write(os.path.join(tmp, "Library", "Other", "a.pdf"), b"a")
+    write(os.path.join(tmp, "Downloads", "Other", "a.pdf"), b"a")
+    write(os.path.join(tmp, "Downloads", "Other", "unique.pdf"), b"only one this long")
+
+    dry = run_dedupe(scan_dir=tmp, duplicate_dirs=True)
+    dir_lines = [l for l in dry['log_lines'] if l == '\nDUPLICATE DIRECTORY FOUND:']
+    check("identical subtree reported once", dry['duplicate_dirs'], 1)
+    check("nested Extras folder not reported separately", len(dir_lines), 1)
+    check("files inside it aren't reported one by one", dry['duplicates_found'], 2)
+
+    live = run_dedupe(scan_dir=tmp, move_duplicates=True, duplicate_dirs=True)
+    discarded = [l.split(': ', 1)[1] for l in live['log_lines']
+                 if l.startswith('  Discard: ') and l.endswith('Series')]
+    check("one directory discarded", len(discarded), 1)
+    check_true("discarded directory moved whole", not os.path.exists(discarded[0]))
+
+    import holding_bin
+    bin_dir = os.path.join(tmp, "_DuplicateHoldingBin")
+    conn = holding_bin.open_bin(bin_dir)
+    trees = [e for e in holding_bin.binned_entries(conn) if e['kind'] == 'tree']
+    holding_bin.close_bin(conn)
+    check("binned as one tree entry", [e['original'] for e in trees], discarded)
+    result = holding_bin.restore(bin_dir, ids=[trees[0]['id']])
+    check("tree restored", result['restored'], 1)
+    check_true("restored subtree complete",
+               os.path.exists(os.path.join(discarded[0], "Extras", "Map.pdf")))
+
+with tempfile.TemporaryDirectory() as tmp:
+    # Same included files, but each copy also holds something the walk skips
+    for parent in ("Library", "Downloads"):
+        series = os.path.join(tmp, parent, "Series")
+        write(os.path.join(series, "Book 1.epub"), b"book one")
+        write(os.path.join(series, "Book 2.epub"), b"book two!")
+    notes = os.path.join(tmp, "Downloads", "Series", "notes.bak")
+    write(notes, b"the only copy of these notes")
+    organized = os.path.join(tmp, "Library", "Series", "Organized_Books", "Map.pdf")
+    write(organized, b"the only copy of this map")
+
+    for attempt in (1, 2):
+        live = run_dedupe(scan_dir=tmp, move_duplicates=True, duplicate_dirs=True,
+                          excluded_files={'notes.bak'})
+    check("folders with excluded content aren't duplicate directories",
+          live['duplicate_dirs'], 0)
+    check_true("excluded file survives repeated live runs", os.path.exists(notes))
+    check_true("excluded subfolder survives too", os.path.exists(organized))
+
+print("\n=== Section 15: Anna's Archive MD5 check ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    idx._INDEX_DIR  = os.path.join(tmp, "db")
+    idx._INDEX_FILE = os.path.join(idx._INDEX_DIR, "library_index.db")
+    library = os.path.join(tmp, "library")
+    os.makedirs(library)
+    config.LIBRARY_MOUNT_PATH = library
+
+    good, bad = b"genuine download", b"truncated downlo"
+    good_md5 = hashlib.md5(good).hexdigest()
+    for name, data in ((f"Title -- {good_md5} -- Anna's Archive.pdf", good),
+                       ("Title copy.pdf", good),
+                       (f"Other -- {hashlib.md5(b'x').hexdigest()} -- Anna's Archive.pdf", bad),
+                       ("Other copy.pdf", bad)):
+        with open(os.path.join(library, name), 'wb') as f:
+            f.write(data)
+
+    first = run_dedupe(scan_dir=library)
+    check("matching ID verified on full hash", first['md5_verified'], 1)
+    check("mismatching ID flagged", first['md5_mismatches'], 1)
+    check_true("mismatch logged",
+               any(l.startswith('\nARCHIVE MD5 MISMATCH') for l in first['log_lines']))
+
+    second = run_dedupe(scan_dir=library)
+    check("second run is all cache hits", second['files_hashed'], 0)
+    check("verified again from the stored md5", second['md5_verified'], 1)
+    check("still flagged from the stored md5", second['md5_mismatches'], 1)
+
+    off = run_dedupe(scan_dir=library, verify_md5=False)
+    check("check can be turned off", off['md5_mismatches'], 0)
+    config.LIBRARY_MOUNT_PATH = ''
+
+print("\n=== Section 16: block-tree rehash after a metadata edit ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    idx._INDEX_DIR  = os.path.join(tmp, "db")
+    idx._INDEX_FILE = os.path.join(idx._INDEX_DIR, "library_index.db")
+    library = os.path.join(tmp, "library")
+    os.makedirs(library)
+    config.LIBRARY_MOUNT_PATH = library
+
+    scan = os.urandom(8 * 1024 * 1024)
+    copies = [os.path.join(library, f"Scan {n}.pdf") for n in (1, 2)]
+    for path in copies:
+        with open(path, 'wb') as f:
+            f.write(scan)
+    first = run_dedupe(scan_dir=library, block_tree_min_mb=1)
+    check("both copies tree-hashed", first['files_hashed'], 2)
+    check("duplicate found", first['duplicates_found'], 1)
+
+    # Same Info dict written to both copies, appended as exiftool does
+    for path in copies:
+        with open(path, 'ab') as f:
+            f.write(b"\n1 0 obj << /Title (Scan) >> endobj\n")
+    second = run_dedupe(scan_dir=library, block_tree_min_mb=1)
+    check("matching tree digests confirmed by a full read",
+          (second['files_hashed'], second['tree_reused']), (2, 0))
+    check("still duplicates", second['duplicates_found'], 1)
+    check_true("confirmation reported",
+               any(l.startswith('Reused tree digests confirmed by a full read: 2')
+                   for l in second['log_lines']))
+
+    off = run_dedupe(scan_dir=library, block_tree_min_mb=0)
+    check("plain hashing when disabled", (off['files_hashed'], off['tree_reused']), (2, 0))
+
+    # A byte changed well inside the old blocks, then the same append to both:
+    # the spot check misses the edit, the confirming read doesn't
+    import utils
+    shutil.rmtree(library)
+    os.makedirs(library)
+    scan = os.urandom(20 * 1024 * 1024)
+    for path in copies:
+        with open(path, 'wb') as f:
+            f.write(scan)
+    run_dedupe(scan_dir=library, block_tree_min_mb=1)
+    with open(copies[0], 'r+b') as f:
+        f.seek(7 * 1024 * 1024)
+        f.write(bytes([scan[7 * 1024 * 1024] ^ 0xFF]))
+    for path in copies:
+        with open(path, 'ab') as f:
+            f.write(b"\n1 0 obj << /Title (Scan) >> endobj\n")
+    edited = run_dedupe(scan_dir=library, block_tree_min_mb=1)
+    check("edit inside the old blocks is not a duplicate", edited['duplicates_found'], 0)
+    check_true("both copies kept", all(os.path.exists(p) for p in copies))
+    conn, _ = idx.open_index(library)
+    check("stored tree matches a fresh hash",
+          idx.cached_block_tree(conn, copies[0])[2], utils.hash_file_tree(copies[0])['blocks'])
+    idx.close_index(conn, library, prune=False)
+
+    # Different scans sharing their first and last blocks: the reused
+    # digests differ, which rules both out without reading them again
+    shutil.rmtree(library)
+    os.makedirs(library)
+    edge = os.urandom(1024 * 1024)
+    for path in copies:
+        with open(path, 'wb') as f:
+            f.write(edge + os.urandom(6 * 1024 * 1024) + edge)
+    run_dedupe(scan_dir=library, block_tree_min_mb=1)
+    for path in copies:
+        with open(path, 'ab') as f:
+            f.write(b"\n1 0 obj << /Title (Scan) >> endobj\n")
+    differ = run_dedupe(scan_dir=library, block_tree_min_mb=1)
+    check("different scans ruled out from their trees",
+          (differ['tree_reused'], differ['duplicates_found']), (2, 0))
+    check_true("reuse reported",
+               any(l.startswith('Block trees reused: 2') for l in differ['log_lines']))
+    config.LIBRARY_MOUNT_PATH = ''
+
+# ── Unicode spellings ────────────────────────────────────────────────────────
+print("\n=== Section 17: NFC/NFD spellings of the same names ===")
+
+import unicodedata
+
+with tempfile.TemporaryDirectory() as tmp:
+    def write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    # A folder copied through macOS comes back with NFD names
+    for parent, form in (("Library", 'NFC'), ("Staging", 'NFD')):
+        series = os.path.join(tmp, parent, unicodedata.normalize(form, "Amélie"))
+        write(os.path.join(series, unicodedata.normalize(form, "Tôme 1.epub")), b"tome one")
+        write(os.path.join(series, unicodedata.normalize(form, "Tôme 2.epub")), b"tome two!")
+    result = run_dedupe(scan_dir=tmp, duplicate_dirs=True)
+    check("copies with decomposed names are one duplicate directory",
+          result['duplicate_dirs'], 1)
+
+    keeper, discards = dedupe._resolve_group(
+        [(os.path.join(tmp, "Z", unicodedata.normalize('NFD', "Élan.pdf")), tmp),
+         (os.path.join(tmp, "Z", "Elan1.pdf"), tmp)], tmp, [])
+    check("path length counts NFC characters",
+          keeper, os.path.join(tmp, "Z", unicodedata.normalize('NFD', "Élan.pdf")))
+
+# ── Read order ───────────────────────────────────────────────────────────────
+print("\n=== Section 18: I/O-ordered hashing ===")
+
+from library_index import CachedStat
+
+def _entry(path, dev, ino):
+    return {'path': path, 'st': CachedStat(1, 0.0, dev, ino)}
+
+shuffled = [_entry('/lib/B/x.pdf', 1, 50), _entry('/lib/A/y.pdf', 1, 90),
+            _entry('/lib/B/z.pdf', 1, 10), _entry('/usb/A/w.pdf', 0, 70),
+            _entry('/lib/A/v.pdf', 1, 20)]
+check("sorted by device, directory, then inode",
+      [e['path'] for e in dedupe._io_order(shuffled)],
+      ['/usb/A/w.pdf', '/lib/A/v.pdf', '/lib/A/y.pdf', '/lib/B/z.pdf', '/lib/B/x.pdf'])
+
 print(f"\n{'='*50}")
 print(f"Results: {PASS} passed, {FAIL} failed")
 if FAIL:
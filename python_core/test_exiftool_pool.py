@@ -0,0 +1,144 @@
+"""
+test_exiftool_pool.py — Validation suite for the -stay_open exiftool pool.
+Drives the pool against a small stand-in that speaks exiftool's -stay_open
+protocol (commands on stdin, {readyN} / -echo4 framing), so framing,
+timeouts and crash recovery can be checked without exiftool installed.
+Run: python3 test_exiftool_pool.py
+"""
+
+import sys
+import os
+import stat
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from exiftool_pool import ExiftoolPool
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+# Answers every command with "pid args..."; CRASH exits, SLEEP hangs,
+# FAIL reports status 1. One-shot calls (no -stay_open) answer once.
+FAKE_EXIFTOOL = r'''#!/usr/bin/env python3
+import os, sys, time
+if sys.argv[1:3] != ['-stay_open', 'True']:
+    print('oneshot', *sys.argv[1:])
+    sys.exit(0)
+args, echo = [], ''
+for line in sys.stdin:
+    line = line.rstrip('\n')
+    if args[-1:] == ['-stay_open'] and line == 'False':
+        sys.exit(0)
+    if args[-1:] == ['-echo4']:
+        args.pop()
+        echo = line
+        continue
+    if line.startswith('-execute'):
+        seq = line[len('-execute'):]
+        if 'CRASH' in args:
+            sys.exit(3)
+        if 'SLEEP' in args:
+            time.sleep(10)
+        status = '1' if 'FAIL' in args else '0'
+        if status == '1':
+            sys.stderr.write('Error: bad file\n')
+        sys.stdout.write(f"{os.getpid()} {' '.join(args)}\n{{ready{seq}}}\n")
+        sys.stdout.flush()
+        sys.stderr.write(echo.replace('${status}', status) + '\n')
+        sys.stderr.flush()
+        args = []
+        continue
+    args.append(line)
+'''
+
+with tempfile.TemporaryDirectory() as tmp:
+    fake = os.path.join(tmp, "exiftool")
+    with open(fake, 'w') as f:
+        f.write(FAKE_EXIFTOOL)
+    os.chmod(fake, os.stat(fake).st_mode | stat.S_IXUSR)
+
+    # ── Framing ──────────────────────────────────────────────────────────────
+    print("\n=== Section 1: one process, many commands ===")
+
+    pool = ExiftoolPool(size=1, command=fake)
+    first = pool.run(['-json', 'a.pdf'])
+    second = pool.run(['-json', 'b.pdf'])
+    check("stdout framed per command", first[0].split(' ', 1)[1], '-json a.pdf\n')
+    check("exit status from -echo4", (first[1], first[2]), ('', 0))
+    check_true("the same process answers both",
+               first[0].split()[0] == second[0].split()[0])
+    failed = pool.run(['FAIL', 'c.pdf'])
+    check("non-zero status and stderr passed through",
+          (failed[1], failed[2]), ('Error: bad file\n', 1))
+    check("arguments with newlines run one-shot",
+          pool.run(['-Description=two\nlines', 'd.pdf'])[0],
+          'oneshot -Description=two\nlines d.pdf\n')
+
+    # ── Recovery ─────────────────────────────────────────────────────────────
+    print("\n=== Section 2: crashes and timeouts ===")
+
+    pid = pool.run(['-ver'])[0].split()[0]
+    crashed = pool.run(['CRASH'])
+    check("a command that kills exiftool twice gives up", crashed[2], 1)
+    after = pool.run(['-ver'])
+    check_true("next call gets a fresh process",
+               after[2] == 0 and after[0].split()[0] != pid)
+
+    start = time.monotonic()
+    slow = pool.run(['SLEEP'], timeout=0.5)
+    check("timeout reported like before", (slow[1], slow[2]), ('exiftool timed out', 1))
+    check_true("and returns on time", time.monotonic() - start < 3)
+    check("pool still works after a timeout", pool.run(['-ver'])[2], 0)
+    pool.close()
+
+    # ── Concurrency ──────────────────────────────────────────────────────────
+    print("\n=== Section 3: threads share a bounded pool ===")
+
+    pool = ExiftoolPool(size=2, command=fake)
+    results = []
+    def worker(n):
+        for i in range(5):
+            results.append(pool.run(['-json', f'{n}-{i}.pdf']))
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check("every command answered", sum(1 for r in results if r[2] == 0), 20)
+    check_true("at most two processes used",
+               len({r[0].split()[0] for r in results}) <= 2)
+    check_true("answers match their commands",
+               all(r[0].split()[2].endswith('.pdf') for r in results))
+    pool.close()
+
+    missing = ExiftoolPool(command=os.path.join(tmp, "no-such-exiftool"))
+    check("missing exiftool reported like before", missing.run(['-ver']),
+          ('', 'exiftool not found in PATH', 1))
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
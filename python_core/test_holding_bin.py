@@ -0,0 +1,186 @@
+"""
+test_holding_bin.py — Validation suite for the content-addressed holding bin.
+Bins, restores and purges files inside a temp directory.
+Run: python3 test_holding_bin.py
+"""
+
+import sys
+import os
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import holding_bin
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def object_count(holding):
+    objects = os.path.join(holding, holding_bin.OBJECTS_DIR)
+    return sum(len(files) for _root, _dirs, files in os.walk(objects))
+
+
+# ── Binning ──────────────────────────────────────────────────────────────────
+print("\n=== Section 1: bin_file stores by digest ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    holding = os.path.join(tmp, "_DuplicateHoldingBin")
+    keeper  = os.path.join(tmp, "Author", "Book.pdf")
+    first   = os.path.join(tmp, "a", "Book.pdf")
+    second  = os.path.join(tmp, "b", "Book.pdf")     # same name, same content
+    other   = os.path.join(tmp, "c", "Book.pdf")     # same name, other content
+    write(keeper, b"book")
+    write(first, b"book")
+    write(second, b"book")
+    write(other, b"another book")
+
+    conn = holding_bin.open_bin(holding)
+    for path, data in ((first, b"book"), (second, b"book"), (other, b"another book")):
+        holding_bin.bin_file(conn, holding, path, digest(data), 'sha256', keeper, 'test')
+    entries = holding_bin.binned_entries(conn)
+
+    check("every copy has a manifest entry", [e['original'] for e in entries],
+          [first, second, other])
+    check("same-name files don't collide", object_count(holding), 2)
+    check_true("originals are gone", not any(os.path.exists(p) for p in (first, second, other)))
+    check("keeper recorded", entries[0]['keeper'], keeper)
+    check("path filter", [e['original'] for e in
+                          holding_bin.binned_entries(conn, path_prefix=os.path.join(tmp, "b"))],
+          [second])
+    check("sibling prefix isn't a match",
+          holding_bin.binned_entries(conn, path_prefix=os.path.join(tmp, "a", "Bo")), [])
+    holding_bin.close_bin(conn)
+
+    # ── Restore ──────────────────────────────────────────────────────────────
+    print("\n=== Section 2: restore ===")
+
+    write(other, b"something new in its place")
+    result = holding_bin.restore(holding)
+    check("occupied original path skipped", result,
+          {'restored': 2, 'skipped': 1, 'errors': 0})
+    check_true("both copies of the shared object restored",
+               open(first, 'rb').read() == b"book" and open(second, 'rb').read() == b"book")
+    check("object for restored entries removed", object_count(holding), 1)
+    check_true("newer file left alone", open(other, 'rb').read() == b"something new in its place")
+
+    result = holding_bin.restore(holding, overwrite=True)
+    check("overwrite restores the rest", result['restored'], 1)
+    check("bin is empty", object_count(holding), 0)
+
+    conn = holding_bin.open_bin(holding)
+    check("nothing left in the bin", holding_bin.binned_entries(conn), [])
+    events = conn.execute("SELECT action FROM events ORDER BY id").fetchall()
+    check("manifest only appends", [a for (a,) in events],
+          ['binned'] * 3 + ['restored'] * 3)
+    holding_bin.close_bin(conn)
+
+# ── Purge ────────────────────────────────────────────────────────────────────
+print("\n=== Section 3: purge ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    holding = os.path.join(tmp, "_DuplicateHoldingBin")
+    keeper  = os.path.join(tmp, "keep.pdf")
+    write(keeper, b"k")
+    conn = holding_bin.open_bin(holding)
+    for name in ("old.pdf", "new.pdf"):
+        path = os.path.join(tmp, name)
+        write(path, name.encode())
+        holding_bin.bin_file(conn, holding, path, digest(name.encode()), 'sha256', keeper, 'test')
+    old_id = holding_bin.binned_entries(conn)[0]['id']
+    holding_bin.close_bin(conn)
+
+    check("purge by id", holding_bin.purge(holding, ids=[old_id]), {'purged': 1})
+    check("purged object deleted", object_count(holding), 1)
+    check("purge with no filter empties the bin", holding_bin.purge(holding), {'purged': 1})
+    check("second purge has nothing to do", holding_bin.purge(holding), {'purged': 0})
+
+# ── Bulk restore ─────────────────────────────────────────────────────────────
+print("\n=== Section 4: bulk restore by prefix ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    holding = os.path.join(tmp, "_DuplicateHoldingBin")
+    keeper  = os.path.join(tmp, "keep.pdf")
+    write(keeper, b"k")
+    conn = holding_bin.open_bin(holding)
+    for i in range(500):
+        folder = "wrong" if i % 2 else "right"
+        path = os.path.join(tmp, folder, f"{i}.pdf")
+        write(path, str(i).encode())
+        holding_bin.bin_file(conn, holding, path, digest(str(i).encode()), 'sha256', keeper, 'test')
+    holding_bin.close_bin(conn)
+
+    result = holding_bin.restore(holding, path_prefix=os.path.join(tmp, "wrong"))
+    check("one call restores every copy under the prefix", result['restored'], 250)
+    check("other copies stay binned", object_count(holding), 250)
+
+# ── Directories ──────────────────────────────────────────────────────────────
+print("\n=== Section 5: bin_directory checks a stored tree before deleting ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    holding = os.path.join(tmp, "_DuplicateHoldingBin")
+    keeper  = os.path.join(tmp, "keep")
+    for name in ("a", "b", "c"):
+        write(os.path.join(tmp, name, "Series", "Book 1.epub"), b"book one")
+        write(os.path.join(tmp, name, "Series", "Extras", "Map.pdf"), b"the map")
+    # Same tree digest, but c also holds a file the digest never covered
+    write(os.path.join(tmp, "c", "Series", "notes.bak"), b"unique notes")
+    conn = holding_bin.open_bin(holding)
+    tree = digest(b"tree")
+    stored = holding_bin.bin_directory(conn, holding, os.path.join(tmp, "a", "Series"),
+                                       tree, 'sha256', keeper, 'test')
+    check("first copy moved in", os.path.exists(os.path.join(stored, "Extras", "Map.pdf")), True)
+
+    try:
+        holding_bin.bin_directory(conn, holding, os.path.join(tmp, "c", "Series"),
+                                  tree, 'sha256', keeper, 'test')
+        check_true("differing tree refused", False)
+    except OSError:
+        check_true("differing tree refused", True)
+    check_true("and left untouched",
+               os.path.exists(os.path.join(tmp, "c", "Series", "notes.bak"))
+               and os.path.exists(os.path.join(tmp, "c", "Series", "Extras", "Map.pdf")))
+
+    holding_bin.bin_directory(conn, holding, os.path.join(tmp, "b", "Series"),
+                              tree, 'sha256', keeper, 'test')
+    check("matching tree removed after comparison",
+          os.path.exists(os.path.join(tmp, "b", "Series")), False)
+    check("two tree entries binned",
+          len([e for e in holding_bin.binned_entries(conn) if e['kind'] == 'tree']), 2)
+    holding_bin.close_bin(conn)
+    check("both restore", holding_bin.restore(holding)['restored'], 2)
+    check_true("restored copy complete",
+               os.path.exists(os.path.join(tmp, "b", "Series", "Extras", "Map.pdf")))
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
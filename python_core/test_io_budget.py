@@ -0,0 +1,111 @@
+"""
+test_io_budget.py — Validation suite for the shared I/O budget.
+Times small token-bucket draws and budgeted copies inside a temp directory.
+Run: python3 test_io_budget.py
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import io_budget
+from io_budget import TokenBucket
+from utils import hash_file
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+MB = 1024 * 1024
+
+# ── Token bucket ─────────────────────────────────────────────────────────────
+print("\n=== Section 1: token bucket ===")
+
+bucket = TokenBucket(10 * MB)
+start = time.monotonic()
+bucket.consume(10 * MB)
+check_true("one second's burst passes at once", time.monotonic() - start < 0.05)
+start = time.monotonic()
+bucket.consume(2 * MB)
+elapsed = time.monotonic() - start
+check_true("beyond the burst waits for the rate", 0.15 <= elapsed < 0.5)
+
+# Four threads share one budget: together they take ~4x as long as one
+bucket = TokenBucket(20 * MB, burst=1)
+def draw():
+    for _ in range(4):
+        bucket.consume(MB)
+start = time.monotonic()
+threads = [threading.Thread(target=draw) for _ in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+elapsed = time.monotonic() - start
+check_true("threads share the budget instead of each getting it", 0.7 <= elapsed < 1.5)
+
+try:
+    TokenBucket(0)
+    check_true("zero rate rejected", False)
+except ValueError:
+    check_true("zero rate rejected", True)
+
+# ── Shared budget ────────────────────────────────────────────────────────────
+print("\n=== Section 2: shared budget for hashing and copies ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    src = os.path.join(tmp, "book.pdf")
+    with open(src, 'wb') as f:
+        f.write(os.urandom(3 * MB))
+
+    check("0 turns the budget off", io_budget.set_budget(0), None)
+    start = time.monotonic()
+    plain = hash_file(src)
+    check_true("unbudgeted hash doesn't wait", time.monotonic() - start < 0.5)
+
+    io_budget.set_budget(10)   # MB/s; the first 10 MB are the burst
+    io_budget.throttle(10 * MB)
+    start = time.monotonic()
+    check("budgeted hash gives the same digest", hash_file(src), plain)
+    check_true("hash reads drew from the budget", time.monotonic() - start >= 0.2)
+
+    start = time.monotonic()
+    dst = io_budget.copy_file(src, os.path.join(tmp, "copy.pdf"))
+    check_true("copies drew from the budget", time.monotonic() - start >= 0.2)
+    check("budgeted copy is complete", hash_file(dst), plain)
+    check("copy keeps the mtime", int(os.stat(dst).st_mtime), int(os.stat(src).st_mtime))
+    io_budget.set_budget(0)
+
+    with open(src, 'rb') as f:
+        io_budget.advise_sequential(f.fileno())
+        io_budget.advise_willneed(f.fileno(), 0, MB)
+        io_budget.advise_done(f.fileno())
+    check_true("readahead hints never fail", True)
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
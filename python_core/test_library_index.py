@@ -0,0 +1,326 @@
+"""
+test_library_index.py — Validation suite for the persistent hash index.
+Runs library_index against a throwaway database inside a temp directory.
+Run: python3 test_library_index.py
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import config
+import library_index as idx
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+def use_temp_index(tmp):
+    """Point the index at tmp/db and treat tmp/library as the NAS mount."""
+    idx._INDEX_DIR  = os.path.join(tmp, "db")
+    idx._INDEX_FILE = os.path.join(idx._INDEX_DIR, "library_index.db")
+    library = os.path.join(tmp, "library")
+    os.makedirs(library, exist_ok=True)
+    config.LIBRARY_MOUNT_PATH = library
+    return library
+
+# ── hash algorithm is part of the cache key ──────────────────────────────────
+print("\n=== Section 1: per-row hash algorithm ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    book = os.path.join(library, "book.pdf")
+    with open(book, 'wb') as f:
+        f.write(b"book bytes")
+
+    conn, persistent = idx.open_index(library)
+    check_true("library path opens in persistent mode", persistent)
+
+    idx.update_hash(book, "abc", conn, "blake2b")
+    idx.batch_commit(conn)
+    check("same algorithm is a cache hit",
+          idx.get_cached_hash(book, conn, "blake2b"), "abc")
+    check("different algorithm is a cache miss",
+          idx.get_cached_hash(book, conn, "sha256"), None)
+    idx.close_index(conn, library)
+
+# ── databases from older releases are upgraded in place ──────────────────────
+print("\n=== Section 2: schema migration ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    os.makedirs(idx._INDEX_DIR)
+    old = sqlite3.connect(idx._INDEX_FILE)
+    old.execute("CREATE TABLE file_index (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+                "file_size INTEGER NOT NULL, mtime REAL NOT NULL, last_seen REAL NOT NULL)")
+    old.execute("INSERT INTO file_index VALUES ('/old', 'digest', 1, 1.0, 1.0)")
+    old.commit()
+    old.close()
+
+    conn, _ = idx.open_index(library)
+    row = conn.execute("SELECT algorithm FROM file_index WHERE path = '/old'").fetchone()
+    check("old rows default to sha256", row, ("sha256",))
+    conn.close()
+
+# ── bulk preload and buffered writes ─────────────────────────────────────────
+print("\n=== Section 3: preload + buffered writes ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    books = []
+    for i in range(3):
+        path = os.path.join(library, f"book {i}.pdf")
+        with open(path, 'wb') as f:
+            f.write(b"x" * i)
+        books.append(path)
+    sibling = library + "-other"   # shares a string prefix, not a directory
+    os.makedirs(sibling)
+    outside = os.path.join(sibling, "other.pdf")
+    open(outside, 'wb').close()
+
+    conn, _ = idx.open_index(library)
+    for path in books + [outside]:
+        idx.update_hash(path, "digest-" + os.path.basename(path), conn)
+    check("writes are buffered until commit", len(conn.pending), 4)
+    idx.batch_commit(conn)
+    check("batch_commit flushes the buffer", len(conn.pending), 0)
+    idx.close_index(conn, library)
+
+    conn, _ = idx.open_index(library)
+    check("preload loads only rows under the scan root", len(conn.cache), 3)
+    queries = []
+    conn.set_trace_callback(queries.append)
+    check("preloaded lookup is a hit",
+          idx.get_cached_hash(books[1], conn, st=os.stat(books[1])), "digest-book 1.pdf")
+    check("preloaded lookups run no SQL", queries, [])
+    new_book = os.path.join(library, "new.pdf")
+    with open(new_book, 'wb') as f:
+        f.write(b"new")
+    check("unknown path under a preloaded root is a miss",
+          idx.get_cached_hash(new_book, conn), None)
+    check("path outside preloaded roots falls back to SQL",
+          idx.get_cached_hash(outside, conn), "digest-other.pdf")
+    idx.close_index(conn, library)
+
+# ── generation-based pruning ─────────────────────────────────────────────────
+print("\n=== Section 4: scan-generation pruning ===")
+
+def row_paths(library):
+    conn, _ = idx.open_index(library)
+    paths = sorted(os.path.basename(p) for (p,) in conn.execute("SELECT path FROM file_index"))
+    idx.close_index(conn, library, prune=False)
+    return paths
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    shelf = os.path.join(library, "shelf")
+    os.makedirs(shelf)
+    books = []
+    for name in ("kept.pdf", "unseen.pdf"):
+        path = os.path.join(shelf, name)
+        with open(path, 'wb') as f:
+            f.write(name.encode())
+        books.append(path)
+    elsewhere = os.path.join(library, "elsewhere.pdf")
+    open(elsewhere, 'wb').close()
+
+    conn, _ = idx.open_index(library)
+    for path in books + [elsewhere]:
+        idx.update_hash(path, "d", conn)
+    idx.close_index(conn, library)
+
+    # A cancelled run that only reached kept.pdf must not prune anything
+    conn, _ = idx.open_index(shelf)
+    idx.get_cached_hash(books[0], conn)
+    idx.close_index(conn, shelf, prune=False)
+    check("cancelled run keeps unseen rows",
+          row_paths(library), ["elsewhere.pdf", "kept.pdf", "unseen.pdf"])
+
+    # A complete scan of shelf/ that never saw unseen.pdf prunes it, even
+    # though it still exists on disk; rows outside shelf/ are untouched
+    conn, _ = idx.open_index(shelf)
+    idx.get_cached_hash(books[0], conn)
+    idx.close_index(conn, shelf)
+    check("complete run prunes only unseen rows under the scan root",
+          row_paths(library), ["elsewhere.pdf", "kept.pdf"])
+
+# ── inode-aware reuse after rename / move ────────────────────────────────────
+print("\n=== Section 5: renamed files keep their cached hash ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    old_path = os.path.join(library, "9780000000000 messy -- name.pdf")
+    with open(old_path, 'wb') as f:
+        f.write(b"contents that should not be re-read")
+
+    conn, _ = idx.open_index(library)
+    idx.update_hash(old_path, "known-digest", conn)
+    idx.close_index(conn, library)
+
+    new_dir = os.path.join(library, "Fortune Dion")
+    os.makedirs(new_dir)
+    new_path = os.path.join(new_dir, "Fortune Dion--Clean Name.pdf")
+    os.rename(old_path, new_path)
+
+    conn, _ = idx.open_index(library)
+    check("renamed file is a cache hit via its inode",
+          idx.get_cached_hash(new_path, conn), "known-digest")
+    check("algorithm still has to match",
+          idx.get_cached_hash(os.path.join(new_dir, "x"), conn, "blake2b",
+                              st=os.stat(new_path)), None)
+    idx.close_index(conn, library)
+
+    conn, _ = idx.open_index(library)
+    rows = conn.execute("SELECT path, sha256 FROM file_index").fetchall()
+    check("row now lives under the new path only", rows, [(new_path, "known-digest")])
+    idx.close_index(conn, library, prune=False)
+
+    # Same inode number but different size/mtime means the inode was reused
+    with open(new_path, 'ab') as f:
+        f.write(b" - edited")
+    moved_again = os.path.join(library, "edited.pdf")
+    os.rename(new_path, moved_again)
+    conn, _ = idx.open_index(library)
+    check("changed content behind a known inode is a miss",
+          idx.get_cached_hash(moved_again, conn), None)
+    idx.close_index(conn, library, prune=False)
+
+# ── MD5 stored next to the digest ────────────────────────────────────────────
+print("\n=== Section 6: stored MD5 ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    book = os.path.join(library, "book.pdf")
+    with open(book, 'wb') as f:
+        f.write(b"book bytes")
+
+    conn, _ = idx.open_index(library)
+    idx.update_hash(book, "digest-1", conn, md5="abcdef")
+    idx.close_index(conn, library)
+
+    conn, _ = idx.open_index(library)
+    idx.get_cached_hash(book, conn)
+    check("md5 available after a cache hit", idx.cached_md5(conn, book), "abcdef")
+    check("lookup by archive md5", idx.find_by_md5(conn, ["ABCDEF"]), {"abcdef": [book]})
+    check("lookup limited to a root",
+          idx.find_by_md5(conn, ["abcdef"], os.path.join(tmp, "elsewhere")), {})
+    idx.update_hash(book, "digest-1", conn)
+    idx.batch_commit(conn)
+    check("rewrite of the same digest keeps md5",
+          conn.execute("SELECT md5 FROM file_index").fetchone()[0], "abcdef")
+    idx.update_hash(book, "digest-2", conn)
+    idx.close_index(conn, library)
+
+    conn, _ = idx.open_index(library)
+    check("new digest without md5 clears the stale one",
+          conn.execute("SELECT md5 FROM file_index").fetchone()[0], None)
+    idx.close_index(conn, library, prune=False)
+
+# ── Block trees ──────────────────────────────────────────────────────────────
+print("\n=== Section 7: block trees ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    book = os.path.join(library, "scan.pdf")
+    gone = os.path.join(library, "gone.pdf")
+    for path in (book, gone):
+        with open(path, 'wb') as f:
+            f.write(b"scan")
+
+    conn, _ = idx.open_index(library)
+    idx.update_hash(book, "root-1", conn, "sha256-tree", tree=(1024, b"\x01" * 32))
+    idx.update_hash(gone, "root-2", conn, "sha256-tree", tree=(1024, b"\x02" * 32))
+    check("tree readable before commit", idx.cached_block_tree(conn, book),
+          (1024, 4, b"\x01" * 32))
+    check("no tree for a plain row", idx.cached_block_tree(conn, os.path.join(library, "x")), None)
+    idx.close_index(conn, library)
+
+    os.remove(gone)
+    conn, _ = idx.open_index(library)
+    idx.get_cached_hash(book, conn, "sha256-tree")
+    idx.close_index(conn, library)
+    conn = sqlite3.connect(idx._INDEX_FILE)
+    check("tree of a pruned file is dropped",
+          [p for (p,) in conn.execute("SELECT path FROM block_tree")], [book])
+    conn.close()
+
+# ── Unicode normalization of path keys ──────────────────────────────────────
+print("\n=== Section 8: NFC path keys ===")
+
+import unicodedata
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    nfc = os.path.join(library, unicodedata.normalize('NFC', "Café"))
+    nfd = os.path.join(library, unicodedata.normalize('NFD', "Café"))
+    os.makedirs(nfc)
+    os.symlink(nfc, nfd)   # one folder reachable under both spellings
+    book_nfc = os.path.join(nfc, "Livre.pdf")
+    book_nfd = os.path.join(nfd, "Livre.pdf")
+    with open(book_nfc, 'wb') as f:
+        f.write(b"un livre")
+
+    conn, _ = idx.open_index(library)
+    idx.update_hash(book_nfc, "digest-1", conn)
+    idx.close_index(conn, library, prune=False)
+
+    conn, _ = idx.open_index(library)
+    check("NFD spelling of an NFC-indexed file is a cache hit",
+          idx.get_cached_hash(book_nfd, conn), "digest-1")
+    idx.batch_commit(conn)
+    check("one row, keyed in NFC",
+          conn.execute("SELECT path FROM file_index").fetchall(), [(book_nfc,)])
+    check("lookups return the spelling last seen on disk",
+          idx.find_by_digests(conn, library, ["digest-1"]), {"digest-1": [book_nfd]})
+    idx.close_index(conn, library, prune=False)
+
+with tempfile.TemporaryDirectory() as tmp:
+    library = use_temp_index(tmp)
+    folder = os.path.join(library, unicodedata.normalize('NFD', "Müller"))
+    os.makedirs(folder)
+    book = os.path.join(folder, "Buch.pdf")
+    with open(book, 'wb') as f:
+        f.write(b"ein buch")
+    st = os.stat(book)
+    os.makedirs(idx._INDEX_DIR)
+    old = sqlite3.connect(idx._INDEX_FILE)
+    old.execute("CREATE TABLE file_index (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+                "file_size INTEGER NOT NULL, mtime REAL NOT NULL, last_seen REAL NOT NULL)")
+    old.execute("INSERT INTO file_index VALUES (?, 'old-digest', ?, ?, 1.0)",
+                (book, st.st_size, st.st_mtime))
+    old.commit()
+    old.close()
+
+    conn, _ = idx.open_index(library)
+    check("raw NFD rows are re-keyed on upgrade",
+          conn.execute("SELECT path, disk_path FROM file_index").fetchall(),
+          [(unicodedata.normalize('NFC', book), book)])
+    check("and still hit", idx.get_cached_hash(book, conn), "old-digest")
+    idx.close_index(conn, library)
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
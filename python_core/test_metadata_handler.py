@@ -0,0 +1,326 @@
+"""
+test_metadata_handler.py — Validation suite for batched metadata reads.
+Points metadata_handler at a stand-in exiftool (speaks -stay_open, answers
+-json with one record per existing file) and builds small EPUBs with lxml,
+so read_metadata_many and the metadata cache can be checked against
+read_metadata without exiftool installed.
+Run: python3 test_metadata_handler.py
+"""
+
+import sys
+import os
+import stat
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import config
+import library_index
+import metadata_cache
+import metadata_handler
+from metadata_handler import read_metadata, read_metadata_many, write_metadata
+from organizer import organize_library
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+# Logs each command's file count to $FAKE_LOG; a file named CRASH* kills it,
+# one named BLANK* gets an error record
+FAKE_EXIFTOOL = r'''#!/usr/bin/env python3
+import json, os, sys
+def answer(args):
+    files = [a for i, a in enumerate(args)
+             if not a.startswith('-') and args[i - 1:i] != ['-charset']]
+    with open(os.environ['FAKE_LOG'], 'a') as log:
+        log.write(f"{len(files)}\n")
+    if any(os.path.basename(f).startswith('CRASH') for f in files) and len(files) > 1:
+        sys.exit(3)
+    records, failed = [], False
+    for f in files:
+        if os.path.basename(f).startswith('BLANK'):
+            records.append({'SourceFile': f, 'ExifTool:Error': 'File format error'})
+            failed = True
+        elif os.path.exists(f):
+            name = os.path.basename(f)
+            records.append({'SourceFile': f, 'XMP-dc:Title': f'Exif {name}',
+                            'PDF:Author': 'Exif Author', 'XMP-dc:Subject': ['a', 'b']})
+            if args and args[0] == '-overwrite_original':
+                with open(f, 'ab') as out:
+                    out.write(b'%written')
+    return json.dumps(records) if records else '', failed or len(records) < len(files)
+if sys.argv[1:3] != ['-stay_open', 'True']:
+    out, failed = answer(sys.argv[1:])
+    print(out)
+    sys.exit(1 if failed else 0)
+args, echo = [], ''
+for line in sys.stdin:
+    line = line.rstrip('\n')
+    if args[-1:] == ['-stay_open'] and line == 'False':
+        sys.exit(0)
+    if args[-1:] == ['-echo4']:
+        args.pop()
+        echo = line
+        continue
+    if line.startswith('-execute'):
+        out, failed = answer(args)
+        if failed:
+            sys.stderr.write('Error: File not found\n')
+        sys.stdout.write(f"{out}\n{{ready{line[len('-execute'):]}}}\n")
+        sys.stdout.flush()
+        sys.stderr.write(echo.replace('${status}', '1' if failed else '0') + '\n')
+        sys.stderr.flush()
+        args = []
+        continue
+    args.append(line)
+'''
+
+CONTAINER = b'''<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>'''
+
+OPF = '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title>{title}</dc:title>{creator}
+    <meta name="calibre:series" content="Voyages"/>
+  </metadata>
+</package>'''
+
+def make_epub(path, title, creator=''):
+    if creator:
+        creator = f'\n    <dc:creator>{creator}</dc:creator>'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip')
+        z.writestr('META-INF/container.xml', CONTAINER)
+        z.writestr('OEBPS/content.opf', OPF.format(title=title, creator=creator))
+
+def calls():
+    with open(os.environ['FAKE_LOG']) as f:
+        return [int(n) for n in f.read().split()]
+
+def reset_calls():
+    open(os.environ['FAKE_LOG'], 'w').close()
+
+with tempfile.TemporaryDirectory() as tmp:
+    # Persistent cache rows go to tmp/db, for files under tmp/lib only
+    library_index._INDEX_DIR = os.path.join(tmp, "db")
+    library_index._INDEX_FILE = os.path.join(library_index._INDEX_DIR, "library_index.db")
+    config.LIBRARY_MOUNT_PATH = os.path.join(tmp, "lib")
+
+    fake = os.path.join(tmp, "exiftool")
+    with open(fake, 'w') as f:
+        f.write(FAKE_EXIFTOOL)
+    os.chmod(fake, os.stat(fake).st_mode | stat.S_IXUSR)
+    os.environ['FAKE_LOG'] = os.path.join(tmp, "calls.log")
+    reset_calls()
+    metadata_handler.EXIFTOOL = fake
+
+    lib = os.path.join(tmp, "lib")
+    os.makedirs(lib)
+    paths = []
+    for i in range(7):
+        p = os.path.join(lib, f"book{i}.pdf")
+        open(p, 'wb').close()
+        paths.append(p)
+    epub = os.path.join(lib, "voyage.epub")
+    make_epub(epub, "The Voyage Out")
+    paths.insert(3, epub)
+    missing = os.path.join(lib, "gone.pdf")
+    paths.insert(5, missing)
+    # Files last modified a minute ago, as in a library left alone
+    for p in paths:
+        if os.path.exists(p):
+            os.utime(p, (time.time() - 60, time.time() - 60))
+
+    # ── Batching ─────────────────────────────────────────────────────────────
+    print("\n=== Section 1: batched reads match single reads ===")
+
+    single = {p: read_metadata(p) for p in paths}
+    check("single reads: one exiftool call per file", len(calls()), len(paths))
+    metadata_cache.clear_memory()
+    with metadata_cache._lock:
+        metadata_cache._connection().execute("DELETE FROM metadata_cache")
+    reset_calls()
+
+    results = list(read_metadata_many(paths, batch_size=4))
+    check("results in input order", [p for p, _ in results], paths)
+    check("same records as read_metadata", dict(results), single)
+    check("one exiftool call per batch of 4", sorted(calls()), [1, 4, 4])
+    check("EPUB title from the OPF", dict(results)[epub]['title'], "The Voyage Out")
+    check("EPUB blanks filled by exiftool",
+          (dict(results)[epub]['series'], dict(results)[epub]['creator']),
+          ("Voyages", "Exif Author"))
+    check("missing file comes back blank", dict(results)[missing]['title'], '')
+    check("empty input yields nothing", list(read_metadata_many([])), [])
+
+    # ── Failures and laziness ────────────────────────────────────────────────
+    print("\n=== Section 2: failed batches and lazy input ===")
+
+    crash = os.path.join(tmp, "CRASH.pdf")
+    open(crash, 'wb').close()
+    others = [os.path.join(tmp, "book0.pdf"), os.path.join(tmp, "book1.pdf")]
+    for p in others:
+        open(p, 'wb').close()
+    batch = others + [crash]
+    results = dict(read_metadata_many(batch, batch_size=10))
+    check("a batch that kills exiftool is re-read file by file",
+          [results[p]['title'] for p in batch],
+          ["Exif book0.pdf", "Exif book1.pdf", "Exif CRASH.pdf"])
+
+    metadata_cache.clear_memory()
+
+    consumed = []
+    def walk():
+        for p in paths:
+            consumed.append(p)
+            yield p
+    stream = read_metadata_many(walk(), batch_size=2, workers=1)
+    first = next(stream)
+    check("first result is the first path", first[0], paths[0])
+    check_true("input consumed a few batches at a time", len(consumed) <= 4)
+    stream.close()
+    check_true("closing early stops consuming input", len(consumed) <= 4)
+
+    # ── Cache ────────────────────────────────────────────────────────────────
+    print("\n=== Section 3: metadata cache ===")
+
+    metadata_cache.clear_memory()
+    first = list(read_metadata_many(paths, batch_size=4))
+    reset_calls()
+    opf_reads = []
+    real_epub_xmp = metadata_handler._epub_xmp
+    metadata_handler._epub_xmp = lambda p: opf_reads.append(p) or real_epub_xmp(p)
+    again = list(read_metadata_many(paths, batch_size=4))
+    check("unchanged files: same records", again, first)
+    check("unchanged files: only the missing one goes to exiftool", calls(), [1])
+    check("unchanged EPUB isn't opened", opf_reads, [])
+
+    metadata_cache.clear_memory()
+    reset_calls()
+    check("persistent layer survives a restart", read_metadata(paths[0]), dict(first)[paths[0]])
+    check("persistent hit reads nothing", calls(), [])
+
+    with open(paths[1], 'ab') as f:
+        f.write(b'more')
+    reset_calls()
+    read_metadata(paths[1])
+    check("a changed size is a miss", calls(), [1])
+
+    reset_calls()
+    ok, _ = write_metadata(paths[2], {'title': 'New'})
+    check("write_metadata succeeds", ok, True)
+    written = calls()
+    reset_calls()
+    read_metadata(paths[2])
+    check("write refreshes the cached record", (written, calls()), ([1, 1], []))
+
+    outside = os.path.join(tmp, "book0.pdf")
+    read_metadata(outside)
+    with metadata_cache._lock:
+        rows = {r[0] for r in metadata_cache._connection().execute(
+            "SELECT path FROM metadata_cache")}
+    check_true("files outside the library mount stay in memory only",
+               outside not in rows and paths[0] in rows)
+
+    config.METADATA_CACHE_ENTRIES = 2
+    metadata_cache.clear_memory()
+    for p in others + [crash]:
+        read_metadata(p)
+    check("in-process layer keeps the most recent entries",
+          list(metadata_cache._memory), [others[1], crash])
+    reset_calls()
+    read_metadata(crash)
+    read_metadata(others[0])
+    check("evicted entries are read again", calls(), [1])
+    config.METADATA_CACHE_ENTRIES = 5000
+
+    # ── Organizer ────────────────────────────────────────────────────────────
+    print("\n=== Section 4: organize dry run over an unchanged library ===")
+
+    organize_library(lib, os.path.join(tmp, "out"), dry_run=True,
+                     progress_callback=lambda msg: None)
+    metadata_cache.clear_memory()
+    reset_calls()
+    opf_reads.clear()
+    result = organize_library(lib, os.path.join(tmp, "out"), dry_run=True,
+                              progress_callback=lambda msg: None)
+    check("second dry run plans every file", result['errors'], 0)
+    check("second dry run makes no exiftool calls", calls(), [])
+    check("second dry run opens no EPUB", opf_reads, [])
+    metadata_handler._epub_xmp = real_epub_xmp
+
+    # ── EPUB fast path ───────────────────────────────────────────────────────
+    print("\n=== Section 5: EPUBs with a complete OPF skip exiftool ===")
+
+    complete = os.path.join(tmp, "woolf.epub")
+    make_epub(complete, "Orlando", creator="Virginia Woolf")
+    opens = []
+    real_zipfile = zipfile.ZipFile
+    class CountingZipFile(real_zipfile):
+        def __init__(self, file, *args, **kwargs):
+            opens.append(file)
+            super().__init__(file, *args, **kwargs)
+    zipfile.ZipFile = CountingZipFile
+    reset_calls()
+    xmp = read_metadata(complete)
+    zipfile.ZipFile = real_zipfile
+    check("all fields from the OPF", (xmp['title'], xmp['creator'], xmp['series']),
+          ("Orlando", "Virginia Woolf", "Voyages"))
+    check("archive opened once", len(opens), 1)
+    check("no exiftool call", calls(), [])
+
+    incomplete = os.path.join(tmp, "untitled.epub")
+    make_epub(incomplete, "Between the Acts")
+    metadata_cache.clear_memory()
+    reset_calls()
+    results = dict(read_metadata_many([complete, incomplete, others[0]]))
+    check("batch sends only the incomplete EPUB and the PDF", calls(), [2])
+    check("OPF without a creator still gets exiftool's",
+          results[incomplete]['creator'], "Exif Author")
+    check("complete EPUB record cached", metadata_cache.get(
+          complete, metadata_cache.fingerprint(complete)), results[complete])
+
+    # ── Fallback readers ─────────────────────────────────────────────────────
+    print("\n=== Section 6: organizer fallback only without an exiftool record ===")
+
+    import organizer
+    fallback_reads = []
+    real_pdf_meta = organizer._extract_pdf_meta
+    organizer._extract_pdf_meta = lambda p: fallback_reads.append(p) or {'title': 'From pypdf'}
+    blank = os.path.join(lib, "BLANK.pdf")
+    open(blank, 'wb').close()
+    read_metadata(blank)
+    check("error record isn't cached", metadata_handler.exiftool_covered(blank), False)
+    check("fallback reader used", organizer.get_file_metadata(blank)['title'], "From pypdf")
+    check("answered file is covered", metadata_handler.exiftool_covered(paths[0]), True)
+    organizer.get_file_metadata(paths[0], dict(metadata_handler.EMPTY_XMP))
+    check("fallback skipped where exiftool answered", fallback_reads, [blank])
+    organizer._extract_pdf_meta = real_pdf_meta
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
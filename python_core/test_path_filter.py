@@ -0,0 +1,115 @@
+"""
+test_path_filter.py — Validation suite for the compiled include/exclude rules.
+Pure matching checks plus walks of small trees inside a temp directory.
+Run: python3 test_path_filter.py
+"""
+
+import sys
+import os
+import json
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from path_filter import compile_rules, literal_names, load_module_rules
+from walker import walk_files
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+def write(path, data=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def walked(tmp, path_filter):
+    return sorted(os.path.relpath(e.path, tmp).replace(os.sep, '/')
+                  for e in walk_files(tmp, path_filter=path_filter))
+
+
+# ── Matching ─────────────────────────────────────────────────────────────────
+print("\n=== Section 1: names, paths and globs ===")
+
+f = compile_rules({'excluded_folders': ['tmp_*', 'Books/Old'],
+                   'excluded_files': ['*.part', 'Thumbs.db'],
+                   'excluded_extensions': ['JPG', '.tar.gz']})
+check_true("folder glob matches the name anywhere", not f.enter_folder('tmp_1', 'a/b/tmp_1', True))
+check_true("pattern with '/' matches the relative path", not f.enter_folder('Old', 'Books/Old', True))
+check_true("...but not the same name elsewhere", f.enter_folder('Old', 'Papers/Old', True))
+check_true("file glob", not f.keep_file('x.part', 'a/x.part'))
+check_true("literal file name", not f.keep_file('Thumbs.db', 'a/Thumbs.db'))
+check_true("extensions are case-insensitive", not f.keep_file('Cover.jpg', 'Cover.jpg'))
+check_true("multi-part extension", not f.keep_file('a.TAR.GZ', 'a.TAR.GZ'))
+check_true("other files kept", f.keep_file('Book.pdf', 'a/Book.pdf'))
+
+g = compile_rules(excluded_folders=literal_names(['Books [2020]']))
+check_true("literal_names never act as globs",
+           not g.enter_folder('Books [2020]', 'Books [2020]', True)
+           and g.enter_folder('Books 2', 'Books 2', True))
+try:
+    compile_rules(excluded_dirs=['x'])
+    check_true("unknown rule key rejected", False)
+except ValueError:
+    check_true("unknown rule key rejected", True)
+
+# ── Inclusions ───────────────────────────────────────────────────────────────
+print("\n=== Section 2: inclusions, pruning and precedence ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    for rel in ("a.pdf", "Books/b.pdf", "Books/c.epub", "Books/Old/d.pdf",
+                "Papers/e.pdf", "Papers/Books/f.pdf"):
+        write(os.path.join(tmp, rel))
+
+    check("included_folders by name",
+          walked(tmp, compile_rules(included_folders=['Books'])),
+          ['Books/Old/d.pdf', 'Books/b.pdf', 'Books/c.epub', 'Papers/Books/f.pdf'])
+    check("included_extensions",
+          walked(tmp, compile_rules(included_extensions=['epub'])), ['Books/c.epub'])
+    check("exclusions win over inclusions",
+          walked(tmp, compile_rules(included_folders=['Books'], excluded_folders=['Old'],
+                                    excluded_files=['c.*'])),
+          ['Books/b.pdf', 'Papers/Books/f.pdf'])
+
+    literal = compile_rules(included_folders=['Books/Old'])
+    check("literal include path", walked(tmp, literal), ['Books/Old/d.pdf'])
+    check_true("folders off its way are pruned",
+               not literal.enter_folder('Papers', 'Papers', False)
+               and literal.enter_folder('Books', 'Books', False))
+
+# ── Schema config ────────────────────────────────────────────────────────────
+print("\n=== Section 3: rules from the schema config.json ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "config.json")
+    with open(path, 'w') as fh:
+        json.dump({'data_librarian': {'weeding': {
+            'excluded_folders': ['@eaDir'], 'included_files': [], 'title': 'x'}}}, fh)
+    check("module section read", load_module_rules('weeding', path),
+          {'excluded_folders': ['@eaDir'], 'included_files': []})
+    check("missing section", load_module_rules('segmenting', path), {})
+    check("missing file", load_module_rules('weeding', os.path.join(tmp, "none.json")), {})
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
@@ -0,0 +1,159 @@
+"""
+test_utils.py — Validation suite for the utils hashing engine.
+Checks hash_file() against hashlib for every algorithm, read path and
+awkward block size.
+Run: python3 test_utils.py
+"""
+
+import sys
+import os
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils import hash_file_multi, hash_file_tree, TREE_BLOCK_SIZE, hash_file, calculate_sha256, calculate_partial_sha256
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+# ── hash_file ────────────────────────────────────────────────────────────────
+print("\n=== Section 1: hash_file ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    data = os.urandom(300_001)
+    path = os.path.join(tmp, "random.bin")
+    with open(path, 'wb') as f:
+        f.write(data)
+    empty = os.path.join(tmp, "empty.bin")
+    open(empty, 'wb').close()
+
+    for algorithm in ('sha256', 'blake2b'):
+        expected = hashlib.new(algorithm, data).hexdigest()
+        check(f"{algorithm} buffered read matches hashlib",
+              hash_file(path, algorithm), expected)
+        check(f"{algorithm} odd block size matches hashlib",
+              hash_file(path, algorithm, block_size=4093), expected)
+        check(f"{algorithm} mmap read matches hashlib",
+              hash_file(path, algorithm, block_size=65536, use_mmap=True), expected)
+        check(f"{algorithm} empty file via mmap",
+              hash_file(empty, algorithm, use_mmap=True),
+              hashlib.new(algorithm).hexdigest())
+
+    check("calculate_sha256 still returns SHA-256",
+          calculate_sha256(path), hashlib.sha256(data).hexdigest())
+    check("missing file returns None",
+          hash_file(os.path.join(tmp, "missing.bin")), None)
+
+    try:
+        hash_file(path, 'md4')
+        check_true("unknown algorithm raises ValueError", False)
+    except ValueError:
+        check_true("unknown algorithm raises ValueError", True)
+
+# ── calculate_partial_sha256 ─────────────────────────────────────────────────
+print("\n=== Section 2: calculate_partial_sha256 ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "partial.bin")
+    data = b"head" + b"x" * 100 + b"tail"
+    with open(path, 'wb') as f:
+        f.write(data)
+    check("partial hash covers head and tail only",
+          calculate_partial_sha256(path, 4),
+          hashlib.sha256(b"headtail").hexdigest())
+    check("edge larger than file hashes the whole file",
+          calculate_partial_sha256(path, 1000),
+          hashlib.sha256(data).hexdigest())
+
+print("\n=== Section 3: hash_file_multi ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    data = os.urandom(200_003)
+    path = os.path.join(tmp, "multi.bin")
+    with open(path, 'wb') as f:
+        f.write(data)
+    expected = {'sha256': hashlib.sha256(data).hexdigest(),
+                'md5': hashlib.md5(data).hexdigest()}
+    check("sha256 + md5 in one read", hash_file_multi(path, ('sha256', 'md5')), expected)
+    check("same through mmap",
+          hash_file_multi(path, ('sha256', 'md5'), block_size=4096, use_mmap=True), expected)
+    check("missing file returns None",
+          hash_file_multi(os.path.join(tmp, "missing.bin")), None)
+    try:
+        hash_file_multi(path, ('sha256', 'crc32'))
+        check_true("unknown digest raises ValueError", False)
+    except ValueError:
+        check_true("unknown digest raises ValueError", True)
+
+print("\n=== Section 4: hash_file_tree ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "scan.pdf")
+    data = os.urandom(24 * TREE_BLOCK_SIZE + 777)
+    with open(path, 'wb') as f:
+        f.write(data)
+    first = hash_file_tree(path, extra=('md5',))
+    check("full read covers the file", first['bytes_read'], len(data))
+    check("md5 computed in the same read", first['md5'], hashlib.md5(data).hexdigest())
+    check_true("tree digest differs from a plain hash", first['digest'] != hash_file(path))
+
+    # An appended incremental update, like exiftool's PDF edits
+    with open(path, 'ab') as f:
+        f.write(b"\n% Info dict update\n" * 1000)
+    previous = (first['block_size'], len(data), first['blocks'])
+    grown = hash_file_tree(path, previous=previous)
+    fresh = hash_file_tree(path)
+    check("rehash from the stored tree matches a full one", grown['digest'], fresh['digest'])
+    check_true("only samples and the tail were read",
+               grown['reused'] and grown['bytes_read'] < len(data) // 2)
+
+    # An edit inside an unsampled old block: the reused digest can't see it
+    with open(path, 'r+b') as f:
+        f.seek(7 * TREE_BLOCK_SIZE)
+        f.write(bytes([data[7 * TREE_BLOCK_SIZE] ^ 0xFF]))
+    missed = hash_file_tree(path, previous=previous)
+    check_true("reused digest is only provisional",
+               missed['reused'] and missed['digest'] != hash_file_tree(path)['digest'])
+
+    with open(path, 'r+b') as f:
+        f.truncate(len(data) - 1)
+    check("a shrunk file is read in full",
+          hash_file_tree(path, previous=previous)['reused'], False)
+
+# ── path_key ─────────────────────────────────────────────────────────────────
+print("\n=== Section 5: path_key ===")
+
+import unicodedata
+from utils import path_key
+
+nfd = os.path.join("/library", unicodedata.normalize('NFD', "Émile Zola"), "Nana.pdf")
+nfc = os.path.join("/library", unicodedata.normalize('NFC', "Émile Zola"), "Nana.pdf")
+check_true("spellings differ on disk", nfd != nfc)
+check("NFD and NFC paths share one key", path_key(nfd), path_key(nfc))
+check("key is absolute", path_key("x.pdf"), os.path.abspath("x.pdf"))
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
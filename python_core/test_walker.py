@@ -0,0 +1,172 @@
+"""
+test_walker.py — Validation suite for the shared directory walker.
+Walks small trees inside a temp directory.
+Run: python3 test_walker.py
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import walker
+from walker import walk_files
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+def write(path, data=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def make_tree(tmp):
+    for rel in ("top.pdf", "a/one.pdf", "a/deep/two.pdf", "b/three.epub",
+                "b/.DS_Store", "_DuplicateHoldingBin/binned.pdf", "out/done.pdf"):
+        write(os.path.join(tmp, rel), rel.encode())
+
+def relpaths(entries, tmp):
+    return sorted(os.path.relpath(e.path, tmp) for e in entries)
+
+
+# ── Exclusions ───────────────────────────────────────────────────────────────
+print("\n=== Section 1: exclusions and stats ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    make_tree(tmp)
+    entries = list(walk_files(tmp, {'_DuplicateHoldingBin'}, {'.DS_Store'},
+                              excluded_paths=[os.path.join(tmp, "out")]))
+    check("excluded names and paths pruned", relpaths(entries, tmp),
+          ['a/deep/two.pdf', 'a/one.pdf', 'b/three.epub', 'top.pdf'])
+    check_true("each entry carries its stat",
+               all(e.stat.st_size == len(os.path.relpath(e.path, tmp)) for e in entries))
+    check_true("root is the walked folder", all(e.root == tmp for e in entries))
+    check_true("no stat when not asked",
+               all(e.stat is None for e in walk_files(tmp, with_stat=False)))
+
+# ── Order ────────────────────────────────────────────────────────────────────
+print("\n=== Section 2: same order on any number of threads ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    for d in range(20):
+        for f in range(5):
+            write(os.path.join(tmp, f"d{d}", f"s{f % 2}", f"{f}.pdf"))
+    serial = [e.path for e in walk_files(tmp, workers=1)]
+    threaded = [e.path for e in walk_files(tmp, workers=8)]
+    check("threaded walk yields the serial order", threaded, serial)
+    check("every file found", len(serial), 100)
+
+    stop = threading.Event()
+    seen = []
+    for entry in walk_files(tmp, stop_event=stop):
+        seen.append(entry)
+        stop.set()
+    check_true("stop_event ends the walk early", len(seen) < 100)
+
+    # A consumer that hasn't moved on yet holds back the listings
+    listed = []
+    real_list_dir = walker._list_dir
+    walker._list_dir = lambda dirpath, *args: listed.append(dirpath) or real_list_dir(dirpath, *args)
+    try:
+        entries = walk_files(tmp, workers=2)
+        next(entries)
+        time.sleep(0.2)
+        ahead = len(listed)
+        rest = sum(1 for _ in entries)
+    finally:
+        walker._list_dir = real_list_dir
+    # Popped so far: the root, d0 and d0/s0; the rest is the window (61 dirs in all)
+    check_true("listings stay a bounded window ahead",
+               ahead <= 3 + 2 * walker._LISTINGS_AHEAD_PER_WORKER)
+    check("bounded walk still finds every file", rest + 1, 100)
+
+# ── Listing cache hooks ──────────────────────────────────────────────────────
+print("\n=== Section 3: listing cache hooks ===")
+
+with tempfile.TemporaryDirectory() as tmp:
+    make_tree(tmp)
+    recorded = {}
+    def record(dirpath, mtime, files, subdirs):
+        recorded[dirpath] = (mtime, files, subdirs)
+    first = list(walk_files(tmp, excluded_files={'.DS_Store'}, record_listing=record))
+    check_true("recorded listings keep excluded names",
+               '.DS_Store' in [n for n, _st in recorded[os.path.join(tmp, "b")][1]])
+    check_true("but they aren't yielded",
+               not any(e.path.endswith('.DS_Store') for e in first))
+
+    def cached(dirpath, mtime):
+        entry = recorded.get(dirpath)
+        return (entry[1], entry[2]) if entry and entry[0] == mtime else None
+    real_scandir = os.scandir
+    def failing_scandir(path):
+        raise AssertionError(f"listed {path}")
+    os.scandir = failing_scandir
+    try:
+        again = list(walk_files(tmp, excluded_files={'.DS_Store'}, cached_listing=cached))
+    finally:
+        os.scandir = real_scandir
+    check("unchanged directories served from the cache",
+          [e.path for e in again], [e.path for e in first])
+
+# ── Unicode names ────────────────────────────────────────────────────────────
+print("\n=== Section 4: NFD names meet NFC rules ===")
+
+import unicodedata
+from path_filter import compile_rules
+
+with tempfile.TemporaryDirectory() as tmp:
+    nfd_dir = unicodedata.normalize('NFD', "Brontë")
+    write(os.path.join(tmp, nfd_dir, "Jane Eyre.pdf"))
+    write(os.path.join(tmp, "Austen", unicodedata.normalize('NFD', "Émma.pdf")))
+    rules = compile_rules(excluded_folders=[unicodedata.normalize('NFC', "Brontë")],
+                          excluded_files=[unicodedata.normalize('NFC', "Émma.pdf")])
+    check("NFC rules match NFD names", list(walk_files(tmp, path_filter=rules)), [])
+    check("excluded_paths compared by key",
+          relpaths(walk_files(tmp, excluded_paths=[os.path.join(
+              tmp, unicodedata.normalize('NFC', "Brontë"))]), tmp),
+          [os.path.join("Austen", unicodedata.normalize('NFD', "Émma.pdf"))])
+
+# ── Symlinks ─────────────────────────────────────────────────────────────────
+print("\n=== Section 5: links to directories are skipped ===")
+
+import stat
+
+with tempfile.TemporaryDirectory() as tmp:
+    write(os.path.join(tmp, "real", "book.pdf"))
+    write(os.path.join(tmp, "top.pdf"))
+    os.symlink(os.path.join(tmp, "real"), os.path.join(tmp, "link"))
+    os.symlink(os.path.join(tmp, "top.pdf"), os.path.join(tmp, "alias.pdf"))
+    for workers in (1, 8):
+        entries = list(walk_files(tmp, workers=workers))
+        check(f"link neither yielded nor entered (workers={workers})", relpaths(entries, tmp),
+              ["alias.pdf", os.path.join("real", "book.pdf"), "top.pdf"])
+        check_true(f"every entry is a regular file (workers={workers})",
+                   all(stat.S_ISREG(e.stat.st_mode) for e in entries))
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
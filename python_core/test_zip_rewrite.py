@@ -0,0 +1,183 @@
+"""
+test_zip_rewrite.py — Validation suite for the raw-copy ZIP member writer.
+Builds small EPUB-shaped archives in a temp directory, replaces the OPF and
+compares every other member's compressed bytes with the original's.
+Run: python3 test_zip_rewrite.py
+"""
+
+import sys
+import os
+import io
+import struct
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from zip_rewrite import replace_member
+from metadata_handler import _epub_read_metadata, _epub_write_metadata
+
+PASS = 0
+FAIL = 0
+
+def check(label, got, expected):
+    global PASS, FAIL
+    if got == expected:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        print(f"        expected: {expected!r}")
+        print(f"        got:      {got!r}")
+        FAIL += 1
+
+def check_true(label, condition):
+    global PASS, FAIL
+    if condition:
+        print(f"  PASS  {label}")
+        PASS += 1
+    else:
+        print(f"  FAIL  {label}")
+        FAIL += 1
+
+CONTAINER = ('<?xml version="1.0"?><container version="1.0" '
+             'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+             '<rootfile full-path="OEBPS/content.opf" '
+             'media-type="application/oebps-package+xml"/></rootfiles></container>')
+
+OPF = ('<?xml version="1.0" encoding="utf-8"?>'
+       '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+       '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+       '<dc:title>Old Title</dc:title><dc:creator>Ann Author</dc:creator>'
+       '</metadata></package>')
+
+def members(image):
+    """(name, data, compress_type) for a small EPUB, mimetype first."""
+    return [
+        ('mimetype', b'application/epub+zip', zipfile.ZIP_STORED),
+        ('META-INF/container.xml', CONTAINER.encode(), zipfile.ZIP_DEFLATED),
+        ('OEBPS/content.opf', OPF.encode(), zipfile.ZIP_DEFLATED),
+        ('OEBPS/chapter1.xhtml', b'<p>Call me Ishmael.</p>' * 500, zipfile.ZIP_DEFLATED),
+        ('OEBPS/images/cover.jpg', image, zipfile.ZIP_STORED),
+        ('OEBPS/images/plate.png', image[::-1], zipfile.ZIP_DEFLATED),
+    ]
+
+def make_zip(target, entries, comment=b''):
+    with zipfile.ZipFile(target, 'w') as z:
+        for name, data, method in entries:
+            z.writestr(zipfile.ZipInfo(name, (2020, 1, 2, 3, 4, 6)), data, method)
+        z.comment = comment
+
+def raw_data(path, name):
+    """A member's bytes exactly as stored in the archive (still compressed)."""
+    with zipfile.ZipFile(path) as z:
+        info = z.getinfo(name)
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        return f.read(info.compress_size)
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream, so zipfile falls back to data descriptors."""
+    def __init__(self, f):
+        self.f = f
+    def writable(self):
+        return True
+    def write(self, b):
+        return self.f.write(b)
+
+image = os.urandom(200_000)
+others = ['META-INF/container.xml', 'OEBPS/chapter1.xhtml',
+          'OEBPS/images/cover.jpg', 'OEBPS/images/plate.png']
+
+with tempfile.TemporaryDirectory() as tmp:
+    src = os.path.join(tmp, "book.epub")
+    dst = os.path.join(tmp, "out.epub")
+    new_opf = OPF.replace('Old Title', 'New Title').encode()
+
+    # ── Raw copy ─────────────────────────────────────────────────────────────
+    print("\n=== Section 1: unchanged members are copied byte-for-byte ===")
+
+    make_zip(src, members(image), comment=b'kept')
+    check("raw copy used", replace_member(src, dst, 'OEBPS/content.opf', new_opf,
+                                          first='mimetype'), True)
+    with zipfile.ZipFile(dst) as z:
+        check("archive passes its CRC checks", z.testzip(), None)
+        check("member order kept", z.namelist(),
+              [name for name, _, _ in members(image)])
+        check("mimetype stays stored", z.getinfo('mimetype').compress_type,
+              zipfile.ZIP_STORED)
+        check("OPF replaced", z.read('OEBPS/content.opf'), new_opf)
+        check("OPF deflated", z.getinfo('OEBPS/content.opf').compress_type,
+              zipfile.ZIP_DEFLATED)
+        check("archive comment kept", z.comment, b'kept')
+        check("member timestamps kept", z.getinfo('OEBPS/images/cover.jpg').date_time,
+              (2020, 1, 2, 3, 4, 6))
+    check_true("other members' compressed bytes identical",
+               all(raw_data(src, n) == raw_data(dst, n) for n in others))
+
+    # ── Unusual sources ──────────────────────────────────────────────────────
+    print("\n=== Section 2: descriptors, misplaced mimetype, fallback ===")
+
+    with open(src, 'wb') as f:
+        with zipfile.ZipFile(Unseekable(f), 'w') as z:
+            for name, data, method in members(image):
+                z.writestr(name, data, method)
+    with zipfile.ZipFile(src) as z:
+        check_true("source members use data descriptors",
+                   all(i.flag_bits & 0x08 for i in z.infolist()[1:]))
+    check("data descriptors copied raw",
+          replace_member(src, dst, 'OEBPS/content.opf', new_opf, first='mimetype'), True)
+    with zipfile.ZipFile(dst) as z:
+        check("and the archive still verifies", z.testzip(), None)
+    check_true("with identical compressed bytes",
+               all(raw_data(src, n) == raw_data(dst, n) for n in others))
+
+    entries = members(image)
+    entries = entries[1:3] + [('mimetype', entries[0][1], zipfile.ZIP_DEFLATED)] + entries[3:]
+    make_zip(src, entries)
+    replace_member(src, dst, 'OEBPS/content.opf', new_opf, first='mimetype')
+    with zipfile.ZipFile(dst) as z:
+        first = z.infolist()[0]
+        check("misplaced mimetype moved first and stored",
+              (first.filename, first.compress_type), ('mimetype', zipfile.ZIP_STORED))
+        check("its content kept", z.read('mimetype'), b'application/epub+zip')
+    check("missing member added", replace_member(src, dst, 'OEBPS/extra.css', b'p {}'), True)
+    with zipfile.ZipFile(dst) as z:
+        check("added at the end", (z.namelist()[-1], z.read('OEBPS/extra.css')),
+              ('OEBPS/extra.css', b'p {}'))
+
+    make_zip(src, members(image))
+    with open(src, 'rb') as f:
+        body = f.read()
+    with open(src, 'wb') as f:
+        f.write(b'#!stub\n' + body)   # bytes before the first member
+    check("unusual layout falls back to zipfile",
+          replace_member(src, dst, 'OEBPS/content.opf', new_opf, first='mimetype'), False)
+    with zipfile.ZipFile(dst) as z:
+        check("fallback output verifies", z.testzip(), None)
+        check("fallback keeps mimetype first",
+              (z.namelist()[0], z.infolist()[0].compress_type), ('mimetype', zipfile.ZIP_STORED))
+        check("fallback writes the new OPF", z.read('OEBPS/content.opf'), new_opf)
+
+    # ── EPUB writer ──────────────────────────────────────────────────────────
+    print("\n=== Section 3: EPUB metadata writes ===")
+
+    make_zip(src, members(image))
+    ok, msg = _epub_write_metadata(src, {'title': 'Moby-Dick', 'creator': 'Herman Melville'})
+    check("write succeeds", (ok, msg), (True, 'Metadata saved to EPUB'))
+    got = _epub_read_metadata(src)
+    check("new metadata read back", (got['title'], got['creator']),
+          ('Moby-Dick', 'Herman Melville'))
+    original = os.path.join(tmp, "original.epub")
+    make_zip(original, members(image))
+    check_true("images not recompressed",
+               all(raw_data(original, n) == raw_data(src, n) for n in others))
+    check("no temp files left", sorted(os.listdir(tmp)), ['book.epub', 'original.epub', 'out.epub'])
+
+print(f"\n{'='*50}")
+print(f"Results: {PASS} passed, {FAIL} failed")
+if FAIL:
+    sys.exit(1)
@@ -6,12 +6,16 @@ Author: Jesse Tudela
 
 import os
 import hashlib
+import mmap
 import re
 import codecs
 import sys
 import io
+import unicodedata
 from typing import TextIO, Optional
 
+from io_budget import advise_done, advise_sequential, advise_willneed, throttle
+
 def sanitize_filename(filename: str, max_length: int = 250) -> str:
     """
     Sanitizes a filename by removing extra spaces and hyphens, trimming whitespace,
@@ -52,6 +56,275 @@ def sanitize_filename(filename: str, max_length: int = 250) -> str:
     return sanitized
 
 
+def path_key(path: str) -> str:
+    """
+    Absolute path in Unicode NFC form, for indexing and comparing paths.
+    macOS and iCloud hand out NFD names ('e' + combining accent) while the
+    NAS keeps whatever was written, usually NFC, so one file can arrive
+    under two spellings. Compare and index by the key; open the real path.
+    """
+    return unicodedata.normalize('NFC', os.path.abspath(path))
+
+
+def config_value(name: str, default):
+    """
+    Read a setting from config, or return default if config is unavailable.
+    config is imported on first call, so importing a module that reads its
+    settings this way doesn't load config.json.
+    """
+    try:
+        import config as cfg
+        return getattr(cfg, name, default)
+    except Exception:
+        return default
+
+
+# Algorithms accepted by hash_file(). SHA-256 matches every existing index
+# row; BLAKE2b is usually faster on CPUs without SHA hardware extensions.
+# bench_hashing.py shows which wins on a given machine.
+HASH_ALGORITHMS = ('sha256', 'blake2b')
+
+# Extra digests hash_file_multi() can compute in the same read. MD5 is only
+# for matching Anna's Archive file IDs, never for duplicate detection.
+EXTRA_DIGESTS = ('md5',)
+
+# Default read size for hash_file(). 4 KB reads cost one Python-level
+# iteration per block; 1 MB keeps the loop count negligible.
+DEFAULT_HASH_BLOCK_SIZE = 1024 * 1024
+
+# Block size of hash_file_tree(). Part of the digest itself: changing it
+# makes every stored tree digest incomparable with new ones.
+TREE_BLOCK_SIZE = 1024 * 1024
+
+# Interior blocks re-read to confirm an appended-to file's old bytes are intact
+_TREE_SAMPLES = 4
+
+
+def hash_file(filepath: str, algorithm: str = 'sha256',
+              block_size: int = DEFAULT_HASH_BLOCK_SIZE,
+              use_mmap: bool = False) -> Optional[str]:
+    """
+    Hashes a file with a single reusable read buffer.
+
+    Reads go through readinto() on one preallocated bytearray, so no bytes
+    object is allocated per block. With use_mmap=True the file is mapped and
+    fed to the hasher in block_size slices instead (falls back to buffered
+    reads if the file can't be mapped, e.g. on some network filesystems).
+
+    Args:
+        filepath (str): The path to the file.
+        algorithm (str): One of HASH_ALGORITHMS.
+        block_size (int): Bytes per read / per hasher update.
+        use_mmap (bool): Map the file instead of reading it.
+
+    Returns:
+        Optional[str]: The hex digest of the file, or None on error.
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm!r}")
+
+    digests = hash_file_multi(filepath, (algorithm,), block_size, use_mmap)
+    return digests[algorithm] if digests else None
+
+
+def hash_file_multi(filepath: str, algorithms=('sha256', 'md5'),
+                    block_size: int = DEFAULT_HASH_BLOCK_SIZE,
+                    use_mmap: bool = False) -> Optional[dict]:
+    """
+    Computes several digests of a file in a single read: every block is
+    fed to each hasher in turn, so the file's bytes are read only once.
+    Reads are hinted as sequential, draw from the shared I/O budget
+    (io_budget.py), and the file's pages are released afterwards.
+
+    Args:
+        filepath (str): The path to the file.
+        algorithms: Names from HASH_ALGORITHMS and EXTRA_DIGESTS.
+        block_size (int): Bytes per read / per hasher update.
+        use_mmap (bool): Map the file instead of reading it (see hash_file).
+
+    Returns:
+        Optional[dict]: {algorithm: hex digest}, or None on error.
+    """
+    for algorithm in algorithms:
+        if algorithm not in HASH_ALGORITHMS and algorithm not in EXTRA_DIGESTS:
+            raise ValueError(f"Unsupported hash algorithm: {algorithm!r}")
+
+    hashers = [hashlib.new(algorithm) for algorithm in algorithms]
+    try:
+        with open(filepath, "rb", buffering=0) as f:
+            advise_sequential(f.fileno())
+            if not (use_mmap and _hash_mmap(f, hashers, block_size)):
+                buf = bytearray(block_size)
+                view = memoryview(buf)
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    throttle(n)
+                    block = view[:n]
+                    for hasher in hashers:
+                        hasher.update(block)
+            advise_done(f.fileno())
+        return {algorithm: hasher.hexdigest()
+                for algorithm, hasher in zip(algorithms, hashers)}
+    except (IOError, OSError) as e:
+        sys.stderr.write(f"*** ERROR reading file: {filepath!r} - {e!r}\n")
+        print(f"*** ERROR reading file: {filepath!r} - {e!r}\n", end="")
+        return None
+
+
+def tree_algorithm(algorithm: str) -> str:
+    """Algorithm label stored in the index for hash_file_tree() digests."""
+    return f"{algorithm}-tree"
+
+
+def hash_file_tree(filepath: str, algorithm: str = 'sha256',
+                   previous: Optional[tuple] = None,
+                   extra=()) -> Optional[dict]:
+    """
+    Hashes a file as a list of TREE_BLOCK_SIZE block digests; the file's
+    digest is the hash of that list. Not comparable with hash_file().
+
+    previous is (block_size, file_size, blocks) from an earlier call on the
+    same path. If the file has only grown since (exiftool appends PDF edits
+    as an incremental update), the old whole blocks are reused after
+    re-reading the first, last and a few interior ones to confirm they're
+    unchanged; only those samples and the new tail are read. Anything else
+    (shrunk, same size, a sample differs) is hashed in full.
+
+    A reused result ('reused' True) is provisional: an edit to an old block
+    that wasn't sampled goes unseen. It can rule a file out of a match, but
+    before storing it or acting on a match, hash the file again without
+    previous.
+
+    Args:
+        filepath (str): The path to the file.
+        algorithm (str): One of HASH_ALGORITHMS, for blocks and the root.
+        previous (tuple): Stored tree of an earlier version, or None.
+        extra: Names from EXTRA_DIGESTS to compute too — only on a full read.
+
+    Returns:
+        Optional[dict]: {'digest', 'blocks', 'block_size', 'bytes_read',
+        'reused'} plus one key per extra digest computed, or None on error.
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm!r}")
+    for name in extra:
+        if name not in EXTRA_DIGESTS:
+            raise ValueError(f"Unsupported hash algorithm: {name!r}")
+
+    buf = bytearray(TREE_BLOCK_SIZE)
+    try:
+        with open(filepath, "rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            result = None
+            if previous is not None:
+                result = _rehash_tree(f, size, algorithm, previous, buf)
+            if result is None:
+                advise_sequential(f.fileno())
+                extra_hashers = {name: hashlib.new(name) for name in extra}
+                blocks, bytes_read = _hash_blocks(f, 0, algorithm, buf,
+                                                  list(extra_hashers.values()))
+                result = {name: hasher.hexdigest()
+                          for name, hasher in extra_hashers.items()}
+                result.update(blocks=blocks, bytes_read=bytes_read, reused=False)
+            advise_done(f.fileno())
+    except (IOError, OSError) as e:
+        sys.stderr.write(f"*** ERROR reading file: {filepath!r} - {e!r}\n")
+        print(f"*** ERROR reading file: {filepath!r} - {e!r}\n", end="")
+        return None
+
+    result['digest'] = hashlib.new(algorithm, result['blocks']).hexdigest()
+    result['block_size'] = TREE_BLOCK_SIZE
+    return result
+
+
+def _read_block(f, offset: int, buf: bytearray) -> memoryview:
+    """Read up to len(buf) bytes at offset, retrying short reads until EOF."""
+    f.seek(offset)
+    view = memoryview(buf)
+    filled = 0
+    while filled < len(buf):
+        n = f.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    throttle(filled)
+    return view[:filled]
+
+
+def _hash_blocks(f, first_block: int, algorithm: str, buf: bytearray,
+                 extra_hashers=()) -> tuple:
+    """Digest every block from first_block to EOF. Returns (blocks, bytes read)."""
+    digests = []
+    bytes_read = 0
+    offset = first_block * len(buf)
+    while True:
+        block = _read_block(f, offset, buf)
+        if not block:
+            break
+        digests.append(hashlib.new(algorithm, block).digest())
+        for hasher in extra_hashers:
+            hasher.update(block)
+        bytes_read += len(block)
+        offset += len(block)
+        if len(block) < len(buf):
+            break
+    return b''.join(digests), bytes_read
+
+
+def _rehash_tree(f, size: int, algorithm: str, previous: tuple,
+                 buf: bytearray) -> Optional[dict]:
+    """hash_file_tree() for a file that grew since `previous`, or None to read it all."""
+    block_size, old_size, old_blocks = previous
+    if block_size != len(buf) or not 0 < old_size < size:
+        return None
+    width = hashlib.new(algorithm).digest_size
+    if len(old_blocks) != -(-old_size // block_size) * width:
+        return None  # Hashed with another algorithm
+
+    kept = old_size // block_size   # whole blocks that predate the growth
+    if not kept:
+        return None
+    samples = {0, kept - 1}
+    samples.update(kept * (i + 1) // (_TREE_SAMPLES + 1) for i in range(_TREE_SAMPLES))
+    # Start fetching the tail (read whatever the samples show) and the samples
+    advise_willneed(f.fileno(), kept * block_size, size - kept * block_size)
+    for i in samples:
+        advise_willneed(f.fileno(), i * block_size, block_size)
+    for i in sorted(samples):
+        block = _read_block(f, i * block_size, buf)
+        if hashlib.new(algorithm, block).digest() != old_blocks[i * width:(i + 1) * width]:
+            return None
+
+    tail, bytes_read = _hash_blocks(f, kept, algorithm, buf)
+    return {'blocks': old_blocks[:kept * width] + tail,
+            'bytes_read': bytes_read + len(samples) * block_size,
+            'reused': True}
+
+
+def _hash_mmap(f, hashers: list, block_size: int) -> bool:
+    """Feed an open file to hashers through mmap. Returns False if it can't be mapped."""
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return True  # mmap refuses empty files; nothing to hash anyway
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return False
+    with mapped:
+        view = memoryview(mapped)
+        try:
+            for offset in range(0, size, block_size):
+                with view[offset:offset + block_size] as block:
+                    throttle(len(block))
+                    for hasher in hashers:
+                        hasher.update(block)
+        finally:
+            view.release()
+    return True
+
+
 def calculate_sha256(filepath: str) -> Optional[str]:
     """
     Calculates the SHA256 hash of a file.
@@ -70,16 +343,42 @@ def calculate_sha256(filepath: str) -> Optional[str]:
         # Don't print an error here, just return None. This could be a temp file.
         return None
 
-    sha256_hash = hashlib.sha256()
+    return hash_file(filepath, 'sha256')
+
+
+def calculate_partial_sha256(filepath: str, edge_bytes: int) -> Optional[str]:
+    """
+    Calculates a SHA256 over only the first and last edge_bytes of a file.
+    A cheap pre-filter for files that share a size; two files with different
+    partial hashes can never be identical, but equal partial hashes prove nothing.
+
+    Args:
+        filepath (str): The path to the file.
+        edge_bytes (int): Number of bytes to read from each end of the file.
+
+    Returns:
+        Optional[str]: The partial SHA256 hash, or None on error.
+    """
+    partial_hash = hashlib.sha256()
     try:
         with open(filepath, "rb") as f:
-            # Read in chunks for large files
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+            size = os.fstat(f.fileno()).st_size
+            tail = max(edge_bytes, size - edge_bytes)
+            # Ask for both ends at once so the tail is in flight during the head
+            advise_willneed(f.fileno(), 0, edge_bytes)
+            if size > edge_bytes:
+                advise_willneed(f.fileno(), tail, edge_bytes)
+            head = f.read(edge_bytes)
+            throttle(len(head))
+            partial_hash.update(head)
+            if size > edge_bytes:
+                # Never re-read bytes already covered by the head block
+                f.seek(tail)
+                end = f.read(edge_bytes)
+                throttle(len(end))
+                partial_hash.update(end)
+        return partial_hash.hexdigest()
     except (IOError, OSError) as e:
-        # Print error to stderr for immediate visibility in console
-        # This will also be caught by the web_interface.py and sent to the output buffer
         sys.stderr.write(f"*** ERROR reading file: {filepath!r} - {e!r}\n")
         print(f"*** ERROR reading file: {filepath!r} - {e!r}\n", end="")
         return None
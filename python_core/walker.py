@@ -0,0 +1,208 @@
+"""
+walker.py — Data Librarian
+===========================
+One directory walker for every module that scans a folder tree (deDupe,
+organizer, file cleaner, PDF splitter).
+
+Built on os.scandir: each file is stat-ed once, while its directory is
+listed, and the stat travels with the entry, so callers never stat or
+isfile() it again. Directory listings run on a small thread pool
+(WALK_WORKERS) ahead of the consumer — on a NAS mount each listing is a
+network round trip, and several can be in flight at once. At most
+_LISTINGS_AHEAD_PER_WORKER listings per worker are done or in flight
+before the consumer reaches them, so a slow consumer doesn't make the
+walk buffer the whole tree. Entries are
+still yielded in a fixed order: depth-first, each directory's files before
+its subdirectories, everything in listing order.
+
+Exclusions are compiled into a path_filter.PathFilter and applied during
+traversal: excluded directories are pruned (never listed), and rejected
+files are never stat-ed, unless the listing is being recorded (recorded
+listings stay complete and are filtered afterwards). Names are matched in
+Unicode NFC form, so an NFD name from macOS meets the same rules; yielded
+paths keep the on-disk spelling.
+
+Optional listing cache hooks (used by deDupe's incremental scan):
+  cached_listing(dirpath, mtime) -> (files, subdirs) | None
+  record_listing(dirpath, mtime, files, subdirs)
+Both are called on the consuming thread only, so they may use SQLite.
+With cached_listing set, the pool only stats directories; a directory the
+cache can't answer is listed on the consuming thread.
+"""
+
+import os
+import threading
+import unicodedata
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from path_filter import PathFilter, compile_rules, literal_names
+from utils import config_value, path_key
+
+# One walked file. Unpacks like the (path, root, st) tuples used before.
+# stat: os.stat_result (or library_index.CachedStat), None with with_stat=False
+WalkEntry = namedtuple('WalkEntry', 'path root stat')
+
+# Directory listings submitted per worker ahead of the consumer
+_LISTINGS_AHEAD_PER_WORKER = 4
+
+
+def _scan(dirpath: str, keep, with_stat: bool) -> Optional[tuple]:
+    """
+    List dirpath once. Returns (files, subdirs) or None if unreadable.
+    keep(name) -> bool drops files before they are stat-ed; None keeps all.
+    """
+    files, subdirs = [], []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        # A link to a directory is neither entered nor
+                        # yielded, as with os.walk(followlinks=False)
+                        if not entry.is_symlink():
+                            subdirs.append(entry.name)
+                    elif keep is None or keep(entry.name):
+                        files.append((entry.name, entry.stat() if with_stat else None))
+                except OSError:
+                    continue  # Vanished or unreadable mid-listing
+    except OSError:
+        return None  # Unreadable directory — skipped, as os.walk does
+    return files, subdirs
+
+
+def _list_dir(dirpath: str, keep, with_stat: bool,
+              listing: bool) -> Optional[tuple]:
+    """Pool job: (dir mtime, files, subdirs); files is None when listing=False."""
+    try:
+        mtime = os.stat(dirpath).st_mtime
+    except OSError:
+        return None
+    if not listing:
+        return mtime, None, None
+    scanned = _scan(dirpath, keep, with_stat)
+    return None if scanned is None else (mtime, *scanned)
+
+
+def _keeper(path_filter: PathFilter, rel: str, inside: bool):
+    """keep(name) -> bool for files of the directory at rel (NFC-relative)."""
+    prefix = rel + '/' if rel else ''
+    def keep(name: str) -> bool:
+        name = unicodedata.normalize('NFC', name)
+        return path_filter.keep_file(name, prefix + name, inside)
+    return keep
+
+
+def walk_files(folder: str, excluded_dirs=(), excluded_files=(),
+               excluded_paths=(), with_stat: bool = True,
+               workers: Optional[int] = None,
+               stop_event: Optional[threading.Event] = None,
+               cached_listing=None, record_listing=None,
+               path_filter: Optional[PathFilter] = None):
+    """
+    Yield a WalkEntry for every file under folder.
+
+    excluded_dirs: directory names never entered (anywhere in the tree).
+    excluded_files: file names skipped.
+    excluded_paths: directories (any form of path, compared by path_key) never entered.
+    path_filter: compiled include/exclude rules (path_filter.py); the name
+        lists above are added to it as exact names.
+    with_stat: stat each file during listing; False yields stat=None.
+    workers: listing threads (default: WALK_WORKERS from config; 1 = inline).
+    stop_event: once set, the walk ends after the current directory.
+    cached_listing / record_listing: see the module docstring. Cached files
+        carry whatever stat the cache stored, so with_stat doesn't apply.
+    """
+    if workers is None:
+        workers = config_value('WALK_WORKERS', 8)
+    workers = max(1, int(workers))
+    if excluded_dirs or excluded_files or path_filter is None:
+        rules = path_filter.rules if path_filter is not None else None
+        path_filter = compile_rules(rules,
+                                    excluded_folders=literal_names(excluded_dirs),
+                                    excluded_files=literal_names(excluded_files))
+    excluded_paths = {path_key(p) for p in excluded_paths}
+    listing = cached_listing is None
+    # Recorded listings must stay complete; rules can change between runs
+    prefilter = record_listing is None
+    root = os.path.abspath(folder)
+
+    executor = None
+    if workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers,
+                                      thread_name_prefix='walker')
+    window = workers * _LISTINGS_AHEAD_PER_WORKER
+    ahead = 0   # listings submitted but not popped yet
+
+    def keeper(rel: str, inside: bool):
+        """keep(name) for files of the directory at rel, or None to keep all."""
+        return _keeper(path_filter, rel, inside) if prefilter else None
+
+    def top_up():
+        """Submit the listings popped next, up to `window` ahead of the consumer."""
+        nonlocal ahead
+        for item in reversed(stack):
+            if ahead >= window:
+                return
+            if item[3] is None:
+                dirpath, rel, inside, _future = item
+                item[3] = executor.submit(_list_dir, dirpath, keeper(rel, inside),
+                                          with_stat, listing)
+                ahead += 1
+
+    inside_root = not path_filter.needs_folder_match
+    try:
+        # [dirpath, rel, inside, future]; future is None until submitted
+        stack = [[root, '', inside_root, None]]
+        while stack:
+            if stop_event is not None and stop_event.is_set():
+                return
+            if executor is not None:
+                top_up()
+            dirpath, rel, inside, future = stack.pop()
+            if future is None:
+                result = _list_dir(dirpath, keeper(rel, inside), with_stat, listing)
+            else:
+                ahead -= 1
+                result = future.result()
+            if result is None:
+                continue
+            dir_mtime, files, subdirs = result
+            filtered = prefilter   # files already passed keep_file()
+
+            if files is None:
+                cached = cached_listing(dirpath, dir_mtime)
+                if cached is not None:
+                    files, subdirs = cached
+                    filtered = False
+                else:
+                    scanned = _scan(dirpath, keeper(rel, inside), with_stat)
+                    if scanned is None:
+                        continue
+                    files, subdirs = scanned
+                    if record_listing is not None:
+                        record_listing(dirpath, dir_mtime, files, subdirs)
+            elif record_listing is not None:
+                record_listing(dirpath, dir_mtime, files, subdirs)
+
+            keep = None if filtered else _keeper(path_filter, rel, inside)
+            for name, st in files:
+                if keep is None or keep(name):
+                    yield WalkEntry(os.path.join(dirpath, name), root, st)
+            # Reversed so the stack pops subdirectories in listing order;
+            # top_up() submits their listings ahead of the consumer
+            prefix = rel + '/' if rel else ''
+            for d in reversed(subdirs):
+                child = os.path.join(dirpath, d)
+                name = unicodedata.normalize('NFC', d)
+                child_rel = prefix + name
+                if excluded_paths and path_key(child) in excluded_paths:
+                    continue
+                if not path_filter.enter_folder(name, child_rel, inside):
+                    continue
+                child_inside = inside or path_filter.folder_included(name, child_rel)
+                stack.append([child, child_rel, child_inside, None])
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -23,7 +23,10 @@ sys.stderr.reconfigure(line_buffering=True)
 # Import from local modules (removed log_message from utils so we can override it)
 try:
     from config import EXCLUDED_FOLDERS, DUPLICATE_HOLDING_DIR, LOG_NAME_PREFIX, MOVE_DUPLICATES, PORT, EXCLUDED_FILES, PDF_TARGET_CHUNK_MB, PDF_PAGE_CHUNK_LIMIT
-    from utils import sanitize_filename, calculate_sha256
+    from utils import sanitize_filename, hash_file
+    from path_filter import literal_names, module_filter
+    import io_budget
+    from walker import walk_files
     from pypdf import PdfReader, PdfWriter
 except ImportError:
     print("Error: 'config.py', 'utils.py', or 'pypdf' not found. Please make sure they are in the same directory and pypdf is installed.")
@@ -99,71 +102,63 @@ def run_script(target_folder=None):
             log_message(log, "----------------------------------------------------------------------------------------------------\n\n")
 
             log_message(log, "Calculating total files...\n")
-            temp_total = 0
-            
-            for root, dirs, files in os.walk(scan_dir):
-                dirs[:] = [d for d in dirs if d not in EXCLUDED_FOLDERS]
-                current_files = [f for f in files if f not in EXCLUDED_FILES]
-                temp_total += len(current_files)
-            
-            total_files = temp_total 
+            # One listing pass; the hashing loop below reuses it
+            path_filter = module_filter('weeding',
+                                        excluded_folders=literal_names(EXCLUDED_FOLDERS),
+                                        excluded_files=literal_names(EXCLUDED_FILES))
+            scan_files = [path for path, _root, _st in walk_files(
+                scan_dir, with_stat=False, path_filter=path_filter)]
+
+            total_files = len(scan_files)
             log_message(log, f"Scanning directory: {scan_dir}\n")
             log_message(log, f"Total files to scan: {total_files}\n\n")
             
             files_processed = 0 
-            for root, dirs, files in os.walk(scan_dir):
+            for filepath in scan_files:
                 if not keep_running:
                     log_message(log, "\n*** USER CANCELLATION DETECTED ***\n")
                     break
-                    
-                dirs[:] = [d for d in dirs if d not in EXCLUDED_FOLDERS]
-
-                for filename in files:
-                    if not keep_running:
-                        break
 
-                    if filename in EXCLUDED_FILES:
+                files_checked += 1 
+                files_processed += 1 
+                
+                try:
+                    # Just listed, so no isfile() check first
+                    file_hash = hash_file(filepath)
+                    if file_hash is None:
                         continue
 
-                    filepath = os.path.join(root, filename)
-                    files_checked += 1 
-                    files_processed += 1 
-                    
-                    try:
-                        file_hash = calculate_sha256(filepath)
-                        if file_hash is None:
-                            continue
-
-                        if file_hash in file_hashes:
-                            original_filepath = file_hashes[file_hash]
-                            original_filename = os.path.basename(original_filepath)
-                            duplicate_filename = os.path.basename(filepath)
-                            sanitized_filename = sanitize_filename(duplicate_filename) 
-                            sanitized_dest_path = os.path.join(dynamic_holding_dir, sanitized_filename)
-
-                            if MOVE_DUPLICATES:
-                                log_message(
-                                    log,
-                                    f"Duplicate found & MOVED:\n  Original: [{original_filename!r}]\n  Duplicate: [{duplicate_filename!r}]\n  Moved to: [{sanitized_filename!r}]\n\n",
-                                )
-                                try:
-                                    if os.path.exists(filepath): 
-                                        shutil.move(filepath, sanitized_dest_path)
-                                        files_moved += 1
-                                    else:
-                                        log_message(log, f"*** WARNING: File vanished before move: {filepath!r}\n\n")
-                                except (OSError, IOError) as e:
-                                    log_message(log, f"*** ERROR moving file: {duplicate_filename!r} to {sanitized_dest_path!r} - {e!r}\n\n")
-                            else:
-                                log_message(
-                                    log,
-                                    f"Duplicate found (DRY RUN - NOT MOVED):\n  Original: [{original_filename!r}]\n  Duplicate: [{duplicate_filename!r}]\n  Would move as: [{sanitized_filename!r}]\n\n",
-                                )
+                    if file_hash in file_hashes:
+                        original_filepath = file_hashes[file_hash]
+                        original_filename = os.path.basename(original_filepath)
+                        duplicate_filename = os.path.basename(filepath)
+                        sanitized_filename = sanitize_filename(duplicate_filename) 
+                        sanitized_dest_path = os.path.join(dynamic_holding_dir, sanitized_filename)
+
+                        if MOVE_DUPLICATES:
+                            log_message(
+                                log,
+                                f"Duplicate found & MOVED:\n  Original: [{original_filename!r}]\n  Duplicate: [{duplicate_filename!r}]\n  Moved to: [{sanitized_filename!r}]\n\n",
+                            )
+                            try:
+                                if os.path.exists(filepath): 
+                                    shutil.move(filepath, sanitized_dest_path,
+                                                copy_function=io_budget.copy_file)
+                                    files_moved += 1
+                                else:
+                                    log_message(log, f"*** WARNING: File vanished before move: {filepath!r}\n\n")
+                            except (OSError, IOError) as e:
+                                log_message(log, f"*** ERROR moving file: {duplicate_filename!r} to {sanitized_dest_path!r} - {e!r}\n\n")
                         else:
-                            file_hashes[file_hash] = filepath
-                            
-                    except Exception as e:
-                        log_message(log, f"*** ERROR processing file [{filepath!r}]: {e!r}\n\n")
+                            log_message(
+                                log,
+                                f"Duplicate found (DRY RUN - NOT MOVED):\n  Original: [{original_filename!r}]\n  Duplicate: [{duplicate_filename!r}]\n  Would move as: [{sanitized_filename!r}]\n\n",
+                            )
+                    else:
+                        file_hashes[file_hash] = filepath
+                        
+                except Exception as e:
+                    log_message(log, f"*** ERROR processing file [{filepath!r}]: {e!r}\n\n")
 
             end_time = datetime.now()
             duration = end_time - start_time
@@ -235,6 +230,8 @@ def run_sorter_script(target_folder):
 # --- PDF LOGIC ---
 def split_pdf_adaptive(file_path, target_max_mb, initial_page_chunk, log):
     try:
+        # pypdf reads the whole source up front; chunks are budgeted as written
+        io_budget.throttle(os.path.getsize(file_path))
         reader = PdfReader(file_path)
         total_pages = len(reader.pages)
         base_name = os.path.splitext(file_path)[0]
@@ -253,7 +250,9 @@ def split_pdf_adaptive(file_path, target_max_mb, initial_page_chunk, log):
                 try:
                     with open(output_filename, "wb") as out_file: writer.write(out_file)
                     temp_files_created.append(output_filename)
-                    file_size_mb = os.path.getsize(output_filename) / (1024 * 1024)
+                    chunk_bytes = os.path.getsize(output_filename)
+                    io_budget.throttle(chunk_bytes)
+                    file_size_mb = chunk_bytes / (1024 * 1024)
                     if file_size_mb > target_max_mb:
                         log_message(log, f"   > Chunk {output_filename} is {file_size_mb:.2f}MB (Max: {target_max_mb}MB). Too big.\n")
                         os.remove(output_filename)
@@ -286,30 +285,78 @@ def run_pdf_script(target_folder, max_mb, initial_pages):
             log_to_buffer(f"*** ERROR: Folder not found: {target_folder}\n")
             return
         pdf_files_found = 0
-        for root, dirs, files in os.walk(target_folder):
+        for file_path, _root, st in walk_files(target_folder,
+                                               path_filter=module_filter('segmenting')):
             if not pdf_keep_running: break
-            for file in files:
-                if not pdf_keep_running: break
-                if file.lower().endswith('.pdf'):
-                    if "_pages_" in file and file[file.rfind("_pages_")+7:file.rfind("_pages_")+8].isdigit(): continue
-                    file_path = os.path.join(root, file)
-                    try:
-                        size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                        if size_mb > max_mb:
-                            pdf_files_found += 1
-                            log_to_buffer(f"Processing: {file} ({size_mb:.2f} MB)...\n")
-                            class LogWrapper:
-                                def write(self, msg): log_to_buffer(msg)
-                                def flush(self): pass
-                            split_pdf_adaptive(file_path, max_mb, initial_pages, LogWrapper())
-                            log_to_buffer(f"Done with {file}\n\n")
-                    except OSError as e:
-                        log_to_buffer(f"*** ERROR accessing {file}: {e}\n")
+            file = os.path.basename(file_path)
+            if file.lower().endswith('.pdf'):
+                if "_pages_" in file and file[file.rfind("_pages_")+7:file.rfind("_pages_")+8].isdigit(): continue
+                try:
+                    # Size comes from the walk's stat — no second stat per file
+                    size_mb = st.st_size / (1024 * 1024)
+                    if size_mb > max_mb:
+                        pdf_files_found += 1
+                        log_to_buffer(f"Processing: {file} ({size_mb:.2f} MB)...\n")
+                        class LogWrapper:
+                            def write(self, msg): log_to_buffer(msg)
+                            def flush(self): pass
+                        split_pdf_adaptive(file_path, max_mb, initial_pages, LogWrapper())
+                        log_to_buffer(f"Done with {file}\n\n")
+                except OSError as e:
+                    log_to_buffer(f"*** ERROR accessing {file}: {e}\n")
         duration = datetime.now() - start_time
         log_to_buffer("-" * 60 + f"\nFINISHED. Processed {pdf_files_found} large PDF(s).\nTotal Time: {duration}\n")
     except Exception as e: log_to_buffer(f"*** CRITICAL ERROR: {e}\n")
     finally: pdf_script_running = False
 
+# --- METADATA LOGIC ---
+# Paths read per /api/metadata/get_many request; the browser pages larger listings
+METADATA_BATCH_MAX = 50
+
+def metadata_records(paths):
+    """
+    Yield one MetadataPanel record (path, filename, size, modified, xmp) per
+    requested path, in request order. Paths are relative to root_directory;
+    metadata is read in batched exiftool calls (read_metadata_many), so
+    records stream out as each batch finishes. Paths past the first
+    METADATA_BATCH_MAX come back as errors without being read.
+    """
+    from metadata_handler import read_metadata_many
+
+    paths = list(paths)
+    extra = paths[METADATA_BATCH_MAX:]
+    paths = paths[:METADATA_BATCH_MAX]
+    root = os.path.abspath(root_directory)
+    readable = []
+    for rel in paths:
+        full = os.path.abspath(os.path.join(root, str(rel)))
+        if os.path.commonpath([root, full]) == root and os.path.isfile(full):
+            readable.append((rel, full))
+
+    stream = read_metadata_many(full for _rel, full in readable)
+    try:
+        by_request = iter(paths)
+        for (rel, full), (_full, xmp) in zip(readable, stream):
+            # Anything skipped above is reported in its place in the order
+            for missing in by_request:
+                if missing == rel:
+                    break
+                yield {'path': missing, 'error': 'File not found'}
+            st = os.stat(full)
+            yield {
+                'path': rel,
+                'filename': os.path.basename(full),
+                'size': st.st_size,
+                'modified': datetime.fromtimestamp(st.st_mtime).isoformat(),
+                'xmp': xmp,
+            }
+        for missing in by_request:
+            yield {'path': missing, 'error': 'File not found'}
+        for rel in extra:
+            yield {'path': rel, 'error': f'More than {METADATA_BATCH_MAX} paths in one request'}
+    finally:
+        stream.close()
+
 # --- HTTP HANDLERS ---
 class MyHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
@@ -467,9 +514,38 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
             self.wfile.write(json.dumps({'status': 'started'}).encode('utf-8'))
             return
 
+        # Metadata Post: newline-delimited JSON, one record per path as it's read
+        elif url_path == '/api/metadata/get_many':
+            content_len = int(self.headers.get('Content-Length', 0))
+            post_body = self.rfile.read(content_len)
+            try:
+                paths = json.loads(post_body).get('paths', [])
+            except (json.JSONDecodeError, AttributeError):
+                paths = []
+            self.send_response(200)
+            self.send_header('Content-type', 'application/x-ndjson; charset=utf-8')
+            self.end_headers()
+            records = metadata_records(paths)
+            try:
+                for record in records:
+                    self.wfile.write((json.dumps(record) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the browser navigated away; stop reading
+            except ImportError as e:
+                self.wfile.write((json.dumps({'error': f'metadata_handler not available: {e}'}) + '\n').encode('utf-8'))
+            except OSError as e:
+                print(f"*** ERROR streaming metadata: {e}")
+            finally:
+                records.close()
+            return
+
 def start_server(port=PORT):
     try:
-        httpd = socketserver.TCPServer(("", port), MyHandler)
+        # A thread per request: a long metadata stream mustn't hold up
+        # file opens, catalog loads or status polls
+        httpd = socketserver.ThreadingTCPServer(("", port), MyHandler)
+        httpd.daemon_threads = True
         print(f"Serving at http://localhost:{port}")
         httpd.serve_forever()
     except OSError as e:
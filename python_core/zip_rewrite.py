@@ -0,0 +1,224 @@
+"""
+zip_rewrite.py — Data Librarian
+================================
+Replace one member of a ZIP archive (an EPUB's OPF) without touching the
+rest: every other member's local header, compressed bytes and data
+descriptor are copied byte-for-byte into the new archive, and its central
+directory record is reused with only the offset changed. Nothing is
+decompressed or recompressed, and memory use is one copy buffer plus the
+central directory, whatever the size of the archive.
+
+  replace_member(src_path, dst_path, name, data, first=None) -> bool
+
+first names a member that must open the archive uncompressed (an EPUB's
+'mimetype'); it is moved to the front, and stored afresh if it was
+compressed.
+
+Archives the raw copier doesn't handle (ZIP64, split archives, bytes
+before the first member, a directory that disagrees with the members) are
+rewritten through zipfile instead, one member at a time in a stream:
+slower, since every member is recompressed, but still in bounded memory.
+"""
+
+import os
+import shutil
+import struct
+import time
+import zipfile
+import zlib
+
+_LOCAL   = struct.Struct('<IHHHHHIIIHH')          # local file header
+_CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')    # central directory record
+_END     = struct.Struct('<IHHHHIIH')             # end of central directory
+
+_LOCAL_SIG      = 0x04034b50
+_CENTRAL_SIG    = 0x02014b50
+_END_SIG        = 0x06054b50
+_DESCRIPTOR_SIG = 0x08074b50
+
+# Central directory record fields used below (indexes into _CENTRAL)
+_FLAGS, _METHOD, _COMP_SIZE, _SIZE, _OFFSET = 3, 4, 8, 9, 16
+
+_DESCRIPTOR_FLAG = 0x08    # sizes and CRC follow the data
+_UTF8_FLAG       = 0x800   # name is UTF-8 rather than cp437
+_ZIP64_LIMIT     = 0xFFFFFFFF
+_COPY_CHUNK      = 1024 * 1024
+
+
+class UnsupportedZip(Exception):
+    """The archive needs something the raw copier doesn't implement."""
+
+
+def _read_directory(f):
+    """
+    Return (records, comment) for the archive open in f. Each record is
+    [fields, raw name, extra, comment] from the central directory.
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    tail_len = min(size, _END.size + 0xFFFF)
+    f.seek(size - tail_len)
+    tail = f.read(tail_len)
+    at = tail.rfind(struct.pack('<I', _END_SIG))
+    if at < 0 or at + _END.size > len(tail):
+        raise UnsupportedZip('no end of central directory record')
+    _sig, disk, cd_disk, count_here, count, cd_size, cd_offset, comment_len = \
+        _END.unpack_from(tail, at)
+    if disk or cd_disk or count_here != count:
+        raise UnsupportedZip('split archive')
+    # ZIP64 archives put a locator between the directory and this record
+    if cd_offset + cd_size != size - tail_len + at:
+        raise UnsupportedZip('ZIP64 archive, or bytes around the members')
+    comment = tail[at + _END.size:at + _END.size + comment_len]
+
+    f.seek(cd_offset)
+    directory = f.read(cd_size)
+    records, pos = [], 0
+    for _ in range(count):
+        if pos + _CENTRAL.size > len(directory):
+            raise UnsupportedZip('truncated central directory')
+        fields = list(_CENTRAL.unpack_from(directory, pos))
+        if fields[0] != _CENTRAL_SIG:
+            raise UnsupportedZip('corrupt central directory')
+        start = pos + _CENTRAL.size
+        name_end = start + fields[10]
+        extra_end = name_end + fields[11]
+        pos = extra_end + fields[12]
+        records.append([fields, directory[start:name_end],
+                        directory[name_end:extra_end], directory[extra_end:pos]])
+    return records, comment
+
+
+def _decode_name(fields, raw):
+    """Member name as zipfile reports it."""
+    return raw.decode('utf-8' if fields[_FLAGS] & _UTF8_FLAG else 'cp437')
+
+
+def _copy_bytes(src, out, length):
+    while length > 0:
+        chunk = src.read(min(_COPY_CHUNK, length))
+        if not chunk:
+            raise UnsupportedZip('member runs past the end of the file')
+        out.write(chunk)
+        length -= len(chunk)
+
+
+def _copy_member(src, out, fields):
+    """Copy one member's local header, data and descriptor as they are; return the new offset."""
+    offset = fields[_OFFSET]
+    src.seek(offset)
+    header = src.read(_LOCAL.size)
+    if len(header) < _LOCAL.size or _LOCAL.unpack(header)[0] != _LOCAL_SIG:
+        raise UnsupportedZip('member header not where the directory says')
+    local = _LOCAL.unpack(header)
+    length = _LOCAL.size + local[9] + local[10] + fields[_COMP_SIZE]
+    if fields[_FLAGS] & _DESCRIPTOR_FLAG:
+        src.seek(offset + length)
+        length += 16 if src.read(4) == struct.pack('<I', _DESCRIPTOR_SIG) else 12
+    src.seek(offset)
+    new_offset = out.tell()
+    _copy_bytes(src, out, length)
+    return new_offset
+
+
+def _write_member(out, template, raw_name, data, compress):
+    """
+    Write data as a new member named raw_name, keeping template's
+    attributes (version made by, permissions, comment) when there is one.
+    Returns its central directory record.
+    """
+    if compress:
+        packer = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        payload = packer.compress(data) + packer.flush()
+        method, needed = zipfile.ZIP_DEFLATED, 20
+    else:
+        payload, method, needed = data, zipfile.ZIP_STORED, 10
+    t = time.localtime()
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    dos_date = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    if template is not None:
+        made_by, flags = template[0][1], template[0][_FLAGS] & _UTF8_FLAG
+        internal, external, comment = template[0][14], template[0][15], template[3]
+    else:
+        made_by, flags, internal, external, comment = (3 << 8) | 20, 0, 0, 0o644 << 16, b''
+        if not raw_name.isascii():
+            flags = _UTF8_FLAG
+    crc = zlib.crc32(data)
+    offset = out.tell()
+    out.write(_LOCAL.pack(_LOCAL_SIG, needed, flags, method, dos_time, dos_date,
+                          crc, len(payload), len(data), len(raw_name), 0))
+    out.write(raw_name)
+    out.write(payload)
+    fields = [_CENTRAL_SIG, made_by, needed, flags, method, dos_time, dos_date,
+              crc, len(payload), len(data), len(raw_name), 0, len(comment),
+              0, internal, external, offset]
+    return [fields, raw_name, b'', comment]
+
+
+def _replace_raw(src_path, dst_path, name, data, first):
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as out:
+        records, comment = _read_directory(src)
+        named = [(_decode_name(r[0], r[1]), r) for r in records]
+        # The `first` member moves to the front; everything else keeps its place
+        named.sort(key=lambda item: item[0] != first)
+
+        written, replaced = [], False
+        for member, record in named:
+            fields, raw_name, extra, member_comment = record
+            if member == name:
+                if not replaced:
+                    written.append(_write_member(out, record, raw_name, data, True))
+                    replaced = True
+                continue
+            if member == first and fields[_METHOD] != zipfile.ZIP_STORED:
+                with zipfile.ZipFile(src_path) as z:
+                    content = z.read(member)
+                written.append(_write_member(out, record, raw_name, content, False))
+                continue
+            if _ZIP64_LIMIT in (fields[_COMP_SIZE], fields[_SIZE], fields[_OFFSET]):
+                raise UnsupportedZip('ZIP64 member')
+            fields = list(fields)
+            fields[_OFFSET] = _copy_member(src, out, fields)
+            written.append([fields, raw_name, extra, member_comment])
+        if not replaced:
+            written.append(_write_member(out, None, name.encode('utf-8'), data, True))
+
+        cd_offset = out.tell()
+        for fields, raw_name, extra, member_comment in written:
+            out.write(_CENTRAL.pack(*fields))
+            out.write(raw_name + extra + member_comment)
+        cd_size = out.tell() - cd_offset
+        if cd_offset + cd_size > _ZIP64_LIMIT or len(written) >= 0xFFFF:
+            raise UnsupportedZip('rewritten archive needs ZIP64')
+        out.write(_END.pack(_END_SIG, 0, 0, len(written), len(written),
+                            cd_size, cd_offset, len(comment)))
+        out.write(comment)
+
+
+def _replace_recompress(src_path, dst_path, name, data, first):
+    """zipfile-based fallback: each member decompressed and recompressed in a stream."""
+    with zipfile.ZipFile(src_path) as zin, zipfile.ZipFile(dst_path, 'w') as zout:
+        if first is not None and first in zin.NameToInfo:
+            zout.writestr(zipfile.ZipInfo(first), zin.read(first), zipfile.ZIP_STORED)
+        for info in zin.infolist():
+            if info.filename in (name, first):
+                continue
+            with zin.open(info) as fin, zout.open(info, 'w') as fout:
+                shutil.copyfileobj(fin, fout, _COPY_CHUNK)
+        zout.writestr(name, data, zipfile.ZIP_DEFLATED)
+
+
+def replace_member(src_path: str, dst_path: str, name: str, data: bytes,
+                   first: str = None) -> bool:
+    """
+    Write to dst_path a copy of the ZIP at src_path in which member `name`
+    holds data (deflated; added at the end if it wasn't there). Returns
+    True if the other members were copied raw, False if the archive needed
+    the recompressing fallback.
+    """
+    try:
+        _replace_raw(src_path, dst_path, name, data, first)
+        return True
+    except UnsupportedZip:
+        _replace_recompress(src_path, dst_path, name, data, first)
+        return False